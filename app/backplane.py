@@ -0,0 +1,278 @@
+import os
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlparse
+
+import anyio
+from anyio.abc import ByteStream
+from anyio.streams.buffered import BufferedByteReceiveStream
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+
+from app.metrics import register_metrics
+
+# redis://host:port of the server nodes share events through, unset keeps everything in process
+BACKPLANE_URL = os.getenv("BACKPLANE_URL", "")
+# Messages a subscriber may have waiting before it is cut off
+SUBSCRIPTION_BUFFER = 1024
+MAX_LINE = 65536
+# Seconds a subscriber waits for the server to confirm before the backplane counts as unavailable
+SUBSCRIBE_TIMEOUT = 5.0
+# Reconnect attempts back off from the first delay up to the second
+RECONNECT_MIN_DELAY = 0.1
+RECONNECT_MAX_DELAY = 5.0
+# What a dropped or refused connection to the server surfaces as
+CONNECTION_ERRORS = (OSError, anyio.EndOfStream, anyio.IncompleteRead, anyio.BrokenResourceError, anyio.ClosedResourceError)
+
+class BackplaneUnavailable(Exception):
+    pass
+
+class Subscription():
+    """
+    Messages published on a channel after subscribing, in order. Ends once closed or if the subscriber falls too far behind.
+    """
+    def __init__(self, backplane: "Backplane", channel: str):
+        self.backplane = backplane
+        self.channel = channel
+        self.send_stream: MemoryObjectSendStream[bytes]
+        self.receive_stream: MemoryObjectReceiveStream[bytes]
+        self.send_stream, self.receive_stream = anyio.create_memory_object_stream(SUBSCRIPTION_BUFFER)
+
+    async def receive(self) -> bytes:
+        return await self.receive_stream.receive()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        try:
+            return await self.receive()
+        except anyio.EndOfStream:
+            raise StopAsyncIteration
+
+    async def aclose(self):
+        await self.backplane.unsubscribe(self)
+        self.send_stream.close()
+        self.receive_stream.close()
+
+    async def __aenter__(self) -> "Subscription":
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+class Backplane():
+    """
+    Publish and subscribe on named channels. This one delivers within the process, RedisBackplane across nodes.
+    """
+    def __init__(self):
+        self.subscriptions: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflowed = 0
+
+    async def publish(self, channel: str, message: bytes):
+        self.published += 1
+        self.deliver(channel, message)
+
+    async def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel)
+        self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> bool:
+        """
+        Returns True if that was the channel's last subscriber.
+        """
+        subscribers = self.subscriptions.get(subscription.channel)
+        if subscribers is None or subscription not in subscribers:
+            return False
+        subscribers.remove(subscription)
+        if len(subscribers) == 0:
+            del self.subscriptions[subscription.channel]
+            return True
+        return False
+
+    def deliver(self, channel: str, message: bytes):
+        for subscription in list(self.subscriptions.get(channel, ())):
+            try:
+                subscription.send_stream.send_nowait(message)
+                self.delivered += 1
+            except anyio.WouldBlock:
+                # Never let one slow subscriber hold up the others, it sees its stream end instead
+                self.overflowed += 1
+                self.subscriptions[channel].discard(subscription)
+                subscription.send_stream.close()
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                self.subscriptions[channel].discard(subscription)
+
+    async def run(self):
+        """
+        Runs until cancelled. Networked backplanes read from the server here.
+        """
+        await anyio.sleep_forever()
+
+    def snapshot(self) -> dict:
+        return {
+            "channels": len(self.subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflowed": self.overflowed,
+        }
+
+def encode_command(*args: bytes) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+async def read_reply(reader: BufferedByteReceiveStream) -> Any:
+    line = await reader.receive_until(b"\r\n", MAX_LINE)
+    kind, rest = line[:1], line[1:]
+    if kind == b"+":
+        return rest
+    if kind == b"-":
+        raise RuntimeError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = await reader.receive_exactly(length + 2)
+        return data[:-2]
+    if kind == b"*":
+        length = int(rest)
+        if length == -1:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RuntimeError(f"Unexpected reply {line!r}")
+
+class RedisBackplane(Backplane):
+    """
+    Backplane on any server speaking the Redis protocol. Publishing uses one connection,
+    and a second one in subscribe mode feeds every local subscriber from run.
+    Either connection is opened again after it drops, publish and subscribe raise BackplaneUnavailable meanwhile.
+    """
+    def __init__(self, url: str, subscribe_timeout: float = SUBSCRIBE_TIMEOUT):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.subscribe_timeout = subscribe_timeout
+        self.command_stream: Optional[ByteStream] = None
+        self.command_reader: Optional[BufferedByteReceiveStream] = None
+        self.command_lock = anyio.Lock()
+        self.subscriber_stream: Optional[ByteStream] = None
+        self.subscriber_lock = anyio.Lock()
+        # One per channel with subscribers, set once the server confirms the SUBSCRIBE on the current connection.
+        # Messages published before that would be missed
+        self.confirmations: Dict[str, anyio.Event] = {}
+        self.reconnects = 0
+
+    async def publish(self, channel: str, message: bytes):
+        async with self.command_lock:
+            try:
+                if self.command_stream is None:
+                    self.command_stream = await anyio.connect_tcp(self.host, self.port)
+                    self.command_reader = BufferedByteReceiveStream(self.command_stream)
+                await self.command_stream.send(encode_command(b"PUBLISH", channel.encode(), message))
+                await read_reply(self.command_reader)
+            except CONNECTION_ERRORS as e:
+                # The next publish connects again
+                if self.command_stream is not None:
+                    await self.command_stream.aclose()
+                self.command_stream = None
+                self.command_reader = None
+                raise BackplaneUnavailable(f"Publishing to {channel} failed: {str(e)}") from e
+        self.published += 1
+
+    async def send_subscriber(self, *command: bytes):
+        async with self.subscriber_lock:
+            if self.subscriber_stream is None:
+                return
+            try:
+                await self.subscriber_stream.send(encode_command(*command))
+            except CONNECTION_ERRORS:
+                # run sees the connection drop and subscribes to every channel again on the next one
+                pass
+
+    async def subscribe(self, channel: str) -> Subscription:
+        subscription = await super().subscribe(channel)
+        confirmed = self.confirmations.get(channel)
+        if confirmed is None:
+            confirmed = self.confirmations[channel] = anyio.Event()
+            # While disconnected run sends it once it connects
+            await self.send_subscriber(b"SUBSCRIBE", channel.encode())
+        # Concurrent subscribers to a new channel all wait for the one confirmation
+        with anyio.move_on_after(self.subscribe_timeout):
+            await confirmed.wait()
+        if not confirmed.is_set():
+            await subscription.aclose()
+            raise BackplaneUnavailable(f"Subscribing to {channel} was not confirmed")
+        return subscription
+
+    async def unsubscribe(self, subscription: Subscription) -> bool:
+        last = await super().unsubscribe(subscription)
+        if last:
+            self.confirmations.pop(subscription.channel, None)
+            await self.send_subscriber(b"UNSUBSCRIBE", subscription.channel.encode())
+        return last
+
+    async def listen(self, stream: ByteStream):
+        reader = BufferedByteReceiveStream(stream)
+        async with self.subscriber_lock:
+            self.subscriber_stream = stream
+            channels = [channel.encode() for channel in self.confirmations]
+            if len(channels) > 0:
+                await stream.send(encode_command(b"SUBSCRIBE", *channels))
+        while True:
+            reply = await read_reply(reader)
+            kind, channel = reply[0], reply[1].decode()
+            if kind == b"message":
+                self.deliver(channel, reply[2])
+            elif kind == b"subscribe":
+                confirmed = self.confirmations.get(channel)
+                if confirmed is not None:
+                    confirmed.set()
+
+    async def run(self):
+        """
+        Feeds local subscribers from the server until cancelled. Dropped or refused connections are retried with backoff,
+        every channel with subscribers is subscribed again on the new connection.
+        """
+        delay = RECONNECT_MIN_DELAY
+        while True:
+            try:
+                stream = await anyio.connect_tcp(self.host, self.port)
+            except OSError as e:
+                print(f"Connecting to the backplane failed, retrying in {delay:.1f}s: {str(e)}")
+                await anyio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+
+            delay = RECONNECT_MIN_DELAY
+            try:
+                await self.listen(stream)
+            except CONNECTION_ERRORS as e:
+                print(f"Lost the backplane connection: {str(e)}")
+            finally:
+                with anyio.CancelScope(shield=True):
+                    async with self.subscriber_lock:
+                        self.subscriber_stream = None
+                        # Subscribers arriving until the next connection confirms them have to wait for it
+                        for channel, confirmed in self.confirmations.items():
+                            if confirmed.is_set():
+                                self.confirmations[channel] = anyio.Event()
+                    await stream.aclose()
+            self.reconnects += 1
+            await anyio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "reconnects": self.reconnects}
+
+def create_backplane(url: str = BACKPLANE_URL) -> Backplane:
+    if url:
+        return RedisBackplane(url)
+    return Backplane()
+
+backplane = create_backplane()
+register_metrics("backplane", backplane.snapshot)
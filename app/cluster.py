@@ -0,0 +1,72 @@
+"""
+Runs the app as one worker process per shard.
+
+    python -m app.cluster --workers 4 --port 8000
+
+Every worker accepts public connections on the shared port and listens on its own unix socket,
+which the other workers use to forward requests for codes it owns.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+from typing import List
+
+def serve_shard(shard_id:int, shard_count:int, socket_dir:str, listener: socket.socket):
+    # Settings are read on import, so they have to be in place before the app is loaded
+    os.environ["SHARD_ID"] = str(shard_id)
+    os.environ["SHARD_COUNT"] = str(shard_count)
+    os.environ["SHARD_SOCKET_DIR"] = socket_dir
+
+    import uvicorn
+    from app.main import app
+    from app.sharding import socket_path
+
+    path = socket_path(shard_id, socket_dir)
+    if os.path.exists(path):
+        os.remove(path)
+    local = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    local.bind(path)
+
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="on"))
+    server.run(sockets=[listener, local])
+
+def start_workers(shard_count:int, host:str, port:int, socket_dir:str) -> List[multiprocessing.Process]:
+    # Migrates once up front, so workers starting together find the schema ready
+    from app.db.db import engine
+    from app.db.migrations import migrate
+    migrate(engine, report=print)
+
+    os.makedirs(socket_dir, exist_ok=True)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.set_inheritable(True)
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=serve_shard, args=(shard_id, shard_count, socket_dir, listener)) for shard_id in range(shard_count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one sharded worker per process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--socket-dir", default=os.getenv("SHARD_SOCKET_DIR", "/tmp/ttt_shards"))
+    args = parser.parse_args()
+
+    workers = start_workers(args.workers, args.host, args.port, args.socket_dir)
+    signal.signal(signal.SIGTERM, lambda *_: [worker.terminate() for worker in workers])
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
-from sqlalchemy import create_engine
+from typing import AsyncIterator, Optional, Tuple, Union
+from sqlalchemy import URL, Engine, Index, create_engine, event, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.orm import DeclarativeBase, sessionmaker, Mapped, mapped_column
 from datetime import datetime
 from sqlalchemy.sql import func
+
+from app.settings import Settings, settings
  
 class Base(DeclarativeBase):
     pass
 
+DEFAULT_RATING = 1200.0
+
 class User(Base):
     __tablename__= "user"
 
@@ -13,19 +20,81 @@ class User(Base):
     created_at: Mapped[datetime] = mapped_column(server_default=func.now())
     username: Mapped[str] = mapped_column()
     password: Mapped[str] = mapped_column()
+    rating: Mapped[float] = mapped_column(default=DEFAULT_RATING, server_default=str(DEFAULT_RATING))
+    games_played: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    __table_args__ = (
+        # Leaderboard pages walk this index from the top instead of sorting the table
+        Index("ix_user_rating", rating.desc(), id.desc()),
+        # Logins look users up through it, and two signups can't claim the same name in different case
+        Index("ix_user_username", func.lower(username), unique=True),
+    )
+
+class GameRecord(Base):
+    __tablename__= "games"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    code: Mapped[str] = mapped_column()
+    x_user_id: Mapped[str] = mapped_column()
+    o_user_id: Mapped[str] = mapped_column()
+    # Null on ties
+    winner_id: Mapped[Optional[str]] = mapped_column()
+    total_turns: Mapped[int] = mapped_column()
+    started_at: Mapped[Optional[datetime]] = mapped_column()
+    ended_at: Mapped[datetime] = mapped_column()
+    # Whether the result moved ratings, only games between players who proved who they are do
+    rated: Mapped[bool] = mapped_column(default=False, server_default="0")
+
+def sync_url(url: Union[str, URL]) -> URL:
+    # sqlite+aiosqlite becomes sqlite, postgresql+asyncpg becomes postgresql and so on
+    url = make_url(url)
+    return url.set(drivername=url.get_backend_name())
+
+def is_memory_database(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def engine_options(url: URL, config: Settings) -> dict:
+    # In memory sqlite gets a single shared connection from SQLAlchemy, pool sizing does not apply to it
+    if is_memory_database(url):
+        return {}
+    return {"pool_size": config.db_pool_size, "max_overflow": config.db_max_overflow, "pool_timeout": config.db_pool_timeout}
+
+def apply_sqlite_pragmas(bind: Engine, config: Settings = settings):
+    """
+    Tunes every new sqlite connection of the engine. Other databases are left alone.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(bind, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={config.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA cache_size={int(config.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config.sqlite_busy_timeout)}")
+        cursor.close()
 
-DATABASE_URL = "sqlite:///tictactoe.db"
-engine = create_engine(
-    DATABASE_URL,
-)
+def create_engines(config: Settings = settings, **options) -> Tuple[AsyncEngine, Engine]:
+    """
+    The async engine serves requests, the sync one the worker threads and schema changes. Both point at config.database_url.
+    """
+    url = make_url(config.database_url)
+    pool_options = engine_options(url, config)
+    # aiosqlite defaults to no pooling at all, the pool classes are named so the sizing applies to every driver
+    async_pool = {"poolclass": AsyncAdaptedQueuePool, **pool_options} if pool_options else {}
+    sync_pool = {"poolclass": QueuePool, **pool_options} if pool_options else {}
+    async_engine = create_async_engine(url, **{**async_pool, **options})
+    engine = create_engine(sync_url(url), **{**sync_pool, **options})
+    apply_sqlite_pragmas(async_engine.sync_engine, config)
+    apply_sqlite_pragmas(engine, config)
+    return async_engine, engine
 
-Base.metadata.create_all(bind=engine)
+async_engine, engine = create_engines()
 
 SessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,107 @@
+from typing import Callable, List, Optional
+
+from sqlalchemy import Column, Connection, Engine, Integer, MetaData, Table, func, insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app.db.db import Base, User
+
+# Kept apart from Base so create_all and drop_all never touch it
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version",
+    schema_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+class Migration():
+    # apply may return a line worth telling whoever runs the migration about
+    def __init__(self, version: int, name: str, apply: Callable[[Connection], Optional[str]]):
+        self.version = version
+        self.name = name
+        self.apply = apply
+
+def create_index(connection: Connection, name: str):
+    # Expression indexes can't be reflected, so the database is left to check whether it exists
+    index = next(index for index in User.__table__.indexes if index.name == name)
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+def create_tables(connection: Connection):
+    # Databases older than the migrations already have their tables, this only fills in missing ones
+    Base.metadata.create_all(connection)
+
+def add_rating_columns(connection: Connection):
+    existing = {column["name"] for column in inspect(connection).get_columns("user")}
+    if "rating" not in existing:
+        connection.execute(text(f'ALTER TABLE "user" ADD COLUMN rating FLOAT NOT NULL DEFAULT {User.__table__.c.rating.server_default.arg}'))
+    if "games_played" not in existing:
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN games_played INTEGER NOT NULL DEFAULT 0'))
+    create_index(connection, "ix_user_rating")
+
+def unique_usernames(connection: Connection) -> Optional[str]:
+    """
+    Usernames become unique regardless of case. Earlier duplicates keep working under their name with their id appended,
+    the oldest account keeps the name as it is.
+    """
+    lowered = func.lower(User.username)
+    first_ids = select(func.min(User.id)).group_by(lowered)
+    duplicates = connection.execute(select(User.id, User.username).where(User.id.not_in(first_ids))).all()
+    for user_id, username in duplicates:
+        renamed = f"{username}_{user_id}"
+        while connection.execute(select(User.id).where(lowered == func.lower(renamed))).first() is not None:
+            renamed = f"{renamed}_{user_id}"
+        connection.execute(update(User).where(User.id == user_id).values(username=renamed))
+    create_index(connection, "ix_user_username")
+    if len(duplicates) > 0:
+        return f"Renamed {len(duplicates)} duplicate usernames"
+    return None
+
+def add_rated_column(connection: Connection):
+    existing = {column["name"] for column in inspect(connection).get_columns("games")}
+    if "rated" not in existing:
+        connection.execute(text("ALTER TABLE games ADD COLUMN rated BOOLEAN NOT NULL DEFAULT 0"))
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create_tables", create_tables),
+    Migration(2, "add_rating_columns", add_rating_columns),
+    Migration(3, "unique_usernames", unique_usernames),
+    Migration(4, "add_rated_column", add_rated_column),
+]
+
+def current_version(bind: Engine) -> int:
+    with bind.connect() as connection:
+        if not inspect(connection).has_table(schema_version.name):
+            return 0
+        return connection.execute(select(schema_version.c.version)).scalar() or 0
+
+def migrate(bind: Engine, migrations: List[Migration] = MIGRATIONS, report: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Brings the database up to the latest migration in place and returns the names of the ones applied.
+    Whatever a migration has to say goes to report once its transaction is committed.
+    Each migration runs in its own transaction together with the version bump, so a failed one is retried on the next start.
+    Processes starting together are safe, the first one migrates while the rest wait on its lock.
+    """
+    with bind.begin() as connection:
+        connection.execute(CreateTable(schema_version, if_not_exists=True))
+    try:
+        with bind.begin() as connection:
+            if connection.execute(select(schema_version.c.version)).first() is None:
+                connection.execute(insert(schema_version).values(id=1, version=0))
+    except IntegrityError:
+        # Another process inserted the row first
+        pass
+
+    applied = []
+    for migration in sorted(migrations, key=lambda migration: migration.version):
+        with bind.begin() as connection:
+            # Writing the version row first takes the write lock before anything is read
+            connection.execute(update(schema_version).values(version=schema_version.c.version))
+            if connection.execute(select(schema_version.c.version)).scalar_one() >= migration.version:
+                continue
+            note = migration.apply(connection)
+            connection.execute(update(schema_version).values(version=migration.version))
+        applied.append(migration.name)
+        if note is not None and report is not None:
+            report(f"Migration {migration.name}: {note}")
+    return applied
@@ -1,5 +1,7 @@
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.db import User
 
@@ -7,20 +9,62 @@ class CreateUserRequest(BaseModel):
     username: str
     password: str
 
-def create_user(user_req:CreateUserRequest,db:Session):
-    db_user = User(**user_req.model_dump())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-
-    user_dict = db_user.__dict__
-    del user_dict['password']
-    del user_dict['created_at']
-    return user_dict
-
-def get_user_by_username(user_name:str, db:Session):
-    db_user = db.query(User).filter(User.username == user_name).first()
-    if db_user is None:
-        return None
-    else:
-        return db_user.__dict__
\ No newline at end of file
+class UserRow(NamedTuple):
+    id: int
+    username: str
+    rating: float
+    games_played: int
+
+class UserCredentials(NamedTuple):
+    id: int
+    username: str
+    password: str
+
+# Statements go against the table rather than the mapped class, so nothing passes through the ORM
+user_table = User.__table__
+USER_COLUMNS = (user_table.c.id, user_table.c.username, user_table.c.rating, user_table.c.games_played)
+CREDENTIAL_COLUMNS = (user_table.c.id, user_table.c.username, user_table.c.password)
+
+async def create_user(user_req:CreateUserRequest,db:AsyncSession) -> UserRow:
+    # The generated id and defaults come back with the insert, no second query for them
+    result = await db.execute(insert(user_table).values(username=user_req.username, password=user_req.password).returning(*USER_COLUMNS))
+    user = UserRow(*result.one())
+    await db.commit()
+    return user
+
+async def create_users(user_reqs:Iterable[CreateUserRequest], db:AsyncSession) -> List[UserRow]:
+    """
+    Inserts every user in one statement and one transaction, for imports. A taken username fails the whole batch.
+    """
+    rows = [{"username": user_req.username, "password": user_req.password} for user_req in user_reqs]
+    if len(rows) == 0:
+        return []
+    result = await db.execute(insert(user_table).returning(*USER_COLUMNS, sort_by_parameter_order=True), rows)
+    users = [UserRow(*row) for row in result.all()]
+    await db.commit()
+    return users
+
+async def get_user_by_username(user_name:str, db:AsyncSession) -> Optional[UserCredentials]:
+    # Matches the expression of the unique username index, so this is an index lookup
+    result = await db.execute(select(*CREDENTIAL_COLUMNS).where(func.lower(user_table.c.username) == func.lower(user_name)).limit(1))
+    row = result.first()
+    return UserCredentials(*row) if row is not None else None
+
+async def get_users_by_usernames(user_names:Iterable[str], db:AsyncSession) -> Dict[str, UserCredentials]:
+    """
+    The users with any of the names, keyed by their name as stored.
+    """
+    lowered = [func.lower(user_name) for user_name in user_names]
+    if len(lowered) == 0:
+        return {}
+    result = await db.execute(select(*CREDENTIAL_COLUMNS).where(func.lower(user_table.c.username).in_(lowered)))
+    return {row.username: UserCredentials(*row) for row in result.all()}
+
+async def get_leaderboard(limit:int, db:AsyncSession, after:Optional[Tuple[float, int]] = None):
+    """
+    The top rated users after the (rating, id) of the last row of the previous page, read straight off the rating index.
+    """
+    query = select(User.id, User.username, User.rating, User.games_played).order_by(User.rating.desc(), User.id.desc())
+    if after is not None:
+        query = query.where(tuple_(User.rating, User.id) < tuple_(*after))
+    return (await db.execute(query.limit(limit))).all()
@@ -0,0 +1,101 @@
+import time
+from typing import Callable, List, Optional, Tuple
+
+import anyio
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.db.db import GameRecord, SessionLocal
+from app.metrics import LatencyStats, register_metrics
+from app.ratings import Ratings, ratings
+
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 500
+MAX_PENDING = 100_000
+
+class ResultWriter():
+    """
+    Write behind queue for game results. enqueue never touches the database,
+    run flushes batches with a single bulk insert from a worker thread.
+    With ratings, every result updates them as it is queued and the changed ratings go out in the same transaction.
+    """
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE, max_pending: int = MAX_PENDING, ratings: Optional[Ratings] = None):
+        self.session_factory = session_factory
+        self.ratings = ratings
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_pending = max_pending
+        self.pending: List[dict] = []
+        self.lock = anyio.Lock()
+        self.wakeup: Optional[anyio.Event] = None
+        self.flush_latency = LatencyStats()
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def enqueue(self, row: dict):
+        if self.ratings is not None:
+            self.ratings.record(row)
+        # With the database down for long enough, shed results rather than memory
+        if len(self.pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self.pending.append(row)
+        if len(self.pending) >= self.flush_size and self.wakeup is not None:
+            self.wakeup.set()
+
+    def write(self, rows: List[dict], rating_rows: List[dict]) -> List[Tuple[int, float, int]]:
+        written = []
+        with self.session_factory() as session:
+            if len(rows) > 0:
+                session.execute(insert(GameRecord), rows)
+            if self.ratings is not None:
+                written = self.ratings.write(session, rating_rows)
+            session.commit()
+        return written
+
+    async def flush(self):
+        async with self.lock:
+            rating_rows = self.ratings.take_dirty() if self.ratings is not None else []
+            if len(self.pending) == 0 and len(rating_rows) == 0:
+                return
+            rows = self.pending
+            self.pending = []
+            started = time.perf_counter()
+            try:
+                written = await anyio.to_thread.run_sync(self.write, rows, rating_rows)
+            except Exception as e:
+                print(f"Flushing game results failed: {str(e)}")
+                self.failed_flushes += 1
+                # Put the batch back in front so the next flush retries it in order
+                self.pending = rows + self.pending
+                if self.ratings is not None:
+                    self.ratings.restore_dirty(rating_rows)
+                return
+            self.flush_latency.observe(time.perf_counter() - started)
+            self.written += len(rows)
+            if self.ratings is not None:
+                self.ratings.refresh(written)
+
+    async def run(self):
+        """
+        Flushes every flush_interval seconds, or sooner once flush_size results are pending. Runs until cancelled.
+        """
+        self.wakeup = anyio.Event()
+        while True:
+            with anyio.move_on_after(self.flush_interval):
+                await self.wakeup.wait()
+            self.wakeup = anyio.Event()
+            await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "queue_depth": len(self.pending),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+result_writer = ResultWriter(ratings=ratings)
+register_metrics("game_results", result_writer.snapshot)
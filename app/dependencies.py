@@ -1,6 +1,7 @@
-from typing import Annotated, Union
-from fastapi import Header, HTTPException
-from starlette.status import HTTP_401_UNAUTHORIZED
+from typing import Annotated, Optional, Union
+from fastapi import Header, HTTPException, WebSocket, WebSocketException
+from starlette.status import HTTP_401_UNAUTHORIZED, WS_1008_POLICY_VIOLATION
+from app.token_cache import token_cache
 from app.utils import decode_jwt
 
 async def get_user_id(authorization: Annotated[str, Header()]) -> Union[str, None]:
@@ -8,16 +9,36 @@ async def get_user_id(authorization: Annotated[str, Header()]) -> Union[str, Non
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail={"error":"Authorization Missing"})
 
     user, error = validate_authorization(authorization)
-    print(user)
     if error:
         raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail={"error":"Unauthorized"})
 
     return str(user['user_id'])
-    
+
+async def get_websocket_user_id(websocket: WebSocket) -> Optional[str]:
+    """
+    Browsers cannot set headers on a websocket, so the token may also come as a token query parameter.
+    Connecting without one is still allowed, an invalid one is refused before the handshake completes.
+    """
+    authorization = websocket.query_params.get("token") or websocket.headers.get("authorization")
+    if not authorization:
+        return None
+
+    user, error = validate_authorization(authorization)
+    if error:
+        raise WebSocketException(code=WS_1008_POLICY_VIOLATION, reason="Unauthorized")
+
+    return str(user['user_id'])
+
 def validate_authorization(auth_header:str):
+    # Tokens verified before are trusted until they expire, skipping the signature check
+    cached = token_cache.get(auth_header)
+    if cached is not None:
+        return cached, None
+
     decoded, error = decode_jwt(auth_header)
 
     if error:
         return None, error
 
-    return decoded, None
\ No newline at end of file
+    token_cache.put(auth_header, decoded)
+    return decoded, None
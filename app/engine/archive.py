@@ -0,0 +1,382 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import anyio
+
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum
+from app.models import BoardSettings, GameReplay
+from app.sharding import SHARD_COUNT, SHARD_ID
+
+ARCHIVE_DIR = os.getenv("GAME_ARCHIVE_DIR", "game_archive")
+# Each shard appends to its own files, the archive assumes a single writer
+if SHARD_COUNT > 1:
+    ARCHIVE_DIR = os.path.join(ARCHIVE_DIR, f"shard_{SHARD_ID}")
+RECORDS_FILE = "games.rec"
+MOVES_FILE = "moves.bin"
+INDEX_FILE = "index.hash"
+
+FLUSH_INTERVAL = 1.0
+FLUSH_SIZE = 256
+
+RESULT_TIE = 0
+RESULT_X_WON = 1
+RESULT_O_WON = 2
+RESULT_ABANDONED = 3
+
+# Set in a record's flags when an id was longer than its 16 byte field and got cut
+FLAG_X_ID_TRUNCATED = 1
+FLAG_O_ID_TRUNCATED = 2
+ID_SIZE = 16
+
+# code, X user id, O user id, started_at ms, ended_at ms, rows, columns, win_length, result, first turn, flags, move count, moves offset
+record_struct = struct.Struct("<16s16s16sqqBBBBBBHQ")
+RECORD_SIZE = record_struct.size
+# The index is an open addressed hash table of codes, probed straight in the mapped file so nothing per game is held in memory.
+# Header: codes in the table, records indexed so far. Slots: code, record number + 1, with 0 marking an empty slot.
+index_header_struct = struct.Struct("<QQ")
+INDEX_HEADER_SIZE = index_header_struct.size
+index_struct = struct.Struct("<16sQ")
+INDEX_SIZE = index_struct.size
+# Slots of a new table, it doubles before it gets more than half full so probes stay short
+INDEX_MIN_SLOTS = 1024
+# Records whose codes are read back per chunk while indexing
+INDEX_CHUNK = 4096
+# Byte offsets of the fields RecordView reads on their own
+RESULT_OFFSET = 67
+MOVE_COUNT_OFFSET = 70
+# Each move is the tile index as an unsigned short
+MOVE_SIZE = 2
+
+def pack_id(value:str) -> bytes:
+    """
+    The id as UTF-8 cut to ID_SIZE bytes, on a character boundary so it always decodes.
+    """
+    encoded = value.encode("utf-8")
+    if len(encoded) <= ID_SIZE:
+        return encoded
+    return encoded[:ID_SIZE].decode("utf-8", errors="ignore").encode("utf-8")
+
+def is_truncated(value:str) -> bool:
+    return len(value.encode("utf-8")) > ID_SIZE
+
+def unpack_id(value:bytes) -> str:
+    # Records written before ids were cut on character boundaries may end mid character
+    return value.rstrip(b"\0").decode("utf-8", errors="replace")
+
+def index_key(code:str) -> bytes:
+    # The code as it sits in a slot, padded like struct pads it
+    return pack_id(code).ljust(ID_SIZE, b"\0")
+
+def find_slot(table: Union[bytearray, mmap.mmap, memoryview], slots:int, key:bytes) -> Tuple[int, int]:
+    """
+    Probes from the key's home slot. Returns the offset of the slot holding the key, or of the empty slot that ends the probe,
+    and the record number + 1 stored there, 0 when empty. The offset is -1 if every slot was probed.
+    """
+    # crc32 rather than hash(), which is salted per process
+    slot = zlib.crc32(key) & (slots - 1)
+    for _ in range(slots):
+        offset = INDEX_HEADER_SIZE + slot * INDEX_SIZE
+        stored, number = index_struct.unpack_from(table, offset)
+        if number == 0 or stored == key:
+            return offset, number
+        slot = (slot + 1) & (slots - 1)
+    return -1, 0
+
+def insert_slot(table: Union[bytearray, mmap.mmap], slots:int, key:bytes, number:int) -> bool:
+    """
+    Points key at record number, a reused code moves to its latest game. Returns whether the key is new to the table.
+    """
+    offset, stored = find_slot(table, slots, key)
+    index_struct.pack_into(table, offset, key, number + 1)
+    return stored == 0
+
+def game_result_code(game: Game) -> int:
+    if game.status is not GameStatusEnum.ENDED or game.result is None:
+        return RESULT_ABANDONED
+    if game.result.winner is None:
+        return RESULT_TIE
+    if game.result.winner.id == game.user_ids[0]:
+        return RESULT_X_WON
+    return RESULT_O_WON
+
+class ArchiveWriter():
+    """
+    Appends finished games to the archive. append only packs bytes in memory,
+    the file writes happen in a worker thread when run or flush is awaited.
+    """
+    def __init__(self, directory: str = ARCHIVE_DIR, flush_interval: float = FLUSH_INTERVAL, flush_size: int = FLUSH_SIZE):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.pending_records = bytearray()
+        self.pending_moves = bytearray()
+        self.pending_count = 0
+        self.record_count: Optional[int] = None
+        self.moves_size = 0
+        self.lock = anyio.Lock()
+        self.wakeup: Optional[anyio.Event] = None
+        self.failed_flushes = 0
+
+    def open(self):
+        # Numbering continues from whatever an earlier process already wrote
+        os.makedirs(self.directory, exist_ok=True)
+        records_path = os.path.join(self.directory, RECORDS_FILE)
+        moves_path = os.path.join(self.directory, MOVES_FILE)
+        self.record_count = os.path.getsize(records_path) // RECORD_SIZE if os.path.exists(records_path) else 0
+        self.moves_size = os.path.getsize(moves_path) if os.path.exists(moves_path) else 0
+
+    def append(self, code:str, game: Game):
+        if self.record_count is None:
+            self.open()
+
+        moves = game.moves.tobytes()
+        settings = game.board_settings
+        x_id, o_id = game.user_ids
+        flags = (FLAG_X_ID_TRUNCATED if is_truncated(x_id) else 0) | (FLAG_O_ID_TRUNCATED if is_truncated(o_id) else 0)
+        record = record_struct.pack(
+            pack_id(code), pack_id(x_id), pack_id(o_id),
+            game.started_at or 0, game.ended_at or int(time.time() * 1000),
+            settings.rows, settings.columns, settings.win_length,
+            game_result_code(game), game.first_turn, flags, len(game.moves), self.moves_size,
+        )
+        self.pending_records += record
+        self.pending_moves += moves
+        self.record_count += 1
+        self.moves_size += len(moves)
+        self.pending_count += 1
+
+        if self.pending_count >= self.flush_size and self.wakeup is not None:
+            self.wakeup.set()
+
+    def write(self, records: bytes, moves: bytes):
+        # Moves land before the records pointing at them, and records before the index entries
+        batch = ((MOVES_FILE, moves), (RECORDS_FILE, records))
+        paths = [os.path.join(self.directory, name) for name, _ in batch]
+        sizes = [os.path.getsize(path) if os.path.exists(path) else 0 for path in paths]
+        try:
+            for path, (_, data) in zip(paths, batch):
+                with open(path, "ab") as file:
+                    file.write(data)
+            self.update_index()
+        except OSError:
+            # Cut every file back to where the batch started, so a retry doesn't shift the move offsets
+            for path, size in zip(paths, sizes):
+                try:
+                    os.truncate(path, size)
+                except OSError:
+                    pass
+            raise
+
+    def read_codes(self, start:int, stop:int) -> Iterator[Tuple[int, bytes]]:
+        with open(os.path.join(self.directory, RECORDS_FILE), "rb") as file:
+            file.seek(start * RECORD_SIZE)
+            for chunk_start in range(start, stop, INDEX_CHUNK):
+                chunk = file.read(min(INDEX_CHUNK, stop - chunk_start) * RECORD_SIZE)
+                for i in range(len(chunk) // RECORD_SIZE):
+                    yield chunk_start + i, chunk[i * RECORD_SIZE:i * RECORD_SIZE + ID_SIZE]
+
+    def update_index(self):
+        """
+        Indexes the records the index does not cover yet, reading their codes back from the records file.
+        Updates go into the mapped table in place. A table that would get too full, or a missing one, is built anew
+        in memory and swapped in with a rename, so readers only ever map a complete table.
+        """
+        records_path = os.path.join(self.directory, RECORDS_FILE)
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        record_count = os.path.getsize(records_path) // RECORD_SIZE if os.path.exists(records_path) else 0
+
+        table: Union[bytearray, mmap.mmap]
+        if os.path.exists(index_path):
+            with open(index_path, "r+b") as file:
+                table = mmap.mmap(file.fileno(), 0)
+        else:
+            table = bytearray(INDEX_HEADER_SIZE + INDEX_MIN_SLOTS * INDEX_SIZE)
+        try:
+            entries, indexed = index_header_struct.unpack_from(table)
+            if indexed >= record_count and isinstance(table, mmap.mmap):
+                return
+            slots = (len(table) - INDEX_HEADER_SIZE) // INDEX_SIZE
+            grown_slots = slots
+            while (entries + record_count - indexed) * 2 > grown_slots:
+                grown_slots *= 2
+            if grown_slots != slots:
+                grown = bytearray(INDEX_HEADER_SIZE + grown_slots * INDEX_SIZE)
+                for offset in range(INDEX_HEADER_SIZE, len(table), INDEX_SIZE):
+                    key, number = index_struct.unpack_from(table, offset)
+                    if number != 0:
+                        insert_slot(grown, grown_slots, key, number - 1)
+                if isinstance(table, mmap.mmap):
+                    table.close()
+                table, slots = grown, grown_slots
+
+            for number, key in self.read_codes(indexed, record_count):
+                if insert_slot(table, slots, key, number):
+                    entries += 1
+            index_header_struct.pack_into(table, 0, entries, record_count)
+
+            if isinstance(table, mmap.mmap):
+                table.flush()
+            else:
+                temporary_path = f"{index_path}.tmp"
+                with open(temporary_path, "wb") as file:
+                    file.write(table)
+                os.replace(temporary_path, index_path)
+        finally:
+            if isinstance(table, mmap.mmap):
+                table.close()
+
+    async def flush(self):
+        async with self.lock:
+            if self.pending_count == 0:
+                return
+            records, moves = bytes(self.pending_records), bytes(self.pending_moves)
+            count = self.pending_count
+            self.pending_records.clear()
+            self.pending_moves.clear()
+            self.pending_count = 0
+            try:
+                await anyio.to_thread.run_sync(self.write, records, moves)
+            except OSError as e:
+                print(f"Writing the game archive failed: {str(e)}")
+                self.failed_flushes += 1
+                # Put the batch back in front so the next flush retries it in order
+                self.pending_records[:0] = records
+                self.pending_moves[:0] = moves
+                self.pending_count += count
+
+    async def run(self):
+        """
+        Flushes every flush_interval seconds, or sooner once flush_size games are pending. Runs until cancelled.
+        """
+        self.wakeup = anyio.Event()
+        # Records a crashed process wrote but never indexed, or a whole archive from before the hash index, are indexed first
+        async with self.lock:
+            try:
+                await anyio.to_thread.run_sync(self.update_index)
+            except OSError as e:
+                print(f"Indexing the game archive failed: {str(e)}")
+        while True:
+            with anyio.move_on_after(self.flush_interval):
+                await self.wakeup.wait()
+            self.wakeup = anyio.Event()
+            await self.flush()
+
+class RecordView():
+    """
+    Reads fields of one archived record straight out of the mapped file.
+    Iteration moves a single view across the records instead of creating an object per game.
+    """
+    def __init__(self, reader: "ArchiveReader", offset: int = 0):
+        self.reader = reader
+        self.offset = offset
+
+    def fields(self) -> Tuple:
+        return record_struct.unpack_from(self.reader.records, self.offset)
+
+    @property
+    def code(self) -> str:
+        return unpack_id(self.reader.records[self.offset:self.offset + 16].tobytes())
+
+    @property
+    def result(self) -> int:
+        return self.reader.records[self.offset + RESULT_OFFSET]
+
+    @property
+    def move_count(self) -> int:
+        return struct.unpack_from("<H", self.reader.records, self.offset + MOVE_COUNT_OFFSET)[0]
+
+    def moves(self) -> List[int]:
+        fields = self.fields()
+        move_count, moves_offset = fields[11], fields[12]
+        moves = array('H')
+        moves.frombytes(self.reader.moves[moves_offset:moves_offset + move_count * MOVE_SIZE])
+        return moves.tolist()
+
+    def to_replay(self) -> GameReplay:
+        code, x_id, o_id, started_at, ended_at, rows, columns, win_length, result, first_turn, flags, _, _ = self.fields()
+        x_id = unpack_id(x_id)
+        o_id = unpack_id(o_id)
+        winner = {RESULT_X_WON: x_id, RESULT_O_WON: o_id}.get(result)
+        return GameReplay(
+            code=unpack_id(code), players=[x_id, o_id], started_at=started_at, ended_at=ended_at,
+            board_settings=BoardSettings(rows=rows, columns=columns, win_length=win_length),
+            first_mark="X" if first_turn == 0 else "O", moves=self.moves(),
+            winner=winner, abandoned=result == RESULT_ABANDONED,
+            ids_truncated=flags & (FLAG_X_ID_TRUNCATED | FLAG_O_ID_TRUNCATED) != 0,
+        )
+
+class ArchiveReader():
+    """
+    Memory maps the archive files and finds games by code by probing the mapped index, which keeps its memory flat however many games there are.
+    Files grown or replaced by the writer are remapped on the next read.
+    """
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+        self.records = memoryview(b"")
+        self.moves = memoryview(b"")
+        self.index = memoryview(b"")
+        self.maps: Dict[str, mmap.mmap] = {}
+
+    def map_file(self, name:str) -> memoryview:
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return memoryview(b"")
+        current = self.maps.get(name)
+        if current is not None and len(current) == os.path.getsize(path):
+            return memoryview(current)
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps[name] = mapped
+        return memoryview(mapped)
+
+    def refresh(self):
+        self.records = self.map_file(RECORDS_FILE)
+        self.moves = self.map_file(MOVES_FILE)
+        self.index = self.map_file(INDEX_FILE)
+
+    def find(self, code:str) -> Optional[int]:
+        # Record number of the code, as far as the current mapping knows
+        slots = (len(self.index) - INDEX_HEADER_SIZE) // INDEX_SIZE
+        if slots <= 0:
+            return None
+        _, number = find_slot(self.index, slots, index_key(code))
+        if number == 0 or number * RECORD_SIZE > len(self.records):
+            return None
+        return number - 1
+
+    def __len__(self) -> int:
+        return len(self.records) // RECORD_SIZE
+
+    def __iter__(self) -> Iterator[RecordView]:
+        self.refresh()
+        view = RecordView(self)
+        for offset in range(0, len(self) * RECORD_SIZE, RECORD_SIZE):
+            view.offset = offset
+            yield view
+
+    def get_record(self, code:str) -> Optional[RecordView]:
+        record_number = self.find(code)
+        if record_number is None:
+            # The mappings may predate the game, or the index may have been replaced by a bigger one
+            self.refresh()
+            record_number = self.find(code)
+            if record_number is None:
+                return None
+        return RecordView(self, record_number * RECORD_SIZE)
+
+    def get_replay(self, code:str) -> Optional[GameReplay]:
+        record = self.get_record(code)
+        if record is None:
+            return None
+        return record.to_replay()
+
+archive_reader = ArchiveReader()
+
+def get_archive_reader():
+    return archive_reader
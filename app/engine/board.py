@@ -0,0 +1,47 @@
+from typing import List, Optional, Tuple
+
+winning_combinations = [
+        [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Horizontal wins
+        [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Vertical wins
+        [0, 4, 8], [2, 4, 6]             # Diagonal wins
+]
+
+BOARD_SIZE = 9
+FULL_BOARD = (1 << BOARD_SIZE) - 1
+
+winning_masks = [sum(1 << i for i in combination) for combination in winning_combinations]
+
+# Every possible 9 bit layout of one player's marks mapped to the first combination it completes
+win_lookup: List[Optional[List[int]]] = [None] * (1 << BOARD_SIZE)
+for bits in range(1 << BOARD_SIZE):
+    for mask, combination in zip(winning_masks, winning_combinations):
+        if bits & mask == mask:
+            win_lookup[bits] = combination
+            break
+
+# Row and column steps of the four lines through a tile
+directions: List[Tuple[int, int]] = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+def find_line(bits:int, tile_ix:int, rows:int, columns:int, win_length:int) -> Optional[List[int]]:
+    """
+    Looks for win_length marks in a row through tile_ix, walking at most win_length - 1 tiles each way along every direction.
+    Returns the tiles of the line in ascending order, or None.
+    """
+    row, column = divmod(tile_ix, columns)
+    for d_row, d_column in directions:
+        line = [tile_ix]
+        for sign in (1, -1):
+            r = row + sign * d_row
+            c = column + sign * d_column
+            for _ in range(win_length - 1):
+                if r < 0 or r >= rows or c < 0 or c >= columns:
+                    break
+                ix = r * columns + c
+                if not bits >> ix & 1:
+                    break
+                line.append(ix)
+                r += sign * d_row
+                c += sign * d_column
+        if len(line) >= win_length:
+            return sorted(line)
+    return None
@@ -0,0 +1,43 @@
+import random
+from enum import Enum
+from typing import Dict, Optional
+
+from app.engine.solver import SolvedTable, get_solved_table
+from app.models import LobbyUser
+
+BOT_USER_ID = "BOT"
+
+class BotDifficultyEnum(str, Enum):
+    EASY = "EASY"
+    MEDIUM = "MEDIUM"
+    HARD = "HARD"
+
+# Chance of the bot passing over its best move for a worse one
+mistake_rates: Dict[BotDifficultyEnum, float] = {
+    BotDifficultyEnum.EASY: 0.5,
+    BotDifficultyEnum.MEDIUM: 0.2,
+    BotDifficultyEnum.HARD: 0.0,
+}
+
+class Bot():
+    def __init__(self, difficulty: BotDifficultyEnum, table: Optional[SolvedTable] = None):
+        self.difficulty = difficulty
+        self.user = LobbyUser(id=BOT_USER_ID, username=f"Bot ({difficulty.value.capitalize()})")
+        self.table = table
+
+    def choose_move(self, x_bits:int, o_bits:int, mark:str) -> int:
+        table = self.table or get_solved_table()
+        o_to_move = mark == "O"
+
+        if random.random() >= mistake_rates[self.difficulty]:
+            return table.best_move(x_bits, o_bits, o_to_move)
+
+        move_values = table.move_values(x_bits, o_bits, o_to_move)
+        best_value = max(value for _, value in move_values)
+        worse_moves = [tile for tile, value in move_values if value < best_value]
+
+        # Every move is equally good, so there is no mistake to make
+        if len(worse_moves) == 0:
+            return table.best_move(x_bits, o_bits, o_to_move)
+
+        return random.choice(worse_moves)
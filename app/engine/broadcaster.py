@@ -0,0 +1,105 @@
+import time
+from typing import Dict, Iterable, List
+
+import anyio
+from fastapi import WebSocket
+from pydantic import BaseModel
+
+from app.metrics import LatencyStats, register_metrics
+
+SEND_TIMEOUT = 2.0
+
+class Broadcaster():
+    """
+    Sends one event to many websockets. The event is encoded to JSON once and written to every socket concurrently,
+    so a slow client only delays itself. Sockets that error or time out are evicted.
+    """
+    def __init__(self, send_timeout: float = SEND_TIMEOUT):
+        self.send_timeout = send_timeout
+        self.latency = LatencyStats()
+        self.broadcasts = 0
+        self.messages_sent = 0
+        self.evictions = 0
+
+    def encode(self, event: BaseModel) -> str:
+        return event.model_dump_json()
+
+    async def broadcast(self, websockets: Dict[str, WebSocket], event: BaseModel) -> List[str]:
+        """
+        Sends the event to every socket in websockets and removes the ones that failed from it.
+        Returns the keys of the evicted sockets.
+        """
+        text = self.encode(event)
+        return await self.send_text(websockets, text)
+
+    async def send_text(self, websockets: Dict[str, WebSocket], text: str) -> List[str]:
+        if len(websockets) == 0:
+            return []
+
+        sent: List[str] = []
+        started = time.perf_counter()
+
+        async def send(key: str, websocket: WebSocket):
+            try:
+                await websocket.send_text(text)
+                sent.append(key)
+            except Exception:
+                pass
+
+        # Copy so a disconnect handler editing the dict mid broadcast does not break iteration
+        recipients = list(websockets.items())
+        # One deadline covers every send, whatever has not finished by then gets evicted
+        with anyio.move_on_after(self.send_timeout):
+            if len(recipients) == 1:
+                await send(*recipients[0])
+            else:
+                async with anyio.create_task_group() as task_group:
+                    for key, websocket in recipients:
+                        task_group.start_soon(send, key, websocket)
+
+        self.latency.observe(time.perf_counter() - started)
+        self.broadcasts += 1
+        self.messages_sent += len(sent)
+
+        failed = [key for key, _ in recipients if key not in sent]
+        for key in failed:
+            await self.evict(websockets, key)
+        return failed
+
+    async def evict(self, websockets: Dict[str, WebSocket], key: str):
+        websocket = websockets.pop(key, None)
+        if websocket is None:
+            return
+        self.evictions += 1
+        # The socket is already misbehaving, closing it is best effort
+        with anyio.move_on_after(self.send_timeout):
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+    async def close_all(self, websockets: Iterable[WebSocket]):
+        """
+        Closes every socket concurrently under one send_timeout deadline, best effort like evict.
+        """
+        async def close(websocket: WebSocket):
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+        with anyio.move_on_after(self.send_timeout):
+            async with anyio.create_task_group() as task_group:
+                for websocket in list(websockets):
+                    task_group.start_soon(close, websocket)
+
+    def snapshot(self) -> dict:
+        return {
+            "broadcasts": self.broadcasts,
+            "messages_sent": self.messages_sent,
+            "evictions": self.evictions,
+            "fan_out_latency": self.latency.snapshot(),
+        }
+
+broadcaster = Broadcaster()
+register_metrics("broadcast", broadcaster.snapshot)
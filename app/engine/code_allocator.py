@@ -0,0 +1,104 @@
+import math
+import os
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Set, Tuple
+
+LOBBY_CODE_LENGTH = 5
+# Seconds a released code stays out of circulation, so an old invite never lands in someone else's lobby
+CODE_QUARANTINE = float(os.getenv("LOBBY_CODE_QUARANTINE", "600"))
+
+class CodeSpaceExhausted(Exception):
+    pass
+
+class CodeAllocator():
+    """
+    Hands out unique fixed length hex codes, all congruent to the shard so the code alone says which worker owns it.
+    Fresh codes come from a counter run through a random affine permutation of the shard's code space,
+    so they never repeat and consecutive ones look unrelated. Released codes sit out a quarantine and are then reused first.
+    allocate and release are O(1), there is no retrying on collisions.
+    """
+    def __init__(self, length: int = LOBBY_CODE_LENGTH, shard_id: int = 0, shard_count: int = 1, quarantine: float = CODE_QUARANTINE, clock: Callable[[], float] = time.monotonic):
+        self.length = length
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.quarantine = quarantine
+        self.clock = clock
+        # Codes are index * shard_count + shard_id, for every index keeping them within length digits
+        self.capacity = (16 ** length - shard_id + shard_count - 1) // shard_count
+        self.multiplier = 1
+        while self.capacity > 1:
+            self.multiplier = random.randrange(1, self.capacity)
+            if math.gcd(self.multiplier, self.capacity) == 1:
+                break
+        self.offset = random.randrange(self.capacity)
+        self.counter = 0
+        self.in_use: Set[int] = set()
+        # Release time plus quarantine and index, in release order
+        self.quarantined: Deque[Tuple[float, int]] = deque()
+        self.free: Deque[int] = deque()
+        self.allocated = 0
+
+    def encode(self, index: int) -> str:
+        return format(index * self.shard_count + self.shard_id, f"0{self.length}X")
+
+    def decode(self, code: str) -> Optional[int]:
+        if len(code) != self.length:
+            return None
+        try:
+            value = int(code, 16)
+        except ValueError:
+            return None
+        if value % self.shard_count != self.shard_id:
+            return None
+        return value // self.shard_count
+
+    def allocate(self) -> str:
+        now = self.clock()
+        while len(self.quarantined) > 0 and self.quarantined[0][0] <= now:
+            self.free.append(self.quarantined.popleft()[1])
+
+        while True:
+            if len(self.free) > 0:
+                index = self.free.popleft()
+            elif self.counter < self.capacity:
+                index = (self.multiplier * self.counter + self.offset) % self.capacity
+                self.counter += 1
+            else:
+                raise CodeSpaceExhausted(f"All {self.capacity} codes are in use or quarantined")
+            # Codes reserved after a restart can still come up from the counter, each is skipped at most once
+            if index not in self.in_use:
+                break
+
+        self.in_use.add(index)
+        self.allocated += 1
+        return self.encode(index)
+
+    def reserve(self, code: str) -> bool:
+        """
+        Marks a code handed out before a restart as taken. Returns False if it is not one of this allocator's codes or already taken.
+        """
+        index = self.decode(code)
+        if index is None or index in self.in_use:
+            return False
+        self.in_use.add(index)
+        return True
+
+    def release(self, code: str):
+        index = self.decode(code)
+        if index is None or index not in self.in_use:
+            return
+        self.in_use.remove(index)
+        self.quarantined.append((self.clock() + self.quarantine, index))
+
+    def snapshot(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": len(self.in_use),
+            "quarantined": len(self.quarantined),
+            "free": len(self.free),
+            "never_used": self.capacity - self.counter,
+            "utilization": len(self.in_use) / self.capacity,
+            "allocated": self.allocated,
+        }
@@ -1,19 +1,59 @@
+import gc
+import os
 from typing import Dict, Optional
+import anyio
+from app.db.result_writer import ResultWriter, result_writer
+from app.engine.archive import ArchiveWriter
+from app.engine.bot import Bot, BotDifficultyEnum
+from app.engine.code_allocator import LOBBY_CODE_LENGTH, CodeAllocator
 from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum, UserDisconnectedEvent
 from app.engine.lobby import Lobby
-from app.models import ListedLobby
-from app.utils import create_game_code, create_lobby_code
+from app.engine.lobby_feed import LobbyFeed
+from app.engine.lobby_listing import LobbyListing
+from app.engine.matchmaking import MatchmakingQueue
+from app.engine.snapshot import dump_engine, load_engine
+from app.engine.timer_wheel import Timer, TimerWheel
+from app.metrics import register_metrics
+from app.sharding import SHARD_COUNT, SHARD_ID
+from app.models import BoardSettings, LobbyUser
+from app.utils import create_game_code
 
+# Seconds a lobby may sit with nobody connected before it is reaped
+LOBBY_IDLE_TIMEOUT = 300.0
+# Seconds a game may stay unstarted, or started with nobody connected, before it is reaped
+GAME_IDLE_TIMEOUT = 60.0
+# Seconds players of a restored game have to reattach before it is given up
+RESTORE_WINDOW = float(os.getenv("RESTORE_WINDOW", "60"))
 
 class GameEngine():
-    def __init__(self):
+    def __init__(self, archive: Optional[ArchiveWriter] = None, result_writer: Optional[ResultWriter] = None, wheel: Optional[TimerWheel] = None, shard_id: int = 0, shard_count: int = 1):
         self.games: Dict[str, Game] = {}
+        # Every code this engine hands out belongs to its own shard
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.archive = archive
+        self.result_writer = result_writer
         self.lobbies: Dict[str, Lobby] = {}
+        # Lobby codes are short enough to run out of, so they are allocated rather than drawn at random
+        self.lobby_codes = CodeAllocator(LOBBY_CODE_LENGTH, shard_id, shard_count)
+        self.listing = LobbyListing()
+        self.feed = LobbyFeed(self.listing)
+        self.listing.on_change = self.feed.changed
+        # One wheel checks every lobby and game for idleness instead of a task per object
+        self.wheel = wheel or TimerWheel()
+        self.lobby_timers: Dict[str, Timer] = {}
+        self.game_timers: Dict[str, Timer] = {}
+        self.reaped_lobbies = 0
+        self.reaped_games = 0
+        self.matchmaking = MatchmakingQueue(self.start_match)
 
-    def create_lobby(self, owner:str):
+    def create_lobby(self, owner:str, bot_difficulty: Optional[BotDifficultyEnum] = None, board_settings: Optional[BoardSettings] = None):
         code = self.get_unique_lobby_code()
-        new_lobby = Lobby(owner, code)
+        new_lobby = Lobby(owner, code, bot_difficulty, board_settings, on_change=self.listing.update)
         self.lobbies[code] = new_lobby
+        self.listing.update(new_lobby)
+        self.lobby_timers[code] = self.wheel.schedule(("lobby", code), LOBBY_IDLE_TIMEOUT)
         return code
     
     def get_lobby(self, lobby_code:str) -> Optional[Lobby]:
@@ -22,25 +62,24 @@ class GameEngine():
         else:
             return None
         
-    def get_lobbies(self):
-        return [ListedLobby(code=lobby.code, owner=lobby.owner, players=lobby.users.values()) for lobby in self.lobbies.values()]
-
     def close_lobby(self, lobby_code:str):
         if lobby_code in self.lobbies:
             del self.lobbies[lobby_code]
+            self.listing.remove(lobby_code)
+            self.lobby_codes.release(lobby_code)
+            timer = self.lobby_timers.pop(lobby_code, None)
+            if timer is not None:
+                timer.cancel()
         else:
             return None
         
     def get_unique_lobby_code(self):
-        code = create_lobby_code()
-        while code in self.lobbies:
-            code = create_lobby_code()
-        return code
+        return self.lobby_codes.allocate()
     
     def get_unique_game_code(self):
-        code = create_game_code()
+        code = create_game_code(self.shard_id, self.shard_count)
         while code in self.games:
-            code = create_game_code()
+            code = create_game_code(self.shard_id, self.shard_count)
         return code
     
     def start_lobby(self, lobby_code:str):
@@ -51,10 +90,20 @@ class GameEngine():
         elif len(lobby.users) != 2:
             return
         
+        return self.create_game({**lobby.users}, lobby.bot, lobby.board_settings)
+
+    def start_match(self, first:LobbyUser, second:LobbyUser) -> str:
+        """
+        Creates a classic game for two users the matchmaking queue paired up.
+        """
+        return self.create_game({first.id: first, second.id: second})
+
+    def create_game(self, users:Dict[str, LobbyUser], bot:Optional[Bot] = None, board_settings:Optional[BoardSettings] = None) -> str:
         game_code = self.get_unique_game_code()
-        game = Game(users={**lobby.users})
+        game = Game(users=users, bot=bot, board_settings=board_settings, code=game_code, result_writer=self.result_writer)
 
         self.games[game_code] = game
+        self.game_timers[game_code] = self.wheel.schedule(("game", game_code), GAME_IDLE_TIMEOUT)
         return game_code
     
     def get_game(self, game_code:str) -> Optional[Game]:
@@ -65,11 +114,116 @@ class GameEngine():
         
     def close_game(self, game_code:str):
         if game_code in self.games:
+            game = self.games[game_code]
+            # Games that never started have nothing worth keeping
+            if self.archive is not None and game.status is not GameStatusEnum.FORMING:
+                self.archive.append(game_code, game)
+            game.spectators.close()
             del self.games[game_code]
+            timer = self.game_timers.pop(game_code, None)
+            if timer is not None:
+                timer.cancel()
         else:
             return None
+
+    async def reap_lobby(self, lobby_code:str):
+        lobby = self.lobbies[lobby_code]
+        # Anyone still connected keeps the lobby alive for another round
+        if len(lobby.websockets) > 0:
+            self.lobby_timers[lobby_code] = self.wheel.schedule(("lobby", lobby_code), LOBBY_IDLE_TIMEOUT)
+            return
+        self.close_lobby(lobby_code)
+        self.reaped_lobbies += 1
+
+    async def reap_game(self, game_code:str):
+        game = self.games[game_code]
+        humans = [user_id for user_id in game.user_ids if game.bot is None or user_id != game.bot.user.id]
+        # Started games are kept while every player is connected or still has time to resume
+        if game.status is not GameStatusEnum.FORMING and all(user_id in game.websockets or user_id in game.away for user_id in humans):
+            self.game_timers[game_code] = self.wheel.schedule(("game", game_code), GAME_IDLE_TIMEOUT)
+            return
+        websockets = list(game.websockets.values())
+        self.close_game(game_code)
+        self.reaped_games += 1
+        # Players left waiting for an opponent who never came, or never came back, are sent away
+        if game.status is not GameStatusEnum.FORMING:
+            await game.broadcast(UserDisconnectedEvent())
+        await game.broadcaster.close_all(websockets)
+
+    async def reap(self):
+        """
+        Advances the wheel one tick and reaps the lobbies and games whose timers fired idle.
+        """
+        for timer in self.wheel.advance():
+            kind, code = timer.key
+            if kind == "lobby":
+                await self.reap_lobby(code)
+            else:
+                await self.reap_game(code)
+
+    async def run_reaper(self):
+        """
+        Ticks the wheel until cancelled.
+        """
+        while True:
+            await anyio.sleep(self.wheel.tick)
+            await self.reap()
+
+    def save_state(self, path:str):
+        """
+        Writes lobbies and unfinished games to path, replacing it in one step so a crash never leaves half a snapshot.
+        """
+        data = dump_engine(self.lobbies, self.games)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+
+    def restore_state(self, path:str) -> bool:
+        """
+        Loads the snapshot at path, if there is one, and removes it so a later restart can't bring back stale games.
+        """
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as file:
+            data = file.read()
+        os.remove(path)
+
+        # Everything built here lives on, so collections set off along the way can't free anything.
+        # On a large snapshot they would run over and over and take most of the restore.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            lobbies, games = load_engine(data, self.result_writer)
+            for code, lobby in lobbies.items():
+                self.lobbies[code] = lobby
+                self.lobby_codes.reserve(code)
+                lobby.on_change = self.listing.update
+                self.listing.update(lobby)
+                self.lobby_timers[code] = self.wheel.schedule(("lobby", code), LOBBY_IDLE_TIMEOUT)
+            for code, game in games.items():
+                self.games[code] = game
+                self.game_timers[code] = self.wheel.schedule(("game", code), RESTORE_WINDOW)
+        finally:
+            if gc_enabled:
+                gc.enable()
+        return True
+
+    def snapshot(self) -> dict:
+        return {
+            "lobbies": len(self.lobbies),
+            "games": len(self.games),
+            "reaped_lobbies": self.reaped_lobbies,
+            "reaped_games": self.reaped_games,
+            "pending_timers": self.wheel.pending,
+            "lobby_codes": self.lobby_codes.snapshot(),
+            "listing": self.listing.snapshot(),
+            "feed": self.feed.snapshot(),
+            "matchmaking": self.matchmaking.snapshot(),
+        }
         
-game_engine = GameEngine()
+game_engine = GameEngine(archive=ArchiveWriter(), result_writer=result_writer, shard_id=SHARD_ID, shard_count=SHARD_COUNT)
+register_metrics("engine", game_engine.snapshot)
 
 def get_engine():
     return game_engine
\ No newline at end of file
@@ -1,69 +1,179 @@
+import os
 import random
-from typing import Dict, List
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+import anyio
 from fastapi import WebSocket
 
-from app.engine.game_events import CheckWinResult, FirstTurnEvent, GameEvent, GameResult, GameResultEvent, GameStatusEnum, GameSyncEvent, UserDisconnectedEvent, UserTurnEvent, parse_game_event
-from app.models import LobbyUser
+from app.db.result_writer import ResultWriter
+from app.engine.board import BOARD_SIZE, find_line, win_lookup
+from app.engine.bot import Bot
+from app.engine.broadcaster import broadcaster
+from app.engine.game_events import CheckWinResult, FirstTurnEvent, GameDeltaEvent, GameEvent, GameResult, GameResultEvent, GameStatusEnum, GameSyncEvent, SyncProtocolEnum, UserAwayEvent, UserDisconnectedEvent, UserResumedEvent, UserTurnEvent, parse_game_event
+from app.engine.spectators import SpectatorHub
+from app.models import BoardSettings, LobbyUser
 
-winning_combinations = [
-        [0, 1, 2], [3, 4, 5], [6, 7, 8],  # Horizontal wins
-        [0, 3, 6], [1, 4, 7], [2, 5, 8],  # Vertical wins
-        [0, 4, 8], [2, 4, 6]             # Diagonal wins
-]
+# Seconds a player who dropped mid game has to reconnect before the game is closed
+RESUME_GRACE = float(os.getenv("RESUME_GRACE", "30"))
+# Resuming clients further behind than this get a snapshot instead of the missed deltas
+MAX_RESUME_DELTAS = 16
     
 class Game():
-    def __init__(self, users: Dict[str, LobbyUser]):
+    def __init__(self, users: Dict[str, LobbyUser], bot: Optional[Bot] = None, board_settings: Optional[BoardSettings] = None, code: str = "", result_writer: Optional[ResultWriter] = None):
         self.websockets: Dict[str, WebSocket] = {}
+        # Sync protocol each connected user negotiated, users missing from it get full syncs
+        self.protocols: Dict[str, SyncProtocolEnum] = {}
+        self.broadcaster = broadcaster
+        self.spectators = SpectatorHub()
+        self.code = code
+        # Persists the result in the background when the game ends
+        self.result_writer = result_writer
         self.users = users
         self.user_ids: List[str] = list(users.keys())
         self.status:GameStatusEnum = GameStatusEnum.FORMING
         self.total_turns: int = 0
         self.turn: int = 0
-        self.board = ["" for _ in range(9)]
-        
-    def connect_user(self, user_id:str, websocket: WebSocket):
+        # Bumped on every accepted move, deltas carry it so clients can spot gaps
+        self.seq: int = 0
+        self.board_settings = board_settings or BoardSettings()
+        self.tile_count = self.board_settings.rows * self.board_settings.columns
+        self.full_board = (1 << self.tile_count) - 1
+        # Bitboards, bit i is set when tile i (row * columns + column) holds the player's mark
+        self.x_bits: int = 0
+        self.o_bits: int = 0
+        self.last_move: Optional[int] = None
+        # Tile index of every accepted move in order, kept for the archive
+        self.moves = array('H')
+        self.first_turn: int = 0
+        self.started_at: Optional[int] = None
+        self.ended_at: Optional[int] = None
+        self.result: Optional[GameResult] = None
+        # Server side opponent, its user is one of the two in users but it never has a websocket
+        self.bot = bot
+        self.resume_grace = RESUME_GRACE
+        # Set when the user it belongs to reconnects within the grace window
+        self.away: Dict[str, anyio.Event] = {}
+        # Users that connected at least once, only they can resume
+        self.joined: Set[str] = set()
+        # Whether every connection of the user came with a token for that user, only games between verified users are rated
+        self.verified: Dict[str, bool] = {}
+
+    @property
+    def board(self) -> List[str]:
+        x_bits = self.x_bits
+        o_bits = self.o_bits
+        return ["X" if x_bits >> i & 1 else "O" if o_bits >> i & 1 else "" for i in range(self.tile_count)]
+
+    @board.setter
+    def board(self, board: List[str]):
+        self.x_bits = 0
+        self.o_bits = 0
+        self.last_move = None
+        for i, mark in enumerate(board):
+            if mark == "X":
+                self.x_bits |= 1 << i
+            elif mark != "":
+                self.o_bits |= 1 << i
+
+    def connect_user(self, user_id:str, websocket: WebSocket, protocol: SyncProtocolEnum = SyncProtocolEnum.FULL, verified: bool = False):
         if user_id in self.users.keys():
             self.websockets[user_id] = websocket
+            self.protocols[user_id] = protocol
+            self.joined.add(user_id)
+            # A single connection without a token is enough for the seat to stay unverified
+            self.verified[user_id] = verified and self.verified.get(user_id, True)
             return True
         else:
             return False
     
-    async def game_sync(self):
+    def create_sync_event(self) -> GameSyncEvent:
         turn = self.turn
         user_id = self.user_ids[turn]
         current_turn_user = self.users[user_id]
-        state_sync_event = GameSyncEvent(data={"status":self.status, "users":self.users.values(), "turn":current_turn_user, "total_turns":self.total_turns, "board":self.board})
-        await self.broadcast(state_sync_event)
+        return GameSyncEvent(data={"status":self.status, "users":self.users.values(), "turn":current_turn_user, "total_turns":self.total_turns, "board":self.board, "board_settings":self.board_settings, "seq":self.seq})
+
+    async def game_sync(self, protocol: Optional[SyncProtocolEnum] = None):
+        state_sync_event = self.create_sync_event()
+        await self.broadcast(state_sync_event, protocol)
+
+    async def send_snapshot(self, user_id:str):
+        """
+        Sends a full GAME_SYNC to a single user, used when a delta client reports a sequence gap.
+        """
+        websocket = self.websockets.get(user_id)
+        if websocket is None:
+            return
+        await self.send_to({user_id: websocket}, self.broadcaster.encode(self.create_sync_event()))
 
-    async def broadcast(self, event:GameEvent):
-        for ws in self.websockets.values():
-            await ws.send_json(event.serialize_event())
+    async def send_delta(self, tile_ix:int, mark:str):
+        delta_event = GameDeltaEvent(data={"seq":self.seq, "tile_index":tile_ix, "mark":mark, "turn":self.user_ids[self.turn]})
+        await self.broadcast(delta_event, SyncProtocolEnum.DELTA)
+
+    async def broadcast(self, event:GameEvent, protocol: Optional[SyncProtocolEnum] = None):
+        """
+        Sends the event to every connected user, or only to the users on the given sync protocol.
+        """
+        text = self.broadcaster.encode(event)
+        # Spectators follow the full protocol, handing them the event never waits on their sockets
+        if protocol is not SyncProtocolEnum.DELTA:
+            self.spectators.publish(text, event.__class__ is GameSyncEvent)
+
+        if protocol is None:
+            await self.broadcaster.send_text(self.websockets, text)
+            return
+        
+        websockets = {user_id: ws for user_id, ws in self.websockets.items() if self.protocols.get(user_id, SyncProtocolEnum.FULL) is protocol}
+        await self.send_to(websockets, text)
+
+    async def send_to(self, websockets: Dict[str, WebSocket], text:str):
+        evicted = await self.broadcaster.send_text(websockets, text)
+        # Sockets were evicted from the subset, drop them from the game too
+        for user_id in evicted:
+            self.websockets.pop(user_id, None)
 
     async def broadcast_start(self):
         self.status = GameStatusEnum.STARTING
+        self.started_at = int(time.time() * 1000)
         await self.decide_turn()
         self.status = GameStatusEnum.STARTED
         await self.game_sync()
+        await self.play_bot_turn()
 
     async def decide_turn(self):
         random_number = random.randint(0, 1)
         self.turn = random_number
+        self.first_turn = random_number
         starting_user = self.users[self.user_ids[random_number]]
         start_turn_event = FirstTurnEvent(data=starting_user)
         await self.broadcast(start_turn_event)
 
+    def has_joined(self, user_id:str) -> bool:
+        return user_id in self.joined or user_id in self.away
+
     async def start_game(self):
-        if self.status == GameStatusEnum.FORMING and len(self.websockets.keys()) == 2:
+        # Starts once every human player is connected, the bot never has a socket
+        humans = len(self.users) - (1 if self.bot is not None else 0)
+        if self.status == GameStatusEnum.FORMING and len(self.websockets.keys()) == humans:
             await self.broadcast_start()
 
     async def check_valid_move(self, event: GameEvent):
         if event.__class__ is UserTurnEvent:
             tile_ix = event.data.tile_index
-            if self.board[tile_ix] != "":
+            if tile_ix < 0 or tile_ix >= self.tile_count:
+                return False
+
+            tile_bit = 1 << tile_ix
+            if (self.x_bits | self.o_bits) & tile_bit:
                 return False
             
-            mark = self.get_mark()
-            self.board[tile_ix] = mark
+            if self.turn == 0:
+                self.x_bits |= tile_bit
+            else:
+                self.o_bits |= tile_bit
+            self.last_move = tile_ix
+            self.moves.append(tile_ix)
 
             return True
         return False
@@ -89,20 +199,41 @@ class Game():
             if is_valid_move is False:
                 return False
             
+            self.seq += 1
+            tile_ix = event.data.tile_index
+            mark = self.get_mark()
+
+            # Full protocol clients get the click and a sync before and after the turn advances
             await self.sync_click_with_other_user(event, user_id);
-            await self.game_sync()
+            await self.game_sync(SyncProtocolEnum.FULL)
             
             game_result = await self.check_game_over(user_id)
             if game_result.is_over is False:
                 self.advance_turn()
-                await self.game_sync()
-                return False
+                await self.game_sync(SyncProtocolEnum.FULL)
+                await self.send_delta(tile_ix, mark)
+                return await self.play_bot_turn()
             else:
+                await self.send_delta(tile_ix, mark)
                 await self.end_game(game_result)
                 return True
         else:
             return False
 
+    async def play_bot_turn(self):
+        """
+        Plays the bot's move if it is the bot's turn. Returns True if that move ended the game.
+        """
+        if self.bot is None or self.status is not GameStatusEnum.STARTED:
+            return False
+        
+        bot_id = self.bot.user.id
+        if self.user_ids[self.turn] != bot_id:
+            return False
+        
+        tile_ix = self.bot.choose_move(self.x_bits, self.o_bits, self.get_mark())
+        return await self.game_loop(bot_id, UserTurnEvent(data={"tile_index":tile_ix}))
+
     async def check_game_over(self, user_id: str) -> GameResult:
         mark = self.get_mark()
         win_result = self.check_win(mark)
@@ -118,15 +249,28 @@ class Game():
         return GameResult(is_over=False, status=self.status, winner=None,  combination=None)
     
     def check_win(self, mark:str):
-        for combination in winning_combinations:
-            if all(self.board[i] == mark for i in combination):
+        bits = self.x_bits if mark == "X" else self.o_bits
+
+        # The classic board is the only one with nine tiles, every layout of it is in the lookup table
+        if self.tile_count == BOARD_SIZE:
+            combination = win_lookup[bits]
+            return CheckWinResult(is_win=combination is not None, combination=combination)
+
+        settings = self.board_settings
+        # Only lines through the last move can have been completed by it
+        if self.last_move is not None and bits >> self.last_move & 1:
+            tiles = [self.last_move]
+        else:
+            tiles = [i for i in range(self.tile_count) if bits >> i & 1]
+
+        for tile_ix in tiles:
+            combination = find_line(bits, tile_ix, settings.rows, settings.columns, settings.win_length)
+            if combination is not None:
                 return CheckWinResult(is_win=True, combination=combination)
         return CheckWinResult(is_win=False, combination=None)
     
     def check_tie(self):
-        if "" in self.board:
-            return False
-        return True
+        return (self.x_bits | self.o_bits) == self.full_board
     
     async def send_game_over(self, game_result: GameResult):
         game_result_event = GameResultEvent(data=game_result)
@@ -134,18 +278,108 @@ class Game():
 
     async def end_game(self, game_result: GameResult):
         self.status = GameStatusEnum.ENDED
+        self.result = game_result
+        self.ended_at = int(time.time() * 1000)
+        if self.result_writer is not None:
+            self.result_writer.enqueue(self.result_row())
         await self.send_game_over(game_result)
-        websockets = self.websockets.values()
-        for ws in websockets:
-            await ws.close()
+        # Viewers still get everything published so far, then their sockets close
+        self.spectators.close()
+        # A player that stopped reading can't hold up closing the other socket
+        await self.broadcaster.close_all(self.websockets.values())
+
+    def result_row(self) -> dict:
+        winner = self.result.winner if self.result is not None else None
+        started_at = datetime.fromtimestamp(self.started_at / 1000, timezone.utc) if self.started_at is not None else None
+        return {
+            "code": self.code,
+            "x_user_id": self.user_ids[0],
+            "o_user_id": self.user_ids[1],
+            "winner_id": winner.id if winner is not None else None,
+            "total_turns": self.total_turns,
+            "started_at": started_at,
+            "ended_at": datetime.fromtimestamp(self.ended_at / 1000, timezone.utc),
+            "rated": all(self.verified.get(user_id, False) for user_id in self.user_ids),
+        }
 
     async def handle_disconnect(self, dced_user_id:str):
-        del self.websockets[dced_user_id]
+        # The socket may already have been evicted by a failed broadcast
+        self.websockets.pop(dced_user_id, None)
+        self.protocols.pop(dced_user_id, None)
         user_disconnected_event = UserDisconnectedEvent()
         await self.broadcast(user_disconnected_event)
 
+    async def wait_for_resume(self, user_id:str) -> bool:
+        """
+        Keeps a started game open for resume_grace seconds after the user's socket drops.
+        Returns True if the user reconnected in time.
+        """
+        if self.resume_grace <= 0 or self.status is not GameStatusEnum.STARTED:
+            return False
+
+        self.websockets.pop(user_id, None)
+        self.protocols.pop(user_id, None)
+        resumed = anyio.Event()
+        self.away[user_id] = resumed
+        await self.broadcast(UserAwayEvent(data={"user_id":user_id, "resume_within":self.resume_grace}))
+
+        with anyio.move_on_after(self.resume_grace):
+            await resumed.wait()
+        if self.away.get(user_id) is resumed:
+            del self.away[user_id]
+        return resumed.is_set()
+
+    def missed_deltas(self, last_seq:int) -> Optional[List[GameDeltaEvent]]:
+        """
+        Rebuilds the deltas of every move after last_seq from the move list, or None if a snapshot is the better fit.
+        """
+        if last_seq < 0 or last_seq > self.seq or self.seq - last_seq > MAX_RESUME_DELTAS:
+            return None
+        # Boards set directly have no move list to rebuild from
+        if len(self.moves) != self.seq:
+            return None
+
+        deltas = []
+        # Move n was played by the user whose turn it was, counting from whoever went first
+        for move_ix in range(last_seq, self.seq):
+            mover = (self.first_turn + move_ix) % 2
+            # Like the live delta, the move that ended the game leaves the turn with its mover
+            ending_move = self.status is GameStatusEnum.ENDED and move_ix == self.seq - 1
+            turn = mover if ending_move else 1 - mover
+            deltas.append(GameDeltaEvent(data={"seq":move_ix + 1, "tile_index":self.moves[move_ix], "mark":"X" if mover == 0 else "O", "turn":self.user_ids[turn]}))
+        return deltas
+
+    async def resume(self, user_id:str, last_seq: Optional[int] = None):
+        """
+        Catches a reconnected user up. Delta clients that know where they left off get only the moves they missed,
+        everyone else gets a snapshot.
+        """
+        resumed = self.away.pop(user_id, None)
+        if resumed is not None:
+            resumed.set()
+
+        deltas = None
+        if last_seq is not None and self.protocols.get(user_id) is SyncProtocolEnum.DELTA:
+            deltas = self.missed_deltas(last_seq)
+
+        if deltas is None:
+            await self.send_snapshot(user_id)
+        else:
+            for delta in deltas:
+                websocket = self.websockets.get(user_id)
+                if websocket is None:
+                    break
+                await self.send_to({user_id: websocket}, self.broadcaster.encode(delta))
+
+        await self.broadcast(UserResumedEvent(data={"user_id":user_id}))
+
     async def sync_click_with_other_user(self, event: UserTurnEvent, user_id: str):
         current_index = self.user_ids.index(user_id)
         other_user = 1 - current_index
-        other_user_ws = self.websockets[self.user_ids[other_user]]
-        await other_user_ws.send_json(event.serialize_event())
\ No newline at end of file
+        other_user_id = self.user_ids[other_user]
+        other_user_ws = self.websockets.get(other_user_id)
+        # Bots and users that already left have no socket to sync with, delta clients get the move in the delta
+        if other_user_ws is None or self.protocols.get(other_user_id, SyncProtocolEnum.FULL) is not SyncProtocolEnum.FULL:
+            return
+        # Goes through the broadcaster so a slow opponent is evicted instead of stalling the mover
+        await self.send_to({other_user_id: other_user_ws}, self.broadcaster.encode(event))
\ No newline at end of file
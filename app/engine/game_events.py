@@ -2,7 +2,7 @@ from enum import Enum
 from typing import Dict, List, Optional, Type
 from pydantic import BaseModel, ValidationError
 
-from app.models import LobbyUser
+from app.models import BoardSettings, LobbyUser
 
 
 class GameStatusEnum(str, Enum):
@@ -20,6 +20,16 @@ class GameEventTypeEnum(str, Enum):
     FIRST_TURN = "FIRST_TURN"
     RESULT = "RESULT"
     USER_TURN = "USER_TURN"
+    GAME_DELTA = "GAME_DELTA"
+    SYNC_REQUEST = "SYNC_REQUEST"
+    USER_AWAY = "USER_AWAY"
+    USER_RESUMED = "USER_RESUMED"
+
+class SyncProtocolEnum(str, Enum):
+    # Full GAME_SYNC after every move
+    FULL = "FULL"
+    # One GAME_DELTA per move, full GAME_SYNC only on connect or when the client asks for it
+    DELTA = "DELTA"
 
 class GameEvent(BaseModel):
     type: GameEventTypeEnum
@@ -33,6 +43,9 @@ class ErrorData(BaseModel):
 
 class UserConnectedData(BaseModel):
     user_id: str
+    protocol: SyncProtocolEnum = SyncProtocolEnum.FULL
+    # Set by clients reconnecting to a game in progress, the seq of the last move they saw
+    last_seq: Optional[int] = None
 
 class StateSyncData(BaseModel):
     status: GameStatusEnum
@@ -40,6 +53,8 @@ class StateSyncData(BaseModel):
     board: List[str]
     turn: LobbyUser
     total_turns: int
+    board_settings: BoardSettings = BoardSettings()
+    seq: int = 0
 
 class CheckWinResult(BaseModel):
     is_win: bool
@@ -48,6 +63,24 @@ class CheckWinResult(BaseModel):
 class UserTurnData(BaseModel):
     tile_index: int
 
+class GameDeltaData(BaseModel):
+    seq: int
+    tile_index: int
+    mark: str
+    # Id of the user to move next
+    turn: str
+
+class SyncRequestData(BaseModel):
+    last_seq: int
+
+class UserAwayData(BaseModel):
+    user_id: str
+    # Seconds the user has to reconnect before the game is closed
+    resume_within: float
+
+class UserResumedData(BaseModel):
+    user_id: str
+
 class GameResult(BaseModel):
     is_over: bool
     status: GameStatusEnum
@@ -82,6 +115,22 @@ class GameResultEvent(GameEvent):
     type: GameEventTypeEnum = GameEventTypeEnum.RESULT
     data: GameResult
 
+class GameDeltaEvent(GameEvent):
+    type: GameEventTypeEnum = GameEventTypeEnum.GAME_DELTA
+    data: GameDeltaData
+
+class SyncRequestEvent(GameEvent):
+    type: GameEventTypeEnum = GameEventTypeEnum.SYNC_REQUEST
+    data: SyncRequestData
+
+class UserAwayEvent(GameEvent):
+    type: GameEventTypeEnum = GameEventTypeEnum.USER_AWAY
+    data: UserAwayData
+
+class UserResumedEvent(GameEvent):
+    type: GameEventTypeEnum = GameEventTypeEnum.USER_RESUMED
+    data: UserResumedData
+
 class FirstTurnEvent(GameEvent):
     type: GameEventTypeEnum = GameEventTypeEnum.FIRST_TURN
     data: LobbyUser
@@ -94,7 +143,11 @@ game_event_type_to_class: Dict[GameEventTypeEnum, Type[GameEvent]] = {
     GameEventTypeEnum.FIRST_TURN: FirstTurnEvent,
     GameEventTypeEnum.RESULT: GameResultEvent,
     GameEventTypeEnum.USER_TURN: UserTurnEvent,
-    GameEventTypeEnum.USER_DISCONNECTED: UserDisconnectedEvent
+    GameEventTypeEnum.USER_DISCONNECTED: UserDisconnectedEvent,
+    GameEventTypeEnum.GAME_DELTA: GameDeltaEvent,
+    GameEventTypeEnum.SYNC_REQUEST: SyncRequestEvent,
+    GameEventTypeEnum.USER_AWAY: UserAwayEvent,
+    GameEventTypeEnum.USER_RESUMED: UserResumedEvent
 }
 
 """
@@ -1,46 +1,72 @@
-from typing import Dict
+from typing import Callable, Dict, Optional
 from fastapi import WebSocket
 
+from app.engine.bot import BOT_USER_ID, Bot, BotDifficultyEnum
+from app.engine.broadcaster import broadcaster
 from app.engine.lobby_events import LobbyStartingEvent, StateSyncEvent
-from app.models import LobbyUser
+from app.models import BoardSettings, LobbyUser
 
 
 class Lobby():
-    def __init__(self, owner:str, code:str) -> None:
+    def __init__(self, owner:str, code:str, bot_difficulty: Optional[BotDifficultyEnum] = None, board_settings: Optional[BoardSettings] = None, on_change: Optional[Callable[["Lobby"], None]] = None) -> None:
         self.owner = owner
         self.websockets: Dict[str, WebSocket] = {}
+        self.broadcaster = broadcaster
         self.users: Dict[str, LobbyUser] = {}
         self.code = code
         self.turn = owner
         self.starting = False
+        self.board_settings = board_settings or BoardSettings()
+        # Single player lobbies seat the bot right away, so one human fills them
+        self.bot = Bot(bot_difficulty) if bot_difficulty is not None else None
+        if self.bot is not None:
+            self.users[self.bot.user.id] = self.bot.user
+        # Called whenever the seats change, the engine keeps its lobby listing current with it
+        self.on_change = on_change
 
-    async def join(self, user: LobbyUser, websocket:WebSocket):
-        if len(self.users) < 2 and self.starting == False:
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def can_join(self, user: LobbyUser, verified: bool) -> bool:
+        # Nobody can take the bot's seat
+        if user.id == BOT_USER_ID:
+            return False
+        # Members of a restored lobby take their seat back, but only signed in as themselves and only if it is free
+        if user.id in self.users:
+            return verified and user.id not in self.websockets
+        return len(self.users) < 2 and self.starting == False
+
+    async def join(self, user: LobbyUser, websocket:WebSocket, verified: bool = False):
+        if self.can_join(user, verified):
             self.websockets[user.id] = websocket
             self.users[user.id] = user
+            self.changed()
             await self.state_sync()
             return True
         else:
             return False
     
     async def state_sync(self):
-        state_sync_event = StateSyncEvent(data={"owner":self.owner,"code":self.code, "users":self.users.values()})
-        for ws in self.websockets.values():
-            await ws.send_json(state_sync_event.serialize_event())
+        state_sync_event = StateSyncEvent(data={"owner":self.owner,"code":self.code, "users":self.users.values(), "board_settings":self.board_settings})
+        await self.broadcaster.broadcast(self.websockets, state_sync_event)
 
     async def leave(self, user: LobbyUser):
-        del self.websockets[user.id]
+        # The socket may already have been evicted by a failed broadcast
+        self.websockets.pop(user.id, None)
         del self.users[user.id]
+        self.changed()
         await self.state_sync()
-        return len(self.users)
+        # Only connected humans keep a lobby alive
+        return len(self.websockets)
 
     async def start(self, code:str):
         if len(self.users) < 2:
             return False
         else:
             self.starting = True
+            self.changed()
             start_event = LobbyStartingEvent(data={'code':code, 'starting':True})
-            for ws in self.websockets.values():
-                await ws.send_json(start_event.serialize_event())
+            await self.broadcaster.broadcast(self.websockets, start_event)
             return True
    
\ No newline at end of file
@@ -2,7 +2,7 @@ from typing import Dict, List, Optional, Type
 from pydantic import BaseModel, ValidationError
 from enum import Enum
 
-from app.models import LobbyUser
+from app.models import BoardSettings, LobbyUser
 
 class EventTypeEnum(str, Enum):
     CREATE_LOBBY = 'CREATE_LOBBY'
@@ -13,6 +13,10 @@ class EventTypeEnum(str, Enum):
     INVALID_EVENT = 'INVALID_EVENT'
     LOBBY_STARTING = 'LOBBY_STARTING'
     START_LOBBY = 'START_LOBBY'
+    LOBBY_SNAPSHOT = 'LOBBY_SNAPSHOT'
+    LOBBY_FEED = 'LOBBY_FEED'
+    JOIN_QUEUE = 'JOIN_QUEUE'
+    MATCH_FOUND = 'MATCH_FOUND'
 
 
 class CreateLobbyData(BaseModel):
@@ -29,6 +33,10 @@ class StateSyncData(BaseModel):
     owner: str
     code: str
     users: List[LobbyUser]
+    board_settings: BoardSettings = BoardSettings()
+
+class MatchFoundData(BaseModel):
+    code: str
 
 class ErrorData(BaseModel):
     error: str
@@ -68,6 +76,14 @@ class StartLobbyEvent(Event):
     type: EventTypeEnum = EventTypeEnum.START_LOBBY
     data: StartLobbyData
 
+class JoinQueueEvent(Event):
+    type: EventTypeEnum = EventTypeEnum.JOIN_QUEUE
+    data: LobbyUser
+
+class MatchFoundEvent(Event):
+    type: EventTypeEnum = EventTypeEnum.MATCH_FOUND
+    data: MatchFoundData
+
 class InvalidEvent(Event):
     type: EventTypeEnum = EventTypeEnum.INVALID_EVENT
     data: ErrorData = ErrorData(error="Invalid Event")
@@ -81,7 +97,9 @@ event_type_to_class: Dict[EventTypeEnum, Type[Event]] = {
     EventTypeEnum.LOBBY_FULL: LobbyFullEvent,
     EventTypeEnum.INVALID_EVENT: InvalidEvent,
     EventTypeEnum.LOBBY_STARTING: LobbyStartingEvent,
-    EventTypeEnum.START_LOBBY: StartLobbyEvent
+    EventTypeEnum.START_LOBBY: StartLobbyEvent,
+    EventTypeEnum.JOIN_QUEUE: JoinQueueEvent,
+    EventTypeEnum.MATCH_FOUND: MatchFoundEvent,
 }
 
 """
@@ -0,0 +1,158 @@
+import json
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import anyio
+from fastapi import WebSocket
+
+from app.engine.lobby_events import EventTypeEnum
+from app.engine.lobby_listing import LobbyListing
+
+# Seconds changes are gathered for before they go out as one frame
+FEED_WINDOW = float(os.getenv("LOBBY_FEED_WINDOW", "0.1"))
+# Frames a subscriber may fall behind before it is sent a fresh snapshot instead
+MAX_FEED_LAG = 64
+MAX_FEED_SUBSCRIBERS = 10000
+SEND_TIMEOUT = 5.0
+
+class FeedSubscriber():
+    def __init__(self, websocket: WebSocket, cursor: int):
+        self.websocket = websocket
+        # Seq of the next frame this subscriber should get
+        self.cursor = cursor
+
+class LobbyFeed():
+    """
+    Pushes lobby listing changes to browsers instead of them polling for the list.
+    A subscriber first gets a LOBBY_SNAPSHOT, then LOBBY_FEED frames listing the lobbies added, updated and removed since.
+    Changes within a window are coalesced per code into one frame, encoded once into a ring every subscriber drains from its own cursor.
+    Added and updated entries should be applied as upserts, a change made just before subscribing can show up in both.
+    """
+    def __init__(self, listing: LobbyListing, window: float = FEED_WINDOW, max_lag: int = MAX_FEED_LAG, max_subscribers: int = MAX_FEED_SUBSCRIBERS):
+        self.listing = listing
+        self.window = window
+        self.max_lag = max_lag
+        self.max_subscribers = max_subscribers
+        self.ring: List[Optional[str]] = [None] * max_lag
+        self.next_seq = 0
+        # For every code changed this window, whether subscribers already had it and its latest entry, None once removed
+        self.listed_before: Dict[str, bool] = {}
+        self.pending: Dict[str, Optional[bytes]] = {}
+        self.flush_at: Optional[float] = None
+        self.subscribers: Set[FeedSubscriber] = set()
+        self.updated: Optional[anyio.Event] = None
+        self.changes = 0
+        self.frames = 0
+        self.resyncs = 0
+
+    def notify(self):
+        if self.updated is not None:
+            self.updated.set()
+            self.updated = None
+
+    def changed(self, code: str, entry: Optional[bytes], was_listed: bool):
+        # Subscribers start from a snapshot, so there is nothing to keep track of without any
+        if len(self.subscribers) == 0:
+            return
+        self.changes += 1
+        self.listed_before.setdefault(code, was_listed)
+        self.pending[code] = entry
+        if self.flush_at is None:
+            self.flush_at = time.monotonic() + self.window
+            self.notify()
+
+    def flush(self):
+        """
+        Turns the window's changes into a frame. Whichever subscriber gets here first does it, for everyone.
+        """
+        if self.flush_at is None:
+            return
+        added: List[bytes] = []
+        updated: List[bytes] = []
+        removed: List[str] = []
+        for code, entry in self.pending.items():
+            if entry is None:
+                # Lobbies created and closed within the window never existed as far as subscribers know
+                if self.listed_before[code]:
+                    removed.append(code)
+            elif self.listed_before[code]:
+                updated.append(entry)
+            else:
+                added.append(entry)
+        self.pending = {}
+        self.listed_before = {}
+        self.flush_at = None
+        if len(added) + len(updated) + len(removed) == 0:
+            return
+
+        frame = b'{"type":"%s","data":{"seq":%d,"added":[%s],"updated":[%s],"removed":%s}}' % (
+            EventTypeEnum.LOBBY_FEED.value.encode(), self.next_seq, b",".join(added), b",".join(updated), json.dumps(removed).encode(),
+        )
+        self.ring[self.next_seq % self.max_lag] = frame.decode()
+        self.next_seq += 1
+        self.frames += 1
+        self.notify()
+
+    def snapshot_frame(self) -> str:
+        frame = b'{"type":"%s","data":{"seq":%d,"lobbies":[%s]}}' % (
+            EventTypeEnum.LOBBY_SNAPSHOT.value.encode(), self.next_seq, b",".join(self.listing.listed_entries()),
+        )
+        return frame.decode()
+
+    def add(self, websocket: WebSocket) -> Optional[FeedSubscriber]:
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = FeedSubscriber(websocket, self.next_seq)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def remove(self, subscriber: FeedSubscriber):
+        self.subscribers.discard(subscriber)
+
+    def next_frame(self, subscriber: FeedSubscriber) -> Optional[str]:
+        if subscriber.cursor >= self.next_seq:
+            return None
+        if self.next_seq - subscriber.cursor > self.max_lag:
+            # The frames it missed already left the ring, the current list replaces them
+            self.resyncs += 1
+            subscriber.cursor = self.next_seq
+            return self.snapshot_frame()
+        frame = self.ring[subscriber.cursor % self.max_lag]
+        subscriber.cursor += 1
+        return frame
+
+    async def serve(self, subscriber: FeedSubscriber):
+        """
+        Sends the subscriber the current list and then every frame after it, until a send fails.
+        """
+        frame: Optional[str] = self.snapshot_frame()
+        while True:
+            if frame is not None:
+                try:
+                    with anyio.fail_after(SEND_TIMEOUT):
+                        await subscriber.websocket.send_text(frame)
+                except Exception:
+                    return
+            frame = self.next_frame(subscriber)
+            if frame is not None:
+                continue
+
+            if self.flush_at is not None:
+                wait = self.flush_at - time.monotonic()
+                if wait > 0:
+                    await anyio.sleep(wait)
+                self.flush()
+                continue
+
+            if self.updated is None:
+                self.updated = anyio.Event()
+            await self.updated.wait()
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "changes": self.changes,
+            "frames": self.frames,
+            "resyncs": self.resyncs,
+        }
@@ -0,0 +1,117 @@
+import hashlib
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.engine.lobby import Lobby
+from app.models import ListedLobby
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# Distinct pages kept encoded at once, polls mostly ask for the same few
+PAGE_CACHE_SIZE = 256
+
+class Page():
+    def __init__(self, body: bytes, etag: str, last: Optional[int], full: bool):
+        self.body = body
+        self.etag = etag
+        # Position of the last lobby on the page, None when it is empty
+        self.last = last
+        # Whether the page stopped at its limit rather than at the end of the listing
+        self.full = full
+
+class LobbyListing():
+    """
+    The lobby list, kept up to date as lobbies change instead of rebuilt on every request.
+    Each lobby gets a position when it is first listed and is encoded once per change, pages are the encoded
+    entries after a cursor position. A change only drops the cached pages that could contain it.
+    """
+    def __init__(self, page_cache_size: int = PAGE_CACHE_SIZE, on_change: Optional[Callable[[str, Optional[bytes], bool], None]] = None):
+        self.page_cache_size = page_cache_size
+        # Gets the code, its new entry or None once removed, and whether it was listed before the change
+        self.on_change = on_change
+        self.next_position = 1
+        self.positions: Dict[str, int] = {}
+        self.entries: Dict[int, bytes] = {}
+        # Positions in listing order, and the ones with a seat free
+        self.order: List[int] = []
+        self.open: List[int] = []
+        self.pages: Dict[Tuple[int, int, bool], Page] = {}
+        self.page_hits = 0
+        self.page_misses = 0
+
+    def update(self, lobby: Lobby):
+        position = self.positions.get(lobby.code)
+        was_listed = position is not None
+        if position is None:
+            position = self.next_position
+            self.next_position += 1
+            self.positions[lobby.code] = position
+            self.order.append(position)
+
+        self.entries[position] = ListedLobby(code=lobby.code, owner=lobby.owner, players=lobby.users.values(), board_settings=lobby.board_settings).model_dump_json().encode()
+
+        is_open = len(lobby.users) < 2 and not lobby.starting
+        ix = bisect_left(self.open, position)
+        listed_open = ix < len(self.open) and self.open[ix] == position
+        if is_open and not listed_open:
+            self.open.insert(ix, position)
+        elif listed_open and not is_open:
+            del self.open[ix]
+        self.invalidate(position)
+        if self.on_change is not None:
+            self.on_change(lobby.code, self.entries[position], was_listed)
+
+    def remove(self, code: str):
+        position = self.positions.pop(code, None)
+        if position is None:
+            return
+        del self.entries[position]
+        del self.order[bisect_left(self.order, position)]
+        ix = bisect_left(self.open, position)
+        if ix < len(self.open) and self.open[ix] == position:
+            del self.open[ix]
+        self.invalidate(position)
+        if self.on_change is not None:
+            self.on_change(code, None, True)
+
+    def invalidate(self, position: int):
+        # A full page ending before the change can't have moved, everything else might have
+        stale = [key for key, page in self.pages.items() if not page.full or page.last is None or page.last >= position]
+        for key in stale:
+            del self.pages[key]
+
+    def page(self, cursor: int = 0, limit: int = DEFAULT_PAGE_SIZE, open_only: bool = False) -> Page:
+        """
+        Up to limit lobbies listed after the cursor position, as the encoded response body.
+        """
+        key = (cursor, limit, open_only)
+        page = self.pages.get(key)
+        if page is not None:
+            self.page_hits += 1
+            return page
+        self.page_misses += 1
+
+        positions = self.open if open_only else self.order
+        start = bisect_right(positions, cursor)
+        selected = positions[start:start + limit]
+        full = start + limit < len(positions)
+        next_cursor = b'"%d"' % selected[-1] if full else b"null"
+        body = b'{"lobbies":[' + b",".join([self.entries[position] for position in selected]) + b'],"next_cursor":' + next_cursor + b"}"
+        page = Page(body, f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"', selected[-1] if selected else None, full)
+
+        if len(self.pages) >= self.page_cache_size:
+            del self.pages[next(iter(self.pages))]
+        self.pages[key] = page
+        return page
+
+    def listed_entries(self) -> List[bytes]:
+        return [self.entries[position] for position in self.order]
+
+    def snapshot(self) -> dict:
+        return {
+            "listed": len(self.order),
+            "open": len(self.open),
+            "cached_pages": len(self.pages),
+            "page_hits": self.page_hits,
+            "page_misses": self.page_misses,
+        }
@@ -0,0 +1,168 @@
+import math
+import os
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional
+
+import anyio
+
+from app.engine.timer_wheel import Timer, TimerWheel
+from app.metrics import LatencyStats
+from app.models import LobbyUser
+
+DEFAULT_RATING = 1200
+# Ratings in the same bucket count as equally close
+BUCKET_WIDTH = 25
+# Rating difference a ticket accepts right away, how much each widening adds and the most it accepts by widening
+BASE_WINDOW = 50
+WINDOW_STEP = 50
+MAX_WINDOW = 400
+# The widening after MAX_WINDOW drops the limit, the ticket then takes the nearest waiting player at any distance
+UNBOUNDED_WINDOW = math.inf
+# Seconds between widenings
+WIDEN_INTERVAL = float(os.getenv("MATCHMAKING_WIDEN_INTERVAL", "2"))
+
+class Ticket():
+    def __init__(self, user: LobbyUser, rating: float):
+        self.user = user
+        self.rating = rating
+        self.bucket = int(rating // BUCKET_WIDTH)
+        self.window: float = BASE_WINDOW
+        self.enqueued_at = time.monotonic()
+        self.timer: Optional[Timer] = None
+        # Code of the game the ticket was matched into, set along with matched
+        self.game_code: Optional[str] = None
+        self.matched = anyio.Event()
+
+class MatchmakingQueue():
+    """
+    Pairs waiting players by rating. Tickets wait FIFO in buckets of BUCKET_WIDTH rating points and the non-empty buckets
+    are kept sorted, so finding the closest opponent is a bisect to the nearest bucket on either side.
+    A ticket searches when it joins and again every time its window widens. Past MAX_WINDOW it takes the nearest waiting
+    bucket at any distance and keeps searching every tick, so two players far apart still end up matched.
+    Finding a match is O(log b) in the number of non-empty buckets b. Adding or dropping a bucket shifts the sorted list,
+    which is O(b), but b is bounded by the rating range over BUCKET_WIDTH rather than by the number of waiting players.
+    """
+    def __init__(self, on_match: Callable[[LobbyUser, LobbyUser], str], wheel: Optional[TimerWheel] = None):
+        # Creates the game for two matched users and returns its code
+        self.on_match = on_match
+        self.tickets: Dict[str, Ticket] = {}
+        self.buckets: Dict[int, Dict[str, Ticket]] = {}
+        self.bucket_ids: List[int] = []
+        # Every tick of the wheel is one widening
+        self.wheel = wheel or TimerWheel(tick=WIDEN_INTERVAL)
+        self.matches = 0
+        self.wait = LatencyStats()
+
+    def join(self, user: LobbyUser, rating: float = DEFAULT_RATING) -> Optional[Ticket]:
+        """
+        Queues the user, or matches them right away if an opponent is in range. Returns None if the user is already queued.
+        """
+        if user.id in self.tickets:
+            return None
+        ticket = Ticket(user, rating)
+        if not self.match(ticket):
+            self.insert(ticket)
+            ticket.timer = self.wheel.schedule(user.id, self.wheel.tick)
+        return ticket
+
+    def leave(self, ticket: Ticket):
+        # Matched tickets have already left
+        if self.tickets.get(ticket.user.id) is ticket:
+            self.remove(ticket)
+
+    def insert(self, ticket: Ticket):
+        self.tickets[ticket.user.id] = ticket
+        bucket = self.buckets.get(ticket.bucket)
+        if bucket is None:
+            bucket = self.buckets[ticket.bucket] = {}
+            insort(self.bucket_ids, ticket.bucket)
+        bucket[ticket.user.id] = ticket
+
+    def remove(self, ticket: Ticket):
+        del self.tickets[ticket.user.id]
+        bucket = self.buckets[ticket.bucket]
+        del bucket[ticket.user.id]
+        if len(bucket) == 0:
+            del self.buckets[ticket.bucket]
+            del self.bucket_ids[bisect_left(self.bucket_ids, ticket.bucket)]
+        if ticket.timer is not None:
+            ticket.timer.cancel()
+            ticket.timer = None
+
+    def first_other(self, bucket_id: int, ticket: Ticket) -> Optional[Ticket]:
+        for other in self.buckets[bucket_id].values():
+            if other is not ticket:
+                return other
+        return None
+
+    def nearest(self, ticket: Ticket) -> Optional[Ticket]:
+        """
+        The longest waiting ticket in the closest bucket within the ticket's window, ticket itself aside.
+        """
+        ix = bisect_left(self.bucket_ids, ticket.bucket)
+        # inf // BUCKET_WIDTH is nan, an unbounded window has to stay inf
+        reach = ticket.window // BUCKET_WIDTH if ticket.window < UNBOUNDED_WINDOW else UNBOUNDED_WINDOW
+        candidates: List[Ticket] = []
+
+        # Only the ticket's own bucket can hold nothing but the ticket, so each side looks at two buckets at most
+        for step in (1, -1):
+            position = ix if step == 1 else ix - 1
+            while 0 <= position < len(self.bucket_ids) and abs(self.bucket_ids[position] - ticket.bucket) <= reach:
+                other = self.first_other(self.bucket_ids[position], ticket)
+                if other is not None:
+                    candidates.append(other)
+                    break
+                position += step
+
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda other: (abs(other.bucket - ticket.bucket), other.enqueued_at))
+
+    def match(self, ticket: Ticket) -> bool:
+        opponent = self.nearest(ticket)
+        if opponent is None:
+            return False
+
+        self.remove(opponent)
+        if self.tickets.get(ticket.user.id) is ticket:
+            self.remove(ticket)
+        # Whoever waited longer is listed first
+        code = self.on_match(opponent.user, ticket.user) if opponent.enqueued_at <= ticket.enqueued_at else self.on_match(ticket.user, opponent.user)
+
+        now = time.monotonic()
+        for matched in (opponent, ticket):
+            matched.game_code = code
+            matched.matched.set()
+            self.wait.observe(now - matched.enqueued_at)
+        self.matches += 1
+        return True
+
+    def advance(self):
+        """
+        Widens the windows of the tickets whose timers fired and searches again with them.
+        """
+        for timer in self.wheel.advance():
+            ticket = self.tickets.get(timer.key)
+            if ticket is None or ticket.timer is not timer:
+                continue
+            ticket.timer = None
+            ticket.window = min(ticket.window + WINDOW_STEP, MAX_WINDOW) if ticket.window < MAX_WINDOW else UNBOUNDED_WINDOW
+            if not self.match(ticket):
+                ticket.timer = self.wheel.schedule(ticket.user.id, self.wheel.tick)
+
+    async def run(self):
+        """
+        Ticks the wheel until cancelled.
+        """
+        while True:
+            await anyio.sleep(self.wheel.tick)
+            self.advance()
+
+    def snapshot(self) -> dict:
+        return {
+            "queued": len(self.tickets),
+            "buckets": len(self.bucket_ids),
+            "matches": self.matches,
+            "wait": self.wait.snapshot(),
+        }
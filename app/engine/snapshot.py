@@ -0,0 +1,149 @@
+import os
+import struct
+from array import array
+from typing import Dict, List, Tuple
+
+from app.engine.bot import Bot, BotDifficultyEnum
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum
+from app.engine.lobby import Lobby
+from app.models import BoardSettings, LobbyUser
+from app.sharding import SHARD_COUNT, SHARD_ID
+
+ENGINE_SNAPSHOT_PATH = os.getenv("ENGINE_SNAPSHOT_PATH", "engine_snapshot.bin")
+# Each shard restarts on its own and restores only its own codes
+if SHARD_COUNT > 1:
+    ENGINE_SNAPSHOT_PATH = f"{ENGINE_SNAPSHOT_PATH}.shard_{SHARD_ID}"
+
+MAGIC = b"TTTS"
+VERSION = 1
+
+# magic, version, lobby count, game count
+header_struct = struct.Struct("<4sHII")
+# rows, columns, win_length, bot difficulty, starting, human count
+lobby_struct = struct.Struct("<BBBBBB")
+# status, turn, first turn, rows, columns, win_length, bot difficulty, total turns, seq, started_at ms, move count
+game_struct = struct.Struct("<BBBBBBBHIqH")
+length_struct = struct.Struct("<H")
+
+statuses = list(GameStatusEnum)
+difficulties = list(BotDifficultyEnum)
+
+def pack_str(parts: List[bytes], value: str):
+    encoded = value.encode("utf-8")
+    parts.append(length_struct.pack(len(encoded)))
+    parts.append(encoded)
+
+def unpack_str(data: memoryview, offset: int) -> Tuple[str, int]:
+    length = length_struct.unpack_from(data, offset)[0]
+    offset += length_struct.size
+    return str(data[offset:offset + length], "utf-8"), offset + length
+
+def bot_code(bot) -> int:
+    # 0 for no bot, otherwise the difficulty's position plus one
+    return 0 if bot is None else difficulties.index(bot.difficulty) + 1
+
+def cached_settings(cache: Dict[Tuple[int, int, int], BoardSettings], rows: int, columns: int, win_length: int) -> BoardSettings:
+    settings = cache.get((rows, columns, win_length))
+    if settings is None:
+        settings = cache[(rows, columns, win_length)] = BoardSettings(rows=rows, columns=columns, win_length=win_length)
+    return settings
+
+def dump_engine(lobbies: Dict[str, Lobby], games: Dict[str, Game]) -> bytes:
+    """
+    Packs everything needed to carry lobbies and unfinished games across a restart. Sockets are left out,
+    players reattach to the restored objects. Boards are rebuilt from the move lists, so they are not stored.
+    """
+    live_games = [(code, game) for code, game in games.items() if game.status is not GameStatusEnum.ENDED]
+    parts: List[bytes] = [header_struct.pack(MAGIC, VERSION, len(lobbies), len(live_games))]
+
+    for code, lobby in lobbies.items():
+        settings = lobby.board_settings
+        humans = [user for user in lobby.users.values() if lobby.bot is None or user.id != lobby.bot.user.id]
+        parts.append(lobby_struct.pack(settings.rows, settings.columns, settings.win_length, bot_code(lobby.bot), lobby.starting, len(humans)))
+        pack_str(parts, code)
+        pack_str(parts, lobby.owner)
+        for user in humans:
+            pack_str(parts, user.id)
+            pack_str(parts, user.username)
+
+    for code, game in live_games:
+        settings = game.board_settings
+        parts.append(game_struct.pack(
+            statuses.index(game.status), game.turn, game.first_turn,
+            settings.rows, settings.columns, settings.win_length, bot_code(game.bot),
+            game.total_turns, game.seq, game.started_at or 0, len(game.moves),
+        ))
+        pack_str(parts, code)
+        for user in game.users.values():
+            pack_str(parts, user.id)
+            pack_str(parts, user.username)
+        parts.append(game.moves.tobytes())
+
+    return b"".join(parts)
+
+def load_engine(data: bytes, result_writer=None) -> Tuple[Dict[str, Lobby], Dict[str, Game]]:
+    view = memoryview(data)
+    magic, version, lobby_count, game_count = header_struct.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an engine snapshot this version can read")
+    offset = header_struct.size
+    # Most boards share a handful of settings, so they share the objects too
+    settings_cache: Dict[Tuple[int, int, int], BoardSettings] = {}
+
+    lobbies: Dict[str, Lobby] = {}
+    for _ in range(lobby_count):
+        rows, columns, win_length, difficulty, starting, human_count = lobby_struct.unpack_from(view, offset)
+        offset += lobby_struct.size
+        code, offset = unpack_str(view, offset)
+        owner, offset = unpack_str(view, offset)
+        settings = cached_settings(settings_cache, rows, columns, win_length)
+        lobby = Lobby(owner, code, difficulties[difficulty - 1] if difficulty else None, settings)
+        lobby.starting = bool(starting)
+        for _ in range(human_count):
+            user_id, offset = unpack_str(view, offset)
+            username, offset = unpack_str(view, offset)
+            lobby.users[user_id] = LobbyUser(id=user_id, username=username)
+        lobbies[code] = lobby
+
+    games: Dict[str, Game] = {}
+    for _ in range(game_count):
+        status, turn, first_turn, rows, columns, win_length, difficulty, total_turns, seq, started_at, move_count = game_struct.unpack_from(view, offset)
+        offset += game_struct.size
+        code, offset = unpack_str(view, offset)
+        users: Dict[str, LobbyUser] = {}
+        for _ in range(2):
+            user_id, offset = unpack_str(view, offset)
+            username, offset = unpack_str(view, offset)
+            users[user_id] = LobbyUser(id=user_id, username=username)
+        settings = cached_settings(settings_cache, rows, columns, win_length)
+        bot = Bot(difficulties[difficulty - 1]) if difficulty else None
+
+        game = Game(users, bot=bot, board_settings=settings, code=code, result_writer=result_writer)
+        game.status = statuses[status]
+        # Everyone in a started game was connected before the restart, reconnecting resumes it
+        if game.status is not GameStatusEnum.FORMING:
+            game.joined.update(users)
+        game.turn = turn
+        game.first_turn = first_turn
+        game.total_turns = total_turns
+        game.seq = seq
+        game.started_at = started_at or None
+        game.moves = array('H')
+        game.moves.frombytes(view[offset:offset + move_count * 2])
+        offset += move_count * 2
+
+        # Moves alternate from whoever went first, X being the first user
+        x_bits = 0
+        o_bits = 0
+        for move_ix, tile_ix in enumerate(game.moves):
+            if (first_turn + move_ix) % 2 == 0:
+                x_bits |= 1 << tile_ix
+            else:
+                o_bits |= 1 << tile_ix
+        game.x_bits = x_bits
+        game.o_bits = o_bits
+        game.last_move = game.moves[-1] if move_count > 0 else None
+        games[code] = game
+
+    return lobbies, games
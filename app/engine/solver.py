@@ -0,0 +1,119 @@
+import os
+from array import array
+from typing import List, Optional, Tuple
+
+from app.engine.board import BOARD_SIZE, FULL_BOARD, win_lookup
+
+POSITION_COUNT = 3 ** BOARD_SIZE
+# Either mark can open a game, so who is to move is part of the position
+TABLE_SIZE = 2 * POSITION_COUNT
+UNSOLVED = -128
+NO_MOVE = -1
+
+SOLVED_TABLE_PATH = os.path.join(os.path.dirname(__file__), "solved_positions.bin")
+
+# Base 3 value of every 9 bit mask, so encoding a bitboard pair is two lookups
+ternary = [sum(3 ** i for i in range(BOARD_SIZE) if bits >> i & 1) for bits in range(1 << BOARD_SIZE)]
+
+def position_index(x_bits:int, o_bits:int, o_to_move:bool) -> int:
+    index = ternary[x_bits] + 2 * ternary[o_bits]
+    if o_to_move:
+        index += POSITION_COUNT
+    return index
+
+class SolvedTable():
+    """
+    Minimax values and best moves for every reachable position, stored in flat arrays indexed by position_index.
+    Values are from the point of view of the player to move: positive wins, negative loses, 0 draws.
+    Faster wins and slower losses score further from zero.
+    """
+    def __init__(self, values: array, best_moves: array):
+        self.values = values
+        self.best_moves = best_moves
+
+    @classmethod
+    def build(cls) -> "SolvedTable":
+        table = cls(array('b', [UNSOLVED]) * TABLE_SIZE, array('b', [NO_MOVE]) * TABLE_SIZE)
+        table.solve(0, 0, False)
+        table.solve(0, 0, True)
+        return table
+
+    @classmethod
+    def load(cls, path:str) -> "SolvedTable":
+        values = array('b')
+        best_moves = array('b')
+        with open(path, "rb") as file:
+            values.fromfile(file, TABLE_SIZE)
+            best_moves.fromfile(file, TABLE_SIZE)
+        return cls(values, best_moves)
+
+    def save(self, path:str):
+        with open(path, "wb") as file:
+            self.values.tofile(file)
+            self.best_moves.tofile(file)
+
+    def solve(self, x_bits:int, o_bits:int, o_to_move:bool) -> int:
+        # The array doubles as the transposition table
+        index = position_index(x_bits, o_bits, o_to_move)
+        value = self.values[index]
+        if value != UNSOLVED:
+            return value
+
+        occupied = x_bits | o_bits
+        empty_tiles = [tile for tile in range(BOARD_SIZE) if not occupied >> tile & 1]
+        last_mover_bits = x_bits if o_to_move else o_bits
+
+        best_move = NO_MOVE
+        if win_lookup[last_mover_bits] is not None:
+            value = -(len(empty_tiles) + 1)
+        elif occupied == FULL_BOARD:
+            value = 0
+        else:
+            value = UNSOLVED
+            for tile in empty_tiles:
+                if o_to_move:
+                    child_value = -self.solve(x_bits, o_bits | 1 << tile, False)
+                else:
+                    child_value = -self.solve(x_bits | 1 << tile, o_bits, True)
+                if child_value > value:
+                    value = child_value
+                    best_move = tile
+
+        self.values[index] = value
+        self.best_moves[index] = best_move
+        return value
+
+    def value(self, x_bits:int, o_bits:int, o_to_move:bool) -> int:
+        return self.values[position_index(x_bits, o_bits, o_to_move)]
+
+    def best_move(self, x_bits:int, o_bits:int, o_to_move:bool) -> int:
+        return self.best_moves[position_index(x_bits, o_bits, o_to_move)]
+
+    def move_values(self, x_bits:int, o_bits:int, o_to_move:bool) -> List[Tuple[int, int]]:
+        """
+        Returns (tile, value) for every legal move, valued for the player making it.
+        """
+        occupied = x_bits | o_bits
+        base = position_index(x_bits, o_bits, False)
+        if o_to_move:
+            # Placing an O adds 2 * 3^tile and hands the move to X
+            return [(tile, -self.values[base + 2 * 3 ** tile]) for tile in range(BOARD_SIZE) if not occupied >> tile & 1]
+        return [(tile, -self.values[base + 3 ** tile + POSITION_COUNT]) for tile in range(BOARD_SIZE) if not occupied >> tile & 1]
+
+solved_table: Optional[SolvedTable] = None
+
+def get_solved_table() -> SolvedTable:
+    """
+    Loads the shipped table if there is one, otherwise solves every position once and keeps the result.
+    """
+    global solved_table
+    if solved_table is None:
+        if os.path.exists(SOLVED_TABLE_PATH):
+            solved_table = SolvedTable.load(SOLVED_TABLE_PATH)
+        else:
+            solved_table = SolvedTable.build()
+    return solved_table
+
+if __name__ == "__main__":
+    SolvedTable.build().save(SOLVED_TABLE_PATH)
+    print(f"Wrote {SOLVED_TABLE_PATH}")
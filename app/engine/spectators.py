@@ -0,0 +1,152 @@
+import os
+import time
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+
+import anyio
+from fastapi import WebSocket
+
+from app.metrics import register_metrics
+
+SPECTATOR_DELAY = float(os.getenv("SPECTATOR_DELAY", "0"))
+MAX_SPECTATORS = 5000
+# Messages a viewer may fall behind before it is conflated to the latest GAME_SYNC
+MAX_LAG = 64
+# Conflations in a row without catching up before a viewer is dropped
+MAX_CONFLATIONS = 3
+SEND_TIMEOUT = 5.0
+
+# seq, published at, encoded event, whether it is a full GAME_SYNC
+Message = Tuple[int, float, str, bool]
+# Published at, encoded event, whether it is a full GAME_SYNC
+Delayed = Tuple[float, str, bool]
+
+spectator_stats = {"conflations": 0, "dropped": 0, "viewers": 0}
+register_metrics("spectators", lambda: dict(spectator_stats))
+
+class Spectator():
+    def __init__(self, websocket: WebSocket, cursor: int):
+        self.websocket = websocket
+        # Seq of the next message this viewer should get
+        self.cursor = cursor
+        self.conflations = 0
+
+class SpectatorHub():
+    """
+    Fans a game's events out to its viewers without the players waiting on them.
+    publish stores the encoded event once in a ring buffer, which makes it O(1) however many viewers there are.
+    With a delay, events wait in a queue and only enter the ring once due, so the ring holds what viewers may see already.
+    Each viewer's own websocket handler drains the ring from its cursor, so the ring caps every viewer's backlog at MAX_LAG.
+    A viewer that falls further behind skips to the latest GAME_SYNC, and one that keeps doing so is dropped.
+    """
+    def __init__(self, delay: float = SPECTATOR_DELAY, max_lag: int = MAX_LAG, max_spectators: int = MAX_SPECTATORS):
+        self.delay = delay
+        self.max_lag = max_lag
+        self.max_spectators = max_spectators
+        self.ring: List[Optional[Message]] = [None] * max_lag
+        self.next_seq = 0
+        self.latest_sync: Optional[Message] = None
+        self.delayed: Deque[Delayed] = deque()
+        self.spectators: Set[Spectator] = set()
+        self.updated: Optional[anyio.Event] = None
+        self.closed = False
+
+    def publish(self, text: str, is_sync: bool):
+        self.delayed.append((time.monotonic(), text, is_sync))
+        self.release()
+        self.notify()
+
+    def release(self):
+        # Moves the delayed events that are due into the ring
+        due = time.monotonic() - self.delay
+        while self.delayed and self.delayed[0][0] <= due:
+            published_at, text, is_sync = self.delayed.popleft()
+            message = (self.next_seq, published_at, text, is_sync)
+            self.ring[self.next_seq % self.max_lag] = message
+            self.next_seq += 1
+            if is_sync:
+                self.latest_sync = message
+
+    def next_release(self) -> Optional[float]:
+        # Seconds until the oldest delayed event is due
+        if not self.delayed:
+            return None
+        return max(self.delayed[0][0] + self.delay - time.monotonic(), 0)
+
+    def notify(self):
+        if self.updated is not None:
+            self.updated.set()
+            self.updated = None
+
+    def close(self):
+        self.closed = True
+        self.notify()
+
+    def add(self, websocket: WebSocket) -> Optional[Spectator]:
+        if self.closed or len(self.spectators) >= self.max_spectators:
+            return None
+        self.release()
+        # New viewers start from the latest full state and follow the events after it
+        cursor = self.latest_sync[0] if self.latest_sync is not None else self.next_seq
+        spectator = Spectator(websocket, cursor)
+        self.spectators.add(spectator)
+        spectator_stats["viewers"] += 1
+        return spectator
+
+    def remove(self, spectator: Spectator):
+        if spectator in self.spectators:
+            self.spectators.remove(spectator)
+            spectator_stats["viewers"] -= 1
+
+    def next_message(self, spectator: Spectator) -> Optional[Message]:
+        self.release()
+        if spectator.cursor >= self.next_seq:
+            # Caught up, so the viewer is keeping pace again
+            spectator.conflations = 0
+            return None
+
+        if self.next_seq - spectator.cursor > self.max_lag:
+            spectator.conflations += 1
+            spectator_stats["conflations"] += 1
+            sync = self.latest_sync
+            if sync is not None and sync[0] >= self.next_seq - self.max_lag:
+                spectator.cursor = sync[0]
+            elif sync is not None:
+                # The latest sync already left the ring, send it and carry on from the oldest message kept
+                spectator.cursor = self.next_seq - self.max_lag
+                return sync
+            else:
+                spectator.cursor = self.next_seq - self.max_lag
+
+        message = self.ring[spectator.cursor % self.max_lag]
+        spectator.cursor += 1
+        return message
+
+    async def serve(self, spectator: Spectator):
+        """
+        Sends the viewer its messages until the game closes or the viewer is dropped.
+        """
+        while True:
+            message = self.next_message(spectator)
+            if message is None:
+                wait = self.next_release()
+                if self.closed and wait is None:
+                    return
+                if self.updated is None:
+                    self.updated = anyio.Event()
+                # Woken by a new event, or when the next delayed one is due
+                with anyio.move_on_after(wait if wait is not None else float("inf")):
+                    await self.updated.wait()
+                continue
+
+            if spectator.conflations > MAX_CONFLATIONS:
+                spectator_stats["dropped"] += 1
+                return
+
+            _, _, text, _ = message
+            try:
+                with anyio.fail_after(SEND_TIMEOUT):
+                    await spectator.websocket.send_text(text)
+            except Exception:
+                spectator_stats["dropped"] += 1
+                return
@@ -0,0 +1,72 @@
+import math
+from typing import Hashable, List
+
+class Timer():
+    def __init__(self, key: Hashable, deadline: int):
+        self.key = key
+        # Absolute tick the timer fires on
+        self.deadline = deadline
+        self.cancelled = False
+
+    def cancel(self):
+        # Cancelled timers stay in their slot and are skipped when it comes up
+        self.cancelled = True
+
+class TimerWheel():
+    """
+    Hierarchical timer wheel. Level 0 has one slot per tick, every level above has slots spanning a full turn of the level below.
+    advance only looks at the current level 0 slot, and a timer moves down a level at most once per level before it fires.
+    Scheduling, cancelling and each tick are O(1) however many timers are pending.
+    """
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 3):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.wheels: List[List[List[Timer]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.now = 0
+        self.pending = 0
+
+    def schedule(self, key: Hashable, delay: float) -> Timer:
+        ticks = max(math.ceil(delay / self.tick), 1)
+        timer = Timer(key, self.now + ticks)
+        self.place(timer)
+        self.pending += 1
+        return timer
+
+    def place(self, timer: Timer):
+        remaining = timer.deadline - self.now
+        for level in range(self.levels):
+            if remaining < self.slots ** (level + 1):
+                slot = timer.deadline // self.slots ** level % self.slots
+                self.wheels[level][slot].append(timer)
+                return
+        # Past the last level's horizon, park it in the furthest slot and place it again when that slot cascades
+        top = self.levels - 1
+        slot = (self.now + self.slots ** self.levels - 1) // self.slots ** top % self.slots
+        self.wheels[top][slot].append(timer)
+
+    def cascade(self, level: int):
+        slot = self.now // self.slots ** level % self.slots
+        timers = self.wheels[level][slot]
+        self.wheels[level][slot] = []
+        for timer in timers:
+            if timer.cancelled:
+                self.pending -= 1
+            else:
+                self.place(timer)
+
+    def advance(self) -> List[Timer]:
+        """
+        Moves the wheel one tick forward and returns the timers that fired on it.
+        """
+        self.now += 1
+        # Higher levels come down first so their timers can land in the slots cascaded right after
+        for level in range(self.levels - 1, 0, -1):
+            if self.now % self.slots ** level == 0:
+                self.cascade(level)
+
+        slot = self.now % self.slots
+        timers = self.wheels[0][slot]
+        self.wheels[0][slot] = []
+        self.pending -= len(timers)
+        return [timer for timer in timers if not timer.cancelled]
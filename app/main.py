@@ -1,9 +1,51 @@
+from contextlib import asynccontextmanager
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routers import auth, game, lobby
+from app.backplane import BACKPLANE_URL, backplane
+from app.db.db import async_engine, engine as db_engine
+from app.db.migrations import migrate
+from app.engine.engine import get_engine
+from app.engine.snapshot import ENGINE_SNAPSHOT_PATH
+from app.metrics import collect_metrics
+from app.ratings import ratings
+from app.routers import auth, game, leaderboard, lobby, matchmaking
+from app.sharding import ShardRouter, serve_tunnels
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The schema is brought up to date before anything reads it
+    await anyio.to_thread.run_sync(lambda: migrate(db_engine, report=print))
+    engine = get_engine()
+    # Picks up the lobbies and games the previous process left, players reattach to them
+    engine.restore_state(ENGINE_SNAPSHOT_PATH)
+    # Ratings are read once here, from then on games keep them current in memory
+    await anyio.to_thread.run_sync(ratings.load)
+    async with anyio.create_task_group() as task_group:
+        # Background workers run for the lifetime of the app and are cancelled on shutdown
+        task_group.start_soon(engine.run_reaper)
+        task_group.start_soon(engine.matchmaking.run)
+        # Nodes sharing a backplane serve each other's players through it
+        if BACKPLANE_URL:
+            task_group.start_soon(backplane.run)
+            task_group.start_soon(serve_tunnels, app, backplane)
+        if engine.archive is not None:
+            task_group.start_soon(engine.archive.run)
+        if engine.result_writer is not None:
+            task_group.start_soon(engine.result_writer.run)
+        yield
+        task_group.cancel_scope.cancel()
+
+    # Write out whatever the workers had not flushed yet
+    if engine.archive is not None:
+        await engine.archive.flush()
+    if engine.result_writer is not None:
+        await engine.result_writer.flush()
+    engine.save_state(ENGINE_SNAPSHOT_PATH)
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ['https://tictactoe.alperdegre.com','https://ttt.alperdegre.com']
 
@@ -15,10 +57,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Requests for codes owned by another worker are forwarded to it
+app.add_middleware(ShardRouter, backplane=backplane if BACKPLANE_URL else None)
+
 app.include_router(auth.router)
 app.include_router(lobby.router)
 app.include_router(game.router)
+app.include_router(matchmaking.router)
+app.include_router(leaderboard.router)
 
 @app.get("/hello-world")
 async def root():
-    return {"message":"Hello World"}
\ No newline at end of file
+    return {"message":"Hello World"}
+
+@app.get("/metrics")
+async def metrics():
+    return collect_metrics()
\ No newline at end of file
@@ -0,0 +1,44 @@
+import math
+from collections import deque
+from typing import Callable, Deque, Dict
+
+class LatencyStats():
+    """
+    Keeps totals for every observation and a rolling window of recent samples for percentiles.
+    """
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        if len(self.samples) == 0:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+        return ordered[rank]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+metric_providers: Dict[str, Callable[[], dict]] = {}
+
+def register_metrics(name: str, provider: Callable[[], dict]):
+    metric_providers[name] = provider
+
+def collect_metrics() -> dict:
+    return {name: provider() for name, provider in metric_providers.items()}
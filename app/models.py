@@ -1,6 +1,8 @@
 import datetime
-from typing import List 
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+
+MAX_BOARD_SIDE = 19
 
 class AuthRequest(BaseModel):
     username: str
@@ -21,7 +23,53 @@ class LobbyUser(BaseModel):
     id: str
     username: str
 
+class BoardSettings(BaseModel):
+    rows: int = Field(default=3, ge=3, le=MAX_BOARD_SIDE)
+    columns: int = Field(default=3, ge=3, le=MAX_BOARD_SIDE)
+    win_length: int = Field(default=3, ge=3)
+
+    @model_validator(mode="after")
+    def check_win_length(self):
+        # No line on the board is longer than its longest side
+        if self.win_length > max(self.rows, self.columns):
+            raise ValueError("win_length does not fit on the board")
+        return self
+
 class ListedLobby(BaseModel):
     code: str
     owner: str
-    players: List[LobbyUser]
\ No newline at end of file
+    players: List[LobbyUser]
+    board_settings: BoardSettings = BoardSettings()
+
+class GameReplay(BaseModel):
+    code: str
+    # X first, then O
+    players: List[str]
+    started_at: int
+    ended_at: int
+    board_settings: BoardSettings
+    first_mark: str
+    moves: List[int]
+    winner: Optional[str]
+    abandoned: bool
+    # Player ids longer than the archive keeps were cut, the ones in players are prefixes
+    ids_truncated: bool = False
+
+class LeaderboardEntry(BaseModel):
+    user_id: int
+    username: str
+    rating: float
+    games_played: int
+    rank: int
+
+class LeaderboardPage(BaseModel):
+    players: List[LeaderboardEntry]
+    next_cursor: Optional[str]
+
+class PlayerRank(BaseModel):
+    user_id: int
+    rating: float
+    games_played: int
+    rank: int
+    # Rated players in total
+    players: int
@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Any, Callable, Tuple
+from weakref import WeakKeyDictionary
+
+import anyio
+import anyio.lowlevel
+import anyio.to_process
+
+from app.metrics import LatencyStats, register_metrics
+from app.utils import compare_password, hash_password
+
+# Worker processes doing bcrypt, each one keeps a core busy for the length of a hash
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 1)))
+# Requests allowed to wait for a worker, past this signup and login fail fast
+PASSWORD_QUEUE = int(os.getenv("PASSWORD_QUEUE", "64"))
+
+class PasswordPoolFull(Exception):
+    pass
+
+def timed_call(func: Callable[..., Any], *args) -> Tuple[Any, float]:
+    # Runs in the worker, the start time tells the caller how long the job was queued
+    started = time.time()
+    return func(*args), started
+
+class PasswordPool():
+    """
+    Runs bcrypt in worker processes so a hash never blocks the event loop, and with it every live game socket.
+    At most workers jobs run at once and max_queue more wait, anything over that is rejected straight away.
+    """
+    def __init__(self, workers: int = PASSWORD_WORKERS, max_queue: int = PASSWORD_QUEUE):
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        # Jobs submitted and not finished yet, running or waiting for a worker
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait = LatencyStats()
+        self.work = LatencyStats()
+        # A limiter of the pool's own, other to_process users keep anyio's default one
+        self.limiters: "WeakKeyDictionary[object, anyio.CapacityLimiter]" = WeakKeyDictionary()
+
+    @property
+    def queued(self) -> int:
+        return max(self.pending - self.workers, 0)
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordPoolFull()
+
+        limiter = self.limiter()
+
+        self.pending += 1
+        submitted = time.time()
+        try:
+            result, started = await anyio.to_process.run_sync(timed_call, func, *args, limiter=limiter)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.wait.observe(max(started - submitted, 0.0))
+        self.work.observe(max(time.time() - started, 0.0))
+        return result
+
+    def limiter(self) -> anyio.CapacityLimiter:
+        # Limiters belong to the event loop they were made in, so each loop gets its own
+        token = anyio.lowlevel.current_token()
+        limiter = self.limiters.get(token)
+        if limiter is None:
+            limiter = self.limiters[token] = anyio.CapacityLimiter(self.workers)
+        return limiter
+
+    async def hash(self, password: str) -> bytes:
+        return await self.run(hash_password, password)
+
+    async def verify(self, hashed: str, password: str) -> bool:
+        return await self.run(compare_password, hashed, password)
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait": self.wait.snapshot(),
+            "work": self.work.snapshot(),
+        }
+
+password_pool = PasswordPool()
+register_metrics("passwords", password_pool.snapshot)
+
+def get_password_pool():
+    return password_pool
@@ -0,0 +1,188 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.db.db import DEFAULT_RATING, SessionLocal, User
+from app.metrics import register_metrics
+
+# How far a single game can move a rating
+K_FACTOR = 32
+# Ratings are ranked by whole points within this range, anything outside is clamped to it
+MAX_RATING = 4000
+
+class RankTree():
+    """
+    Fenwick tree counting players per whole rating point. Adding a player and counting everyone rated above a point are O(log MAX_RATING).
+    """
+    def __init__(self, size: int = MAX_RATING + 1):
+        self.size = size
+        self.counts = [0] * (size + 1)
+        self.total = 0
+
+    def point(self, rating: float) -> int:
+        return min(max(int(rating), 0), self.size - 1)
+
+    def add(self, rating: float, delta: int = 1):
+        self.total += delta
+        ix = self.point(rating) + 1
+        while ix <= self.size:
+            self.counts[ix] += delta
+            ix += ix & -ix
+
+    def count_at_or_below(self, rating: float) -> int:
+        count = 0
+        ix = self.point(rating) + 1
+        while ix > 0:
+            count += self.counts[ix]
+            ix -= ix & -ix
+        return count
+
+    def count_above(self, rating: float) -> int:
+        return self.total - self.count_at_or_below(rating)
+
+def expected_score(rating: float, opponent: float) -> float:
+    return 1 / (1 + 10 ** ((opponent - rating) / 400))
+
+def elo(x_rating: float, o_rating: float, x_score: float, k: float = K_FACTOR) -> Tuple[float, float]:
+    """
+    New ratings of X and O after a game X scored x_score in, 1 for a win, 0.5 for a tie and 0 for a loss.
+    """
+    change = k * (x_score - expected_score(x_rating, o_rating))
+    return x_rating + change, o_rating - change
+
+def user_key(user_id: str) -> Optional[int]:
+    # Only signed up users are rated, the bot and anyone else are left out
+    return int(user_id) if user_id.isdigit() else None
+
+class Ratings():
+    """
+    Every rated player's rating, kept in memory from the first load on with a RankTree over them, so ranks never scan the table.
+    Game results update it as they are queued, and the changes are written out with the results as increments.
+    Workers each keep their own copy, so the database adds every worker's changes up and the written rows refresh the copy.
+    """
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        # User id to rating and games played
+        self.players: Dict[int, Tuple[float, int]] = {}
+        self.tree = RankTree()
+        self.loaded = False
+        # Rating and games played added to every player since the last write
+        self.dirty: Dict[int, Tuple[float, int]] = {}
+        self.rated_games = 0
+
+    def load(self):
+        with self.session_factory() as session:
+            rows = session.execute(select(User.id, User.rating, User.games_played)).all()
+        self.players = {}
+        self.tree = RankTree()
+        for user_id, rating, games_played in rows:
+            self.players[user_id] = (rating, games_played)
+            self.tree.add(rating)
+        self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def get(self, user_id: int) -> Tuple[float, int]:
+        self.ensure_loaded()
+        return self.players.get(user_id, (DEFAULT_RATING, 0))
+
+    def rating_of(self, user_id: str) -> float:
+        key = user_key(user_id)
+        return self.get(key)[0] if key is not None else DEFAULT_RATING
+
+    def add(self, user_id: int):
+        self.ensure_loaded()
+        if user_id not in self.players:
+            self.players[user_id] = (DEFAULT_RATING, 0)
+            self.tree.add(DEFAULT_RATING)
+
+    def set(self, user_id: int, rating: float, games_played: int):
+        previous = self.players.get(user_id)
+        if previous is not None:
+            self.tree.add(previous[0], -1)
+        self.tree.add(rating)
+        self.players[user_id] = (rating, games_played)
+
+    def change(self, user_id: int, rating_change: float):
+        rating, games_played = self.get(user_id)
+        self.set(user_id, rating + rating_change, games_played + 1)
+        pending_rating, pending_games = self.dirty.get(user_id, (0.0, 0))
+        self.dirty[user_id] = (pending_rating + rating_change, pending_games + 1)
+
+    def rank(self, rating: float) -> int:
+        """
+        Players rated the same, to the whole point, share a rank.
+        """
+        self.ensure_loaded()
+        return self.tree.count_above(rating) + 1
+
+    def record(self, row: dict):
+        """
+        Applies the result row of a finished game. Games with a player who never proved their id are left unrated,
+        anyone could have claimed it.
+        """
+        if not row.get("rated", False):
+            return
+        x_id = user_key(row["x_user_id"])
+        o_id = user_key(row["o_user_id"])
+        if x_id is None or o_id is None or x_id == o_id:
+            return
+        x_rating, _ = self.get(x_id)
+        o_rating, _ = self.get(o_id)
+        winner_id = row["winner_id"]
+        x_score = 0.5 if winner_id is None else 1.0 if winner_id == row["x_user_id"] else 0.0
+
+        new_x_rating, _ = elo(x_rating, o_rating, x_score)
+        # Elo is zero sum, O loses what X gains
+        self.change(x_id, new_x_rating - x_rating)
+        self.change(o_id, x_rating - new_x_rating)
+        self.rated_games += 1
+
+    def take_dirty(self) -> List[dict]:
+        rows = [{"id": user_id, "rating": rating, "games_played": games_played} for user_id, (rating, games_played) in self.dirty.items()]
+        self.dirty = {}
+        return rows
+
+    def restore_dirty(self, rows: List[dict]):
+        # A failed write puts its changes back, on top of any recorded since
+        for row in rows:
+            pending_rating, pending_games = self.dirty.get(row["id"], (0.0, 0))
+            self.dirty[row["id"]] = (pending_rating + row["rating"], pending_games + row["games_played"])
+
+    def write(self, session: Session, rows: List[dict]) -> List[Tuple[int, float, int]]:
+        """
+        Adds the changes to the stored ratings and returns every changed player's rating and games played as stored.
+        """
+        written = []
+        for row in rows:
+            result = session.execute(
+                update(User).where(User.id == row["id"])
+                .values(rating=User.rating + row["rating"], games_played=User.games_played + row["games_played"])
+                .returning(User.id, User.rating, User.games_played)
+            )
+            written.extend(tuple(stored) for stored in result.all())
+        return written
+
+    def refresh(self, rows: List[Tuple[int, float, int]]):
+        """
+        Takes the ratings as stored, other workers' games included, keeping changes recorded since they were written.
+        """
+        for user_id, rating, games_played in rows:
+            pending_rating, pending_games = self.dirty.get(user_id, (0.0, 0))
+            self.set(user_id, rating + pending_rating, games_played + pending_games)
+
+    def snapshot(self) -> dict:
+        return {
+            "players": len(self.players),
+            "rated_games": self.rated_games,
+            "unwritten": len(self.dirty),
+        }
+
+ratings = Ratings()
+register_metrics("ratings", ratings.snapshot)
+
+def get_ratings():
+    return ratings
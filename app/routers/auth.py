@@ -1,67 +1,86 @@
 
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.db import get_db
 from app.db.repository import CreateUserRequest, create_user, get_user_by_username
 from app.models import AuthRequest, AuthResponse, JWTClaims
-from app.utils import compare_password, create_jwt, hash_password
+from app.passwords import PasswordPool, PasswordPoolFull, get_password_pool
+from app.ratings import Ratings, get_ratings
+from app.utils import create_jwt
 
 
 router = APIRouter(
     prefix="/auth"
 )
 
+def pool_full():
+    return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Too many logins at once, try again shortly", headers={"Retry-After": "1"})
+
 @router.post("/signup")
-async def signup(req: AuthRequest, db:Session = Depends(get_db)):
+async def signup(req: AuthRequest, db:AsyncSession = Depends(get_db), ratings:Ratings = Depends(get_ratings), passwords:PasswordPool = Depends(get_password_pool)):
     body = req.model_dump()
     username = body['username']
 
-    existing_user = get_user_by_username(username, db)
+    existing_user = await get_user_by_username(username, db)
 
     if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
     
     password = body['password']
     
-    hashed = hash_password(password)
-
-    user = create_user(CreateUserRequest(username=username, password=hashed), db)
+    try:
+        hashed = await passwords.hash(password)
+    except PasswordPoolFull:
+        raise pool_full()
+
+    try:
+        user = await create_user(CreateUserRequest(username=username, password=hashed), db)
+    except IntegrityError:
+        # Someone signed up with the same name while this password was hashing
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
+    # New players are ranked at the default rating until their first game
+    ratings.add(user.id)
 
-    jwt_claims = JWTClaims(user_id=user['id'], username=username)
+    jwt_claims = JWTClaims(user_id=user.id, username=username)
 
     jwt = create_jwt(jwt_claims)
 
     expiry = jwt_claims.model_dump()['exp']
 
-    response = AuthResponse(token=jwt, user_id=user['id'], username=username, expiry=expiry)
+    response = AuthResponse(token=jwt, user_id=user.id, username=username, expiry=expiry)
 
     return response
 
     
 @router.post("/login")
-async def login(req: AuthRequest, db:Session = Depends(get_db)):
+async def login(req: AuthRequest, db:AsyncSession = Depends(get_db), passwords:PasswordPool = Depends(get_password_pool)):
     body = req.model_dump()
     username = body['username']
     password = body['password']
 
-    existing_user = get_user_by_username(username, db)
+    existing_user = await get_user_by_username(username, db)
 
     if existing_user is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User does not exist")
     
-    is_correct_pw = compare_password(existing_user['password'], password) 
+    try:
+        is_correct_pw = await passwords.verify(existing_user.password, password)
+    except PasswordPoolFull:
+        raise pool_full()
 
     if is_correct_pw is False:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
     
-    jwt_claims = JWTClaims(user_id=existing_user['id'], username=username)
+    # Names match in any case, the token carries the name as it was signed up with
+    jwt_claims = JWTClaims(user_id=existing_user.id, username=existing_user.username)
 
     jwt = create_jwt(jwt_claims)
 
     expiry = jwt_claims.model_dump()['exp']
 
-    response = AuthResponse(token=jwt, user_id=existing_user['id'], username=username, expiry=expiry)
+    response = AuthResponse(token=jwt, user_id=existing_user.id, username=existing_user.username, expiry=expiry)
 
     return response
 
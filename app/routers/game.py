@@ -2,18 +2,63 @@
 
 
 from json import JSONDecodeError
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from typing import Optional
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
 
+from app.dependencies import get_user_id, get_websocket_user_id
+from app.engine.archive import ArchiveReader, get_archive_reader
 from app.engine.engine import GameEngine, get_engine
-from app.engine.game_events import GameStatusEnum, UnauthorizedEvent, UserConnectedEvent, parse_game_event
+from app.engine.game_events import GameStatusEnum, SyncRequestEvent, UnauthorizedEvent, UserConnectedEvent, parse_game_event
 
 
 router = APIRouter(
     prefix="/game",
 )
 
+@router.get("/{game_code}/replay")
+async def get_replay(game_code:str, reader:ArchiveReader = Depends(get_archive_reader), _: int = Depends(get_user_id)):
+    replay = reader.get_replay(game_code)
+    if replay is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Game not found")
+    
+    return replay
+
+@router.websocket("/{game_code}/spectate")
+async def spectate(websocket: WebSocket, game_code:str, engine:GameEngine = Depends(get_engine)):
+    await websocket.accept()
+
+    game = engine.get_game(game_code=game_code)
+    spectator = game.spectators.add(websocket) if game is not None else None
+    # Unknown games and full viewer lists are turned away
+    if spectator is None:
+        await websocket.send_json(UnauthorizedEvent().serialize_event())
+        await websocket.close()
+        return
+
+    async def wait_for_disconnect(cancel_scope: anyio.CancelScope):
+        # Viewers only listen, anything they send is ignored until they leave
+        try:
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(wait_for_disconnect, task_group.cancel_scope)
+            await game.spectators.serve(spectator)
+            task_group.cancel_scope.cancel()
+    finally:
+        game.spectators.remove(spectator)
+
+    try:
+        await websocket.close()
+    except Exception:
+        pass
+
 @router.websocket("/{game_code}")
-async def join_lobby(websocket: WebSocket, game_code:str, engine:GameEngine = Depends(get_engine)):
+async def join_lobby(websocket: WebSocket, game_code:str, engine:GameEngine = Depends(get_engine), token_user_id: Optional[str] = Depends(get_websocket_user_id)):
     await websocket.accept()
     
     # Check if game exists
@@ -38,20 +83,30 @@ async def join_lobby(websocket: WebSocket, game_code:str, engine:GameEngine = De
     
     # Get the user id, connect with it if the user id already exists in game object
     conn_user_id = connected_parsed.data.user_id
-    conn_result = game.connect_user(conn_user_id, websocket)
+    # A signed in player can only connect as themselves
+    if token_user_id is not None and token_user_id != conn_user_id:
+        await websocket.send_json(UnauthorizedEvent().serialize_event())
+        await websocket.close()
+        return
+    # Only players that were in the game before resume it, a first connect to a started game is a plain join
+    is_resume = game.status is GameStatusEnum.STARTED and game.has_joined(conn_user_id)
+    conn_result = game.connect_user(conn_user_id, websocket, connected_parsed.data.protocol, verified=token_user_id is not None)
 
     # If the user wasnt in the lobby, send an Unauthorized event and disconnect the user
     if conn_result is False:
         await websocket.send_json(UnauthorizedEvent().serialize_event())
         await websocket.close()
         return
+    elif is_resume:
+    # Users reconnecting to a running game only need to catch up
+        await game.resume(conn_user_id, connected_parsed.data.last_seq)
     else:
     # Else game_sync so new user is broadcast to every user
         await game.game_sync()
     
-    # If game has enough players, start the game
-    if len(game.users) == 2:
-        await game.broadcast_start()
+    # Once every player is connected, start the game
+    if not is_resume:
+        await game.start_game()
 
     try:
         while True:
@@ -61,6 +116,11 @@ async def join_lobby(websocket: WebSocket, game_code:str, engine:GameEngine = De
             if event is None:
                 return
 
+            # Delta clients ask for a full sync when they notice a sequence gap
+            if event.__class__ is SyncRequestEvent:
+                await game.send_snapshot(conn_user_id)
+                continue
+
             # With every step check if game is over
             is_over = await game.game_loop(conn_user_id, event)
 
@@ -68,7 +128,16 @@ async def join_lobby(websocket: WebSocket, game_code:str, engine:GameEngine = De
             if is_over is True:
                 engine.close_game(game_code)
                 return
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as e:
+        # The server is restarting, the game goes into the snapshot for players to reattach to
+        if e.code == status.WS_1012_SERVICE_RESTART:
+            return
+        # A newer connection of the same user already took this one's place
+        if game.websockets.get(conn_user_id, websocket) is not websocket:
+            return
+        # Dropped players get a grace window to reconnect before the game is given up
+        if await game.wait_for_resume(conn_user_id):
+            return
         # If game isnt ended and a user Disconnects, disconnect the other user and close the game
         if game.status is not GameStatusEnum.ENDED:
             await game.handle_disconnect(conn_user_id)
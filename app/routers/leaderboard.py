@@ -0,0 +1,34 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.db import get_db
+from app.db.repository import get_leaderboard
+from app.dependencies import get_user_id
+from app.models import LeaderboardEntry, LeaderboardPage, PlayerRank
+from app.ratings import Ratings, get_ratings
+
+router = APIRouter(
+    prefix="/leaderboard",
+)
+
+@router.get("")
+async def leaderboard(cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=200), db:AsyncSession = Depends(get_db), ratings:Ratings = Depends(get_ratings)) -> LeaderboardPage:
+    # Cursors are the rating and id of the last player on the previous page
+    after = None
+    if cursor:
+        try:
+            rating, user_id = cursor.split("_")
+            after = (float(rating), int(user_id))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    rows = await get_leaderboard(limit, db, after)
+    players = [LeaderboardEntry(user_id=user_id, username=username, rating=rating, games_played=games_played, rank=ratings.rank(rating)) for user_id, username, rating, games_played in rows]
+    next_cursor = f"{players[-1].rating!r}_{players[-1].user_id}" if len(players) == limit else None
+    return LeaderboardPage(players=players, next_cursor=next_cursor)
+
+@router.get("/me")
+async def my_rank(ratings:Ratings = Depends(get_ratings), user_id: str = Depends(get_user_id)) -> PlayerRank:
+    rating, games_played = ratings.get(int(user_id))
+    return PlayerRank(user_id=int(user_id), rating=rating, games_played=games_played, rank=ratings.rank(rating), players=ratings.tree.total)
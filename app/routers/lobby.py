@@ -1,30 +1,93 @@
 from json import JSONDecodeError
-from typing import cast
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+from typing import Optional, cast
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
 
-from app.dependencies import get_user_id
+from app.dependencies import get_user_id, get_websocket_user_id
+from app.engine.bot import BotDifficultyEnum
+from app.engine.code_allocator import CodeSpaceExhausted
 from app.engine.engine import GameEngine, get_engine
+from app.engine.lobby_listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from app.engine.lobby_events import CreateLobbyEvent, EventTypeEnum, InvalidEvent, JoinLobbyEvent, LobbyFullEvent, parse_lobby_event
-from app.models import LobbyUser
+from app.models import BoardSettings, LobbyUser
 
 router = APIRouter(
     prefix="/lobby",
 )
 
+def get_board_settings(rows: int = 3, columns: int = 3, win_length: int = 3) -> BoardSettings:
+    try:
+        return BoardSettings(rows=rows, columns=columns, win_length=win_length)
+    except ValidationError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid board settings")
+
 @router.post("/create-lobby")
-async def create_lobby(engine:GameEngine = Depends(get_engine), user_id: int = Depends(get_user_id)):
-    code = engine.create_lobby(user_id)
+async def create_lobby(bot: Optional[BotDifficultyEnum] = None, board_settings: BoardSettings = Depends(get_board_settings), engine:GameEngine = Depends(get_engine), user_id: int = Depends(get_user_id)):
+    # The bot only knows the classic board
+    if bot is not None and board_settings != BoardSettings():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Bots only play on a 3x3 board")
+
+    # Passing a bot difficulty creates a single player lobby against the server side bot
+    try:
+        code = engine.create_lobby(user_id, bot, board_settings)
+    except CodeSpaceExhausted:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="No lobby codes left, try again later")
 
     return CreateLobbyEvent(data={"code":code}).serialize_event()
 
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
 @router.get("/get-lobbies")
-async def get_lobbies(engine:GameEngine = Depends(get_engine), _: int = Depends(get_user_id)):
-    lobbies = engine.get_lobbies()
-    
-    return {"lobbies":lobbies}
+async def get_lobbies(request: Request, cursor: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), open_only: bool = False, engine:GameEngine = Depends(get_engine), _: int = Depends(get_user_id)):
+    # Cursors are the next_cursor of the previous page, leaving it out starts from the top
+    try:
+        position = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    page = engine.listing.page(position, limit, open_only)
+    # Pollers send back the ETag they got, an unchanged page costs them an empty reply
+    if etag_matches(request, page.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": page.etag})
+    return Response(page.body, media_type="application/json", headers={"ETag": page.etag})
+
+@router.websocket("/feed")
+async def lobby_feed(websocket: WebSocket, engine:GameEngine = Depends(get_engine)):
+    await websocket.accept()
+
+    subscriber = engine.feed.add(websocket)
+    if subscriber is None:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    async def wait_for_disconnect(cancel_scope: anyio.CancelScope):
+        # Subscribers only listen, anything they send is ignored until they leave
+        try:
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(wait_for_disconnect, task_group.cancel_scope)
+            await engine.feed.serve(subscriber)
+            task_group.cancel_scope.cancel()
+    finally:
+        engine.feed.remove(subscriber)
+
+    try:
+        await websocket.close()
+    except Exception:
+        pass
 
 @router.websocket("/join-lobby/{lobby_code}")
-async def join_lobby(websocket: WebSocket, lobby_code:str, engine:GameEngine = Depends(get_engine)):
+async def join_lobby(websocket: WebSocket, lobby_code:str, engine:GameEngine = Depends(get_engine), token_user_id: Optional[str] = Depends(get_websocket_user_id)):
     await websocket.accept()
 
     # Check user's initial join event
@@ -42,6 +105,11 @@ async def join_lobby(websocket: WebSocket, lobby_code:str, engine:GameEngine = D
         return
     
     lobby_user = cast(LobbyUser, join_event.data)
+    # A signed in player can only join as themselves
+    if token_user_id is not None and token_user_id != lobby_user.id:
+        await websocket.send_json(InvalidEvent().serialize_event())
+        await websocket.close()
+        return
 
     # Get the lobby
     lobby = engine.get_lobby(lobby_code)
@@ -52,7 +120,7 @@ async def join_lobby(websocket: WebSocket, lobby_code:str, engine:GameEngine = D
         return
     else:
         # Join the lobby if its not full
-        result = await lobby.join(lobby_user, websocket)
+        result = await lobby.join(lobby_user, websocket, verified=token_user_id is not None)
         if result is False:
             await websocket.send_json(LobbyFullEvent().serialize_event())
             await websocket.close()
@@ -78,7 +146,10 @@ async def join_lobby(websocket: WebSocket, lobby_code:str, engine:GameEngine = D
                 else:
                     await lobby.start(code=game_code)
 
-    except WebSocketDisconnect:
+    except WebSocketDisconnect as e:
+        # The server is restarting, members keep their seats in the snapshot
+        if e.code == status.WS_1012_SERVICE_RESTART:
+            return
         # In case of disconnect check how many users left on the lobby
         users_in_lobby = await lobby.leave(lobby_user)
         # If no one left, close the lobby to free up memory
@@ -0,0 +1,67 @@
+from json import JSONDecodeError
+from typing import Optional, cast
+import anyio
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
+
+from app.dependencies import get_websocket_user_id
+from app.engine.engine import GameEngine, get_engine
+from app.engine.lobby_events import InvalidEvent, JoinQueueEvent, MatchFoundEvent, parse_lobby_event
+from app.models import LobbyUser
+from app.ratings import Ratings, get_ratings
+
+router = APIRouter(
+    prefix="/matchmaking",
+)
+
+@router.websocket("")
+async def matchmaking(websocket: WebSocket, engine:GameEngine = Depends(get_engine), ratings:Ratings = Depends(get_ratings), token_user_id: Optional[str] = Depends(get_websocket_user_id)):
+    await websocket.accept()
+
+    # Players queue with a JoinQueueEvent, the same way they join a lobby
+    try:
+        init_request = await websocket.receive_json()
+    except (WebSocketDisconnect, JSONDecodeError):
+        await websocket.close()
+        return
+
+    join_event = parse_lobby_event(init_request)
+    if join_event is None or join_event.__class__ is not JoinQueueEvent:
+        await websocket.send_json(InvalidEvent().serialize_event())
+        await websocket.close()
+        return
+
+    user = cast(LobbyUser, join_event.data)
+    # A signed in player can only queue as themselves
+    if token_user_id is not None and token_user_id != user.id:
+        await websocket.send_json(InvalidEvent().serialize_event())
+        await websocket.close()
+        return
+
+    ticket = engine.matchmaking.join(user, ratings.rating_of(user.id))
+    # Already waiting on another socket
+    if ticket is None:
+        await websocket.send_json(InvalidEvent().serialize_event())
+        await websocket.close()
+        return
+
+    async def wait_for_disconnect(cancel_scope: anyio.CancelScope):
+        try:
+            while True:
+                await websocket.receive_text()
+        except Exception:
+            cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(wait_for_disconnect, task_group.cancel_scope)
+            await ticket.matched.wait()
+            # Matched players head to the game the same way lobbies send them off
+            await websocket.send_json(MatchFoundEvent(data={"code": ticket.game_code}).serialize_event())
+            task_group.cancel_scope.cancel()
+    finally:
+        engine.matchmaking.leave(ticket)
+
+    try:
+        await websocket.close()
+    except Exception:
+        pass
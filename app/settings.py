@@ -0,0 +1,45 @@
+import os
+from pydantic import BaseModel
+
+class Settings(BaseModel):
+    """
+    Configuration read from the environment once, when the app starts, instead of on every request.
+    """
+    jwt_secret: str = ""
+    jwt_algorithm: str = "HS256"
+    # Verified tokens kept so repeat requests skip the signature check
+    token_cache_size: int = 10000
+    # Longest a cached token is trusted before it is verified again, its exp still applies within it
+    token_cache_ttl: float = 300
+    # Requests use the async driver, background workers get the same database through its sync driver
+    database_url: str = "sqlite+aiosqlite:///tictactoe.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    # WAL lets readers carry on during a write, NORMAL only syncs at checkpoints which WAL keeps safe
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    # Negative sizes are in KiB
+    sqlite_cache_size: int = -64000
+    sqlite_busy_timeout: int = 5000
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            jwt_secret=os.getenv("JWT_SECRET", ""),
+            token_cache_size=int(os.getenv("TOKEN_CACHE_SIZE", "10000")),
+            token_cache_ttl=float(os.getenv("TOKEN_CACHE_TTL", "300")),
+            database_url=os.getenv("DATABASE_URL", "sqlite+aiosqlite:///tictactoe.db"),
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            sqlite_journal_mode=os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+            sqlite_synchronous=os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+            sqlite_cache_size=int(os.getenv("SQLITE_CACHE_SIZE", "-64000")),
+            sqlite_busy_timeout=int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000")),
+        )
+
+settings = Settings.from_env()
+
+def get_settings():
+    return settings
@@ -0,0 +1,404 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+import anyio
+import httpx
+import websockets
+from starlette.types import ASGIApp, Receive, Scope, Send
+from websockets.exceptions import ConnectionClosed
+
+from app.backplane import Backplane, BackplaneUnavailable
+from app.engine.lobby_listing import DEFAULT_PAGE_SIZE
+
+# Set per worker by app.cluster, a single worker owns every code
+SHARD_ID = int(os.getenv("SHARD_ID", "0"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "/tmp/ttt_shards")
+# Marks requests one worker forwarded to another, these are always served locally
+HOP_HEADER = b"x-shard-hop"
+PROXY_TIMEOUT = 10.0
+# Seconds to wait for the owning node to pick up a tunnel before giving up on it
+TUNNEL_TIMEOUT = 5.0
+# Scope keys the owning node needs to serve a tunneled request, the rest only make sense in the receiving process
+tunneled_scope_keys = ("type", "http_version", "method", "scheme", "path", "raw_path", "query_string", "root_path", "headers", "client", "server", "subprotocols")
+
+# Paths carrying a lobby or game code, the code decides which worker serves them
+sharded_paths = [
+    re.compile(r"^/lobby/join-lobby/(?P<code>[^/]+)$"),
+    re.compile(r"^/game/(?P<code>[^/]+)(/spectate|/replay)?$"),
+]
+# Listings every worker holds a part of
+merged_paths = {"/lobby/get-lobbies": "lobbies"}
+
+def shard_of(code:str, shard_count:int = SHARD_COUNT) -> Optional[int]:
+    """
+    Codes are hex numbers congruent to their shard modulo the shard count. Returns None for anything else.
+    """
+    try:
+        return int(code, 16) % shard_count
+    except ValueError:
+        return None
+
+def socket_path(shard_id:int, socket_dir:str = SHARD_SOCKET_DIR) -> str:
+    return os.path.join(socket_dir, f"shard_{shard_id}.sock")
+
+def code_shard(path:str, shard_count:int) -> Optional[int]:
+    for pattern in sharded_paths:
+        match = pattern.match(path)
+        if match is not None:
+            return shard_of(match.group("code"), shard_count)
+    return None
+
+def to_json(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
+
+def from_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "__bytes__" in value:
+            return base64.b64decode(value["__bytes__"])
+        return {key: from_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [from_json(item) for item in value]
+    return value
+
+def pack(message: dict) -> bytes:
+    return json.dumps(to_json(message)).encode()
+
+def unpack(data: bytes) -> dict:
+    return from_json(json.loads(data))
+
+async def serve_tunnel(app: ASGIApp, backplane: Backplane, request: dict, shard_id: int):
+    """
+    Serves one request tunneled from another node. ASGI messages arrive on the tunnel's up channel and go back on its down channel.
+    """
+    scope = {key: value for key, value in request["scope"].items()}
+    scope["headers"] = [(name, value) for name, value in scope["headers"]] + [(HOP_HEADER, str(shard_id).encode())]
+    for key in ("client", "server"):
+        if scope.get(key) is not None:
+            scope[key] = tuple(scope[key])
+    down = f"tunnel:{request['id']}:down"
+    disconnect = {"type": "http.disconnect"} if scope["type"] == "http" else {"type": "websocket.disconnect", "code": 1006}
+
+    try:
+        up = await backplane.subscribe(f"tunnel:{request['id']}:up")
+    except BackplaneUnavailable as e:
+        # The node that opened the tunnel times out waiting for it to be ready
+        print(f"Tunnel could not be served: {str(e)}")
+        return
+
+    async with up:
+        try:
+            await backplane.publish(down, pack({"type": "tunnel.ready"}))
+        except BackplaneUnavailable as e:
+            print(f"Tunnel could not be served: {str(e)}")
+            return
+
+        async def receive() -> dict:
+            try:
+                return unpack(await up.receive())
+            except anyio.EndOfStream:
+                return disconnect
+
+        async def send(message: dict):
+            await backplane.publish(down, pack(message))
+
+        try:
+            await app(scope, receive, send)
+        except Exception as e:
+            print(f"Tunneled request failed: {str(e)}")
+        finally:
+            with anyio.CancelScope(shield=True):
+                try:
+                    await backplane.publish(down, pack({"type": "tunnel.end"}))
+                except BackplaneUnavailable:
+                    pass
+
+async def serve_tunnels(app: ASGIApp, backplane: Backplane, shard_id: int = SHARD_ID):
+    """
+    Serves requests other nodes tunnel to this shard over the backplane. Runs until cancelled.
+    """
+    while True:
+        try:
+            requests = await backplane.subscribe(f"shard:{shard_id}")
+            break
+        except BackplaneUnavailable as e:
+            # Every attempt waits out the subscribe timeout, so this retries at that pace
+            print(f"Listening for tunnels failed, retrying: {str(e)}")
+
+    async with requests:
+        async with anyio.create_task_group() as task_group:
+            async for request in requests:
+                task_group.start_soon(serve_tunnel, app, backplane, unpack(request), shard_id)
+
+class ShardRouter():
+    """
+    ASGI middleware that sends requests for codes owned by another worker to that worker,
+    over its unix socket or, when nodes share a backplane, tunneled through it.
+    Lobby listings are gathered from every worker. Everything else is served by whichever worker got the request.
+    """
+    def __init__(self, app: ASGIApp, shard_id: int = SHARD_ID, shard_count: int = SHARD_COUNT, socket_dir: str = SHARD_SOCKET_DIR, backplane: Optional[Backplane] = None):
+        self.app = app
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.socket_dir = socket_dir
+        self.backplane = backplane
+        self.clients: Dict[int, httpx.AsyncClient] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if self.shard_count == 1 or scope["type"] not in ("http", "websocket") or HOP_HEADER in dict(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        shard = code_shard(scope["path"], self.shard_count)
+        if shard is not None and shard != self.shard_id:
+            if self.backplane is not None:
+                await self.tunnel(scope, receive, send, shard)
+            elif scope["type"] == "http":
+                await self.proxy_http(scope, receive, send, shard)
+            else:
+                await self.proxy_websocket(scope, receive, send, shard)
+            return
+
+        if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] in merged_paths:
+            await self.merge_http(scope, receive, send, merged_paths[scope["path"]])
+            return
+
+        await self.app(scope, receive, send)
+
+    def get_client(self, shard:int) -> httpx.AsyncClient:
+        client = self.clients.get(shard)
+        if client is None:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path(shard, self.socket_dir))
+            client = httpx.AsyncClient(transport=transport, base_url=f"http://shard{shard}", timeout=PROXY_TIMEOUT)
+            self.clients[shard] = client
+        return client
+
+    def forward_headers(self, scope: Scope) -> List[Tuple[bytes, bytes]]:
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"host", b"content-length")]
+        headers.append((HOP_HEADER, str(self.shard_id).encode()))
+        return headers
+
+    async def read_body(self, receive: Receive) -> bytes:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                return body
+
+    async def forward_http(self, scope: Scope, body: bytes, shard: int) -> httpx.Response:
+        if self.backplane is not None:
+            return await self.tunnel_http(scope, body, shard)
+        url = scope["path"]
+        if scope["query_string"]:
+            url += "?" + scope["query_string"].decode("latin-1")
+        return await self.get_client(shard).request(scope["method"], url, headers=self.forward_headers(scope), content=body)
+
+    async def send_response(self, send: Send, status_code: int, headers: List[Tuple[bytes, bytes]], content: bytes):
+        headers = [(name, value) for name, value in headers if name.lower() not in (b"content-length", b"transfer-encoding")]
+        headers.append((b"content-length", str(len(content)).encode()))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
+
+    async def proxy_http(self, scope: Scope, receive: Receive, send: Send, shard: int):
+        body = await self.read_body(receive)
+        try:
+            response = await self.forward_http(scope, body, shard)
+        except httpx.HTTPError:
+            await self.send_response(send, 502, [(b"content-type", b"application/json")], b'{"detail":"Shard unavailable"}')
+            return
+        await self.send_response(send, response.status_code, response.headers.raw, response.content)
+
+    async def merge_http(self, scope: Scope, receive: Receive, send: Send, key: str):
+        """
+        Pages through the listing one worker after another. Cursors are the worker a page stopped on and that worker's own cursor.
+        """
+        body = await self.read_body(receive)
+        query = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+        try:
+            shard, cursor = (int(part) for part in (query.get("cursor") or "0-0").split("-"))
+        except ValueError:
+            shard, cursor = self.shard_count, 0
+        limit_param = query.get("limit", str(DEFAULT_PAGE_SIZE))
+        # Anything but a positive number is passed on for the worker to reject
+        limit = int(limit_param) if limit_param.isdigit() else 0
+        if not 0 <= shard < self.shard_count:
+            await self.send_response(send, 400, [(b"content-type", b"application/json")], b'{"detail":"Invalid cursor"}')
+            return
+
+        # Workers are asked unconditionally, the merged page gets its own ETag
+        headers = [(name, value) for name, value in scope["headers"] if name != b"if-none-match"]
+        items = []
+        etags = []
+        next_cursor: Optional[str] = None
+        for shard in range(shard, self.shard_count):
+            params = {**query, "limit": str(limit - len(items)) if limit else limit_param, "cursor": str(cursor) if cursor else ""}
+            cursor = 0
+            try:
+                response = await self.forward_http({**scope, "headers": headers, "query_string": urlencode(params).encode()}, body, shard)
+            except httpx.HTTPError:
+                # A worker that is down only hides its own lobbies
+                continue
+            if response.status_code == 502:
+                continue
+            # Errors such as a missing token come back the same from every worker
+            if response.status_code != 200:
+                await self.send_response(send, response.status_code, response.headers.raw, response.content)
+                return
+
+            page = response.json()
+            items.extend(page[key])
+            etags.append(response.headers.get("etag", ""))
+            if page["next_cursor"] is not None:
+                next_cursor = f"{shard}-{page['next_cursor']}"
+                break
+            if len(items) >= limit:
+                next_cursor = f"{shard + 1}-0" if shard + 1 < self.shard_count else None
+                break
+
+        etag = f'"{hashlib.blake2b(json.dumps([etags, next_cursor]).encode(), digest_size=8).hexdigest()}"'
+        if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode("latin-1")
+        if any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")):
+            await self.send_response(send, 304, [(b"etag", etag.encode())], b"")
+            return
+        content = json.dumps({key: items, "next_cursor": next_cursor}).encode()
+        await self.send_response(send, 200, [(b"content-type", b"application/json"), (b"etag", etag.encode())], content)
+
+    async def proxy_websocket(self, scope: Scope, receive: Receive, send: Send, shard: int):
+        # The websockets client only runs on asyncio, which is what uvicorn serves the app on
+        connect = await receive()
+        if connect["type"] != "websocket.connect":
+            return
+
+        uri = f"ws://shard{shard}{scope['path']}"
+        if scope["query_string"]:
+            uri += "?" + scope["query_string"].decode("latin-1")
+        try:
+            upstream = await websockets.unix_connect(socket_path(shard, self.socket_dir), uri, extra_headers=[(HOP_HEADER.decode(), str(self.shard_id))])
+        except (OSError, websockets.InvalidHandshake):
+            await send({"type": "websocket.close", "code": 1011})
+            return
+        await send({"type": "websocket.accept"})
+
+        async def client_to_upstream(cancel_scope: anyio.CancelScope):
+            try:
+                while True:
+                    message = await receive()
+                    if message["type"] == "websocket.disconnect":
+                        break
+                    if message.get("text") is not None:
+                        await upstream.send(message["text"])
+                    elif message.get("bytes") is not None:
+                        await upstream.send(message["bytes"])
+            except ConnectionClosed:
+                pass
+            cancel_scope.cancel()
+
+        async def upstream_to_client(cancel_scope: anyio.CancelScope):
+            try:
+                async for data in upstream:
+                    if isinstance(data, str):
+                        await send({"type": "websocket.send", "text": data})
+                    else:
+                        await send({"type": "websocket.send", "bytes": data})
+            except ConnectionClosed:
+                pass
+            # 1005 and 1006 only describe a close without a status, they can't be sent on
+            code = upstream.close_code if upstream.close_code not in (None, 1005, 1006) else 1000
+            await send({"type": "websocket.close", "code": code})
+            cancel_scope.cancel()
+
+        # Whichever side closes first ends both directions
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(client_to_upstream, task_group.cancel_scope)
+            task_group.start_soon(upstream_to_client, task_group.cancel_scope)
+        await upstream.close()
+
+    async def tunnel(self, scope: Scope, receive: Receive, send: Send, shard: int):
+        """
+        Relays the request's ASGI messages to the owning node over the backplane and its replies back.
+        """
+        tunnel_id = uuid.uuid4().hex
+        up = f"tunnel:{tunnel_id}:up"
+        try:
+            down = await self.backplane.subscribe(f"tunnel:{tunnel_id}:down")
+        except BackplaneUnavailable:
+            await self.send_unavailable(scope, send)
+            return
+
+        async with down:
+            request = {"id": tunnel_id, "scope": {key: scope[key] for key in tunneled_scope_keys if key in scope}}
+            ready = None
+            try:
+                await self.backplane.publish(f"shard:{shard}", pack(request))
+                with anyio.move_on_after(TUNNEL_TIMEOUT):
+                    ready = await down.receive()
+            except BackplaneUnavailable:
+                pass
+            if ready is None:
+                await self.send_unavailable(scope, send)
+                return
+
+            async def client_to_owner(cancel_scope: anyio.CancelScope):
+                while True:
+                    message = await receive()
+                    try:
+                        await self.backplane.publish(up, pack(message))
+                    except BackplaneUnavailable:
+                        # Nothing more reaches the owner, end the tunnel
+                        cancel_scope.cancel()
+                        return
+                    if message["type"] in ("http.disconnect", "websocket.disconnect"):
+                        return
+
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(client_to_owner, task_group.cancel_scope)
+                try:
+                    async for data in down:
+                        message = unpack(data)
+                        if message["type"] == "tunnel.end":
+                            break
+                        await send(message)
+                except Exception:
+                    # The client is gone, the owner finds out from the disconnect sent up
+                    pass
+                task_group.cancel_scope.cancel()
+
+    async def send_unavailable(self, scope: Scope, send: Send):
+        if scope["type"] == "http":
+            await self.send_response(send, 502, [(b"content-type", b"application/json")], b'{"detail":"Shard unavailable"}')
+        else:
+            await send({"type": "websocket.close", "code": 1011})
+
+    async def tunnel_http(self, scope: Scope, body: bytes, shard: int) -> httpx.Response:
+        sent = False
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def receive() -> dict:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await anyio.sleep_forever()
+
+        async def send(message: dict):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.tunnel(scope, receive, send, shard)
+        return httpx.Response(start.get("status", 502), headers=start.get("headers", []), content=b"".join(chunks))
@@ -1,24 +1,35 @@
+import os
+import tempfile
 from unittest.mock import AsyncMock
 from fastapi.testclient import TestClient
 from httpx import ASGITransport, AsyncClient
 import pytest
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
-from app.db.db import Base, get_db
+from sqlalchemy.pool import NullPool
+from app.db.db import Base, apply_sqlite_pragmas, get_db, sync_url
 from app.dependencies import get_user_id
 from app.engine.engine import GameEngine, get_engine
 from app.models import LobbyUser
 from app.main import app
+from app.ratings import Ratings, get_ratings
+from app.settings import Settings
 
-DATABASE_URL = "sqlite:///"
+# A file rather than memory, so the sync and async engines see the same database
+DATABASE_URL = f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+test_settings = Settings(database_url=DATABASE_URL)
 engine = create_engine(
-    DATABASE_URL,
+    sync_url(DATABASE_URL),
     connect_args={"check_same_thread":False},
-    poolclass=StaticPool
 )
+# Test clients run every request on a new event loop, so async connections are not pooled
+async_engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+apply_sqlite_pragmas(engine, test_settings)
+apply_sqlite_pragmas(async_engine.sync_engine, test_settings)
 
 TestingSessionLocal = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 test_game_engine = GameEngine()
 
 @pytest.fixture()
@@ -35,21 +46,41 @@ def session():
     finally:
         db.close()
 
+@pytest.fixture()
+async def async_session(session):
+    """
+    An async session on the same fresh database as session.
+    """
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+async def override_get_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+@pytest.fixture()
+def session_factory(session):
+    """
+    Returns the sessionmaker of the fresh test database, for code that opens its own sessions.
+    """
+    return TestingSessionLocal
+
+@pytest.fixture()
+def ratings(session):
+    """
+    Ratings read from the fresh test database.
+    """
+    return Ratings(TestingSessionLocal)
+
 @pytest.fixture()
 def game_engine():
     return test_game_engine
 
 @pytest.fixture()
-def client(session):
+def client(session, ratings):
     """
     Creates a TestClient for route testing. Overrides every dependency to work with tests
     """
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
-
     def override_get_engine():
         return test_game_engine
     
@@ -59,6 +90,7 @@ def client(session):
     app.dependency_overrides[get_db] = override_get_db
     app.dependency_overrides[get_engine] = override_get_engine
     app.dependency_overrides[get_user_id] = override_get_user_id
+    app.dependency_overrides[get_ratings] = lambda: ratings
     
     yield TestClient(app)
 
@@ -74,13 +106,7 @@ def user_id_client(session):
     yield TestClient(app)
 
 @pytest.fixture()
-def async_client(session):
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
-
+def async_client(session, ratings):
     def override_get_engine():
         return test_game_engine
     
@@ -90,6 +116,7 @@ def async_client(session):
     app.dependency_overrides[get_db] = override_get_db
     app.dependency_overrides[get_engine] = override_get_engine
     app.dependency_overrides[get_user_id] = override_get_user_id
+    app.dependency_overrides[get_ratings] = lambda: ratings
 
     yield AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
 
@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import text
+
+from app.db.db import create_engines, sync_url
+from app.settings import Settings
+
+@pytest.fixture
+def anyio_backend():
+    # SQLAlchemy's async engine only runs on asyncio
+    return "asyncio"
+
+def test_sync_url():
+    assert str(sync_url("sqlite+aiosqlite:///tictactoe.db")) == "sqlite:///tictactoe.db"
+    assert sync_url("postgresql+asyncpg://db/ttt").drivername == "postgresql"
+
+@pytest.mark.anyio
+async def test_engines_apply_pragmas(tmp_path):
+    config = Settings(database_url=f"sqlite+aiosqlite:///{tmp_path / 'tuned.db'}", db_pool_size=2, sqlite_cache_size=-1000)
+    async_engine, engine = create_engines(config)
+
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -1000
+    async with async_engine.connect() as connection:
+        assert (await connection.execute(text("PRAGMA busy_timeout"))).scalar() == config.sqlite_busy_timeout
+    assert async_engine.pool.size() == 2
+    await async_engine.dispose()
+    engine.dispose()
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from app.db.db import DEFAULT_RATING, Base
+from app.db.migrations import MIGRATIONS, current_version, migrate
+
+
+def index_names(engine, table):
+    # The inspector skips expression indexes
+    with engine.connect() as connection:
+        return sorted(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"), {"table": table}).scalars())
+
+def test_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    reports = []
+    assert migrate(engine, report=reports.append) == [migration.name for migration in MIGRATIONS]
+    assert migrate(engine, report=reports.append) == []
+    assert reports == []
+    assert current_version(engine) == MIGRATIONS[-1].version
+
+    # Migrating ends up with the same schema the models describe
+    expected = create_engine(f"sqlite:///{tmp_path / 'expected.db'}")
+    Base.metadata.create_all(expected)
+    assert index_names(engine, "user") == index_names(expected, "user")
+    assert {column["name"] for column in inspect(engine).get_columns("user")} == {column["name"] for column in inspect(expected).get_columns("user")}
+
+def test_upgrades_old_database_in_place(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE "user" (id INTEGER PRIMARY KEY, created_at DATETIME, username VARCHAR, password VARCHAR)'))
+        connection.execute(text('CREATE TABLE games (id INTEGER PRIMARY KEY, code VARCHAR, x_user_id VARCHAR, o_user_id VARCHAR, winner_id VARCHAR, total_turns INTEGER, started_at DATETIME, ended_at DATETIME)'))
+        connection.execute(text('INSERT INTO "user" (username, password) VALUES (\'old\', \'pw\'), (\'Alper\', \'pw\'), (\'alper\', \'pw\'), (\'ALPER\', \'pw\')'))
+
+    reports = []
+    assert migrate(engine, report=reports.append) == ["create_tables", "add_rating_columns", "unique_usernames", "add_rated_column"]
+    assert reports == ["Migration unique_usernames: Renamed 2 duplicate usernames"]
+
+    assert {"rating", "games_played"} <= {column["name"] for column in inspect(engine).get_columns("user")}
+    assert "rated" in {column["name"] for column in inspect(engine).get_columns("games")}
+    assert index_names(engine, "user") == ["ix_user_rating", "ix_user_username"]
+    with engine.connect() as connection:
+        rows = connection.execute(text('SELECT id, username, rating, games_played FROM "user" ORDER BY id')).all()
+    assert rows == [(1, "old", DEFAULT_RATING, 0), (2, "Alper", DEFAULT_RATING, 0), (3, "alper_3", DEFAULT_RATING, 0), (4, "ALPER_4", DEFAULT_RATING, 0)]
+
+def test_usernames_unique_regardless_of_case(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'unique.db'}")
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO "user" (username, password) VALUES (\'Alper\', \'pw\')'))
+
+    with pytest.raises(IntegrityError):
+        with engine.begin() as connection:
+            connection.execute(text('INSERT INTO "user" (username, password) VALUES (\'aLPER\', \'pw\')'))
+
+def test_failed_migration_is_retried(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retry.db'}")
+    migrate(engine, MIGRATIONS[:1])
+
+    def broken(connection):
+        connection.execute(text('ALTER TABLE "user" ADD COLUMN half_done INTEGER'))
+        raise RuntimeError("Migration failed")
+
+    with pytest.raises(RuntimeError):
+        migrate(engine, MIGRATIONS[:1] + [type(MIGRATIONS[0])(2, "broken", broken)])
+
+    # Nothing of the failed migration stuck, not even its first statement
+    assert current_version(engine) == 1
+    assert "half_done" not in {column["name"] for column in inspect(engine).get_columns("user")}
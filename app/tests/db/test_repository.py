@@ -1,24 +1,62 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
 
-from app.db.repository import create_user, CreateUserRequest, get_user_by_username
+from app.db.db import DEFAULT_RATING
+from app.db.repository import UserCredentials, UserRow, create_user, create_users, CreateUserRequest, get_user_by_username, get_users_by_usernames
 
+@pytest.fixture
+def anyio_backend():
+    # SQLAlchemy's async sessions only run on asyncio
+    return "asyncio"
 
-def test_create_user(session):
-    user = create_user(CreateUserRequest(username="alper", password="test"), session)
+@pytest.mark.anyio
+async def test_create_user(async_session):
+    user = await create_user(CreateUserRequest(username="alper", password="test"), async_session)
 
-    assert user['username'] == "alper"
-    assert 'password' not in user
-    assert 'created_at' not in user
+    assert user == UserRow(user.id, "alper", DEFAULT_RATING, 0)
+    assert isinstance(user.id, int)
     
-def test_get_user_by_username(session):
-    user = get_user_by_username('test', session)
+@pytest.mark.anyio
+async def test_get_user_by_username(async_session):
+    user = await get_user_by_username('test', async_session)
 
     assert user is None
 
     username = 'test_get_user'
 
-    create_user(CreateUserRequest(username=username, password="test"), session)
+    created = await create_user(CreateUserRequest(username=username, password="test"), async_session)
 
-    existing_user = get_user_by_username(username,session)
+    existing_user = await get_user_by_username(username, async_session)
 
-    assert existing_user is not None
-    assert existing_user['username'] == username
\ No newline at end of file
+    assert existing_user == UserCredentials(created.id, username, "test")
+
+@pytest.mark.anyio
+async def test_usernames_ignore_case(async_session):
+    await create_user(CreateUserRequest(username="CaseUser", password="test"), async_session)
+
+    existing_user = await get_user_by_username("caseuser", async_session)
+    assert existing_user.username == "CaseUser"
+
+    with pytest.raises(IntegrityError):
+        await create_user(CreateUserRequest(username="CASEUSER", password="test"), async_session)
+
+@pytest.mark.anyio
+async def test_create_users_in_bulk(async_session):
+    users = await create_users([CreateUserRequest(username=f"bulk_{i}", password="pw") for i in range(5)], async_session)
+
+    assert [user.username for user in users] == [f"bulk_{i}" for i in range(5)]
+    assert len({user.id for user in users}) == 5
+    assert await create_users([], async_session) == []
+
+    found = await get_users_by_usernames(["BULK_1", "bulk_3", "missing"], async_session)
+    assert found == {"bulk_1": UserCredentials(users[1].id, "bulk_1", "pw"), "bulk_3": UserCredentials(users[3].id, "bulk_3", "pw")}
+
+@pytest.mark.anyio
+async def test_create_users_is_all_or_nothing(async_session):
+    await create_user(CreateUserRequest(username="taken", password="pw"), async_session)
+
+    with pytest.raises(IntegrityError):
+        await create_users([CreateUserRequest(username="fresh", password="pw"), CreateUserRequest(username="Taken", password="pw")], async_session)
+    await async_session.rollback()
+
+    assert await get_user_by_username("fresh", async_session) is None
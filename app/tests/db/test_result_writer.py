@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import anyio
+import pytest
+from sqlalchemy import select
+
+from app.db.db import GameRecord
+from app.db.result_writer import ResultWriter
+
+
+def result_row(code, winner_id="1"):
+    return {"code":code, "x_user_id":"1", "o_user_id":"2", "winner_id":winner_id, "total_turns":5, "started_at":None, "ended_at":datetime(2024, 5, 1)}
+
+@pytest.mark.anyio
+async def test_flush_bulk_inserts(session, session_factory):
+    writer = ResultWriter(session_factory)
+    writer.enqueue(result_row("GAME_1"))
+    writer.enqueue(result_row("GAME_2", winner_id=None))
+
+    assert writer.snapshot()["queue_depth"] == 2
+
+    await writer.flush()
+
+    records = session.scalars(select(GameRecord).order_by(GameRecord.id)).all()
+    assert [record.code for record in records] == ["GAME_1", "GAME_2"]
+    assert records[1].winner_id is None
+    assert writer.snapshot()["queue_depth"] == 0
+    assert writer.snapshot()["written"] == 2
+    assert writer.snapshot()["flush_latency"]["count"] == 1
+
+@pytest.mark.anyio
+async def test_enqueue_drops_when_full(session_factory):
+    writer = ResultWriter(session_factory, max_pending=1)
+    writer.enqueue(result_row("GAME_1"))
+    writer.enqueue(result_row("GAME_2"))
+
+    assert len(writer.pending) == 1
+    assert writer.dropped == 1
+
+@pytest.mark.anyio
+async def test_failed_flush_keeps_rows():
+    def broken_session():
+        raise RuntimeError("Database unavailable")
+
+    writer = ResultWriter(broken_session)
+    writer.enqueue(result_row("GAME_1"))
+
+    await writer.flush()
+
+    assert [row["code"] for row in writer.pending] == ["GAME_1"]
+    assert writer.failed_flushes == 1
+
+@pytest.mark.anyio
+async def test_run_flushes_on_size(session, session_factory):
+    writer = ResultWriter(session_factory, flush_interval=60, flush_size=2)
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(writer.run)
+        while writer.wakeup is None:
+            await anyio.sleep(0)
+        writer.enqueue(result_row("GAME_1"))
+        writer.enqueue(result_row("GAME_2"))
+        with anyio.fail_after(2):
+            while writer.written < 2:
+                await anyio.sleep(0.01)
+        task_group.cancel_scope.cancel()
+
+    assert len(session.scalars(select(GameRecord)).all()) == 2
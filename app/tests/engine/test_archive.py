@@ -0,0 +1,213 @@
+import builtins
+import errno
+from unittest.mock import AsyncMock
+
+import anyio
+import pytest
+
+from app.engine import archive
+from app.engine.archive import RECORD_SIZE, RESULT_ABANDONED, RESULT_O_WON, RESULT_TIE, ArchiveReader, ArchiveWriter
+from app.engine.game import Game
+from app.engine.game_events import GameResult, GameStatusEnum, UserTurnEvent
+from app.models import LobbyUser
+
+
+def finished_game(moves, winner=None, status=GameStatusEnum.ENDED, user_ids=("1", "2")):
+    users = {user_id: LobbyUser(id=user_id, username=f"user_{user_id}") for user_id in user_ids}
+    game = Game(users)
+    game.moves.extend(moves)
+    game.first_turn = 1
+    game.started_at = 1_000
+    game.ended_at = 5_000
+    game.status = status
+    if status is GameStatusEnum.ENDED:
+        game.result = GameResult(is_over=True, status=status, winner=users[winner] if winner else None, combination=None)
+    return game
+
+@pytest.mark.anyio
+async def test_write_and_replay(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("GAME_ONE", finished_game([4, 0, 8, 2, 1], winner="2"))
+    writer.append("GAME_TWO", finished_game([0, 1, 2, 4, 3, 5, 7, 6, 8]))
+    await writer.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    replay = reader.get_replay("GAME_ONE")
+
+    assert (tmp_path / "games.rec").stat().st_size == 2 * RECORD_SIZE
+    assert replay.code == "GAME_ONE"
+    assert replay.players == ["1", "2"]
+    assert replay.started_at == 1_000
+    assert replay.ended_at == 5_000
+    assert replay.first_mark == "O"
+    assert replay.moves == [4, 0, 8, 2, 1]
+    assert replay.winner == "2"
+    assert replay.abandoned is False
+    assert reader.get_replay("GAME_TWO").moves == [0, 1, 2, 4, 3, 5, 7, 6, 8]
+    assert reader.get_replay("MISSING") is None
+
+@pytest.mark.anyio
+async def test_iterate_reuses_view(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("WON", finished_game([4, 0, 8], winner="2"))
+    writer.append("TIE", finished_game([0, 1]))
+    writer.append("LEFT", finished_game([0], status=GameStatusEnum.STARTED))
+    await writer.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    views = set()
+    seen = []
+    for record in reader:
+        views.add(id(record))
+        seen.append((record.code, record.result, record.move_count))
+
+    assert len(views) == 1
+    assert seen == [("WON", RESULT_O_WON, 3), ("TIE", RESULT_TIE, 2), ("LEFT", RESULT_ABANDONED, 1)]
+
+@pytest.mark.anyio
+async def test_reader_sees_later_appends(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    reader = ArchiveReader(str(tmp_path))
+    assert len(list(reader)) == 0
+
+    writer.append("FIRST", finished_game([0]))
+    await writer.flush()
+    assert reader.get_replay("FIRST") is not None
+
+    writer.append("SECOND", finished_game([1, 2]))
+    await writer.flush()
+    assert reader.get_replay("SECOND").moves == [1, 2]
+
+@pytest.mark.anyio
+async def test_new_writer_continues_archive(tmp_path):
+    first_writer = ArchiveWriter(str(tmp_path))
+    first_writer.append("FIRST", finished_game([0, 1]))
+    await first_writer.flush()
+
+    second_writer = ArchiveWriter(str(tmp_path))
+    second_writer.append("SECOND", finished_game([5, 6, 7]))
+    await second_writer.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    assert reader.get_replay("FIRST").moves == [0, 1]
+    assert reader.get_replay("SECOND").moves == [5, 6, 7]
+
+@pytest.mark.anyio
+async def test_run_flushes_when_batch_is_full(tmp_path):
+    writer = ArchiveWriter(str(tmp_path), flush_interval=60, flush_size=2)
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(writer.run)
+        while writer.wakeup is None:
+            await anyio.sleep(0)
+        writer.append("ONE", finished_game([0]))
+        writer.append("TWO", finished_game([1]))
+        with anyio.fail_after(2):
+            while writer.pending_count > 0 or not (tmp_path / archive.INDEX_FILE).exists():
+                await anyio.sleep(0.01)
+        task_group.cancel_scope.cancel()
+
+    assert ArchiveReader(str(tmp_path)).get_replay("TWO") is not None
+
+@pytest.mark.anyio
+async def test_failed_flush_is_retried(tmp_path, monkeypatch):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("FIRST", finished_game([0, 1]))
+    await writer.flush()
+
+    def full_disk_open(path, mode="r", *args, **kwargs):
+        # The moves get written, then the disk fills up
+        if path.endswith(archive.RECORDS_FILE):
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return builtins.open(path, mode, *args, **kwargs)
+
+    writer.append("SECOND", finished_game([5, 6, 7]))
+    monkeypatch.setattr(archive, "open", full_disk_open, raising=False)
+    await writer.flush()
+
+    assert writer.failed_flushes == 1
+    assert writer.pending_count == 1
+    assert (tmp_path / archive.MOVES_FILE).stat().st_size == 2 * archive.MOVE_SIZE
+
+    monkeypatch.undo()
+    writer.append("THIRD", finished_game([8]))
+    await writer.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    assert [reader.get_replay(code).moves for code in ("FIRST", "SECOND", "THIRD")] == [[0, 1], [5, 6, 7], [8]]
+
+@pytest.mark.anyio
+async def test_index_grows_under_open_readers(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "INDEX_MIN_SLOTS", 4)
+    writer = ArchiveWriter(str(tmp_path))
+    reader = ArchiveReader(str(tmp_path))
+    writer.append("GAME_0", finished_game([0]))
+    await writer.flush()
+    assert reader.get_replay("GAME_0") is not None
+    first_size = (tmp_path / archive.INDEX_FILE).stat().st_size
+
+    for i in range(1, 20):
+        writer.append(f"GAME_{i}", finished_game([i % 9]))
+        await writer.flush()
+
+    assert (tmp_path / archive.INDEX_FILE).stat().st_size > first_size
+    assert [reader.get_replay(f"GAME_{i}").moves for i in range(20)] == [[i % 9] for i in range(20)]
+    assert reader.get_replay("MISSING") is None
+
+@pytest.mark.anyio
+async def test_reused_code_finds_latest_game(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("AGAIN", finished_game([0]))
+    await writer.flush()
+    writer.append("AGAIN", finished_game([1, 2]))
+    await writer.flush()
+
+    assert ArchiveReader(str(tmp_path)).get_replay("AGAIN").moves == [1, 2]
+
+@pytest.mark.anyio
+async def test_run_rebuilds_missing_index(tmp_path):
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("FIRST", finished_game([0]))
+    writer.append("SECOND", finished_game([1]))
+    await writer.flush()
+    (tmp_path / archive.INDEX_FILE).unlink()
+    assert ArchiveReader(str(tmp_path)).get_replay("FIRST") is None
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(ArchiveWriter(str(tmp_path)).run)
+        with anyio.fail_after(2):
+            while not (tmp_path / archive.INDEX_FILE).exists():
+                await anyio.sleep(0.01)
+        task_group.cancel_scope.cancel()
+
+    reader = ArchiveReader(str(tmp_path))
+    assert reader.get_replay("FIRST").moves == [0]
+    assert reader.get_replay("SECOND").moves == [1]
+
+@pytest.mark.anyio
+async def test_long_ids_are_cut_on_character_boundaries(tmp_path):
+    long_id = "é" * 9
+    writer = ArchiveWriter(str(tmp_path))
+    writer.append("LONG", finished_game([0], winner=long_id, user_ids=(long_id, "2")))
+    writer.append("SHORT", finished_game([0]))
+    await writer.flush()
+
+    reader = ArchiveReader(str(tmp_path))
+    replay = reader.get_replay("LONG")
+    assert replay.players == ["é" * 8, "2"]
+    assert replay.winner == "é" * 8
+    assert replay.ids_truncated is True
+    assert reader.get_replay("SHORT").ids_truncated is False
+
+def test_unpack_id_replaces_cut_characters():
+    assert archive.unpack_id("é".encode("utf-8")[:1]) == "\ufffd"
+
+@pytest.mark.anyio
+async def test_game_records_moves(mock_websocket: AsyncMock):
+    game = finished_game([], status=GameStatusEnum.STARTED)
+    game.websockets = {"1": mock_websocket, "2": mock_websocket}
+    game.turn = 0
+    await game.game_loop("1", UserTurnEvent(data={"tile_index":4}))
+    await game.game_loop("2", UserTurnEvent(data={"tile_index":0}))
+
+    assert list(game.moves) == [4, 0]
@@ -0,0 +1,43 @@
+import pytest
+
+from app.engine.board import find_line, win_lookup, winning_combinations
+
+
+def bits_of(tiles):
+    return sum(1 << tile for tile in tiles)
+
+@pytest.mark.parametrize('combination', winning_combinations)
+def test_find_line_classic_combinations(combination):
+    bits = bits_of(combination)
+
+    for tile in combination:
+        assert find_line(bits, tile, 3, 3, 3) == combination
+
+def test_find_line_no_line():
+    bits = bits_of([0, 1, 5])
+
+    assert find_line(bits, 1, 3, 3, 3) is None
+
+def test_find_line_does_not_wrap_rows():
+    # Tile 2 ends row zero while 3 and 4 start row one, so they are not a line
+    bits = bits_of([2, 3, 4])
+
+    assert find_line(bits, 3, 3, 3, 3) is None
+
+def test_find_line_gomoku_anti_diagonal():
+    columns = 15
+    tiles = [row * columns + (10 - row) for row in range(2, 7)]
+    bits = bits_of(tiles)
+
+    assert find_line(bits, tiles[2], 15, 15, 5) == sorted(tiles)
+    assert find_line(bits & ~(1 << tiles[4]), tiles[2], 15, 15, 5) is None
+
+def test_find_line_rectangular_board():
+    # 4 rows of 7 columns, vertical line of four in the last column
+    tiles = [row * 7 + 6 for row in range(4)]
+
+    assert find_line(bits_of(tiles), tiles[0], 4, 7, 4) == tiles
+
+def test_win_lookup():
+    assert win_lookup[bits_of([2, 4, 6])] == [2, 4, 6]
+    assert win_lookup[bits_of([0, 1, 3])] is None
@@ -0,0 +1,34 @@
+from unittest.mock import patch
+
+from app.engine.bot import BOT_USER_ID, Bot, BotDifficultyEnum
+
+
+def test_bot_user():
+    bot = Bot(BotDifficultyEnum.HARD)
+
+    assert bot.user.id == BOT_USER_ID
+    assert bot.user.username == "Bot (Hard)"
+
+def test_hard_bot_plays_best_move():
+    bot = Bot(BotDifficultyEnum.HARD)
+    # O on 3 and 4, X to move has to block on 5
+    move = bot.choose_move(0b100000001, 0b000011000, "X")
+
+    assert move == 5
+
+def test_easy_bot_mistake_picks_worse_move():
+    bot = Bot(BotDifficultyEnum.EASY)
+
+    with patch('app.engine.bot.random.random', return_value=0.0):
+        move = bot.choose_move(0b100000001, 0b000011000, "X")
+
+    assert move in [1, 2, 6, 7]
+
+def test_mistake_with_no_worse_moves_plays_best():
+    bot = Bot(BotDifficultyEnum.EASY)
+
+    # Only tile 8 is left
+    with patch('app.engine.bot.random.random', return_value=0.0):
+        move = bot.choose_move(0b010001101, 0b001110010, "X")
+
+    assert move == 8
@@ -0,0 +1,83 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+import anyio
+import pytest
+
+from app.engine.broadcaster import Broadcaster
+from app.engine.game_events import UserTurnEvent
+
+
+def make_websocket():
+    ws = AsyncMock()
+    ws.send_text = AsyncMock()
+    return ws
+
+@pytest.mark.anyio
+async def test_broadcast_encodes_once():
+    broadcaster = Broadcaster()
+    websockets = {"ONE": make_websocket(), "TWO": make_websocket()}
+    event = UserTurnEvent(data={"tile_index":4})
+
+    with patch('app.engine.broadcaster.Broadcaster.encode', return_value=event.model_dump_json()) as mock_encode:
+        evicted = await broadcaster.broadcast(websockets, event)
+
+    mock_encode.assert_called_once_with(event)
+    assert evicted == []
+    for ws in websockets.values():
+        ws.send_text.assert_called_once_with(event.model_dump_json())
+    assert json.loads(event.model_dump_json()) == json.loads(json.dumps(event.serialize_event()))
+
+@pytest.mark.anyio
+async def test_broadcast_evicts_failing_socket():
+    broadcaster = Broadcaster()
+    broken = make_websocket()
+    broken.send_text.side_effect = RuntimeError("Connection lost")
+    healthy = make_websocket()
+    websockets = {"BROKEN": broken, "HEALTHY": healthy}
+
+    evicted = await broadcaster.broadcast(websockets, UserTurnEvent(data={"tile_index":1}))
+
+    assert evicted == ["BROKEN"]
+    assert list(websockets) == ["HEALTHY"]
+    broken.close.assert_called_once()
+    healthy.send_text.assert_called_once()
+    assert broadcaster.evictions == 1
+
+@pytest.mark.anyio
+async def test_broadcast_slow_socket_does_not_block_others():
+    broadcaster = Broadcaster(send_timeout=0.05)
+    received = []
+
+    async def slow_send(text):
+        await anyio.sleep(5)
+
+    async def fast_send(text):
+        received.append(text)
+
+    slow = make_websocket()
+    slow.send_text.side_effect = slow_send
+    fast = make_websocket()
+    fast.send_text.side_effect = fast_send
+    websockets = {"SLOW": slow, "FAST": fast}
+
+    with anyio.fail_after(1):
+        evicted = await broadcaster.broadcast(websockets, UserTurnEvent(data={"tile_index":1}))
+
+    assert evicted == ["SLOW"]
+    assert len(received) == 1
+    assert "SLOW" not in websockets
+
+@pytest.mark.anyio
+async def test_broadcast_metrics():
+    broadcaster = Broadcaster()
+    websockets = {"ONE": make_websocket(), "TWO": make_websocket()}
+
+    await broadcaster.broadcast(websockets, UserTurnEvent(data={"tile_index":1}))
+    await broadcaster.broadcast({}, UserTurnEvent(data={"tile_index":1}))
+    snapshot = broadcaster.snapshot()
+
+    assert snapshot["broadcasts"] == 1
+    assert snapshot["messages_sent"] == 2
+    assert snapshot["evictions"] == 0
+    assert snapshot["fan_out_latency"]["count"] == 1
@@ -0,0 +1,78 @@
+import pytest
+
+from app.engine.code_allocator import CodeAllocator, CodeSpaceExhausted
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_codes_cover_the_whole_space_once():
+    allocator = CodeAllocator(length=3, quarantine=0)
+
+    codes = [allocator.allocate() for _ in range(16 ** 3)]
+
+    assert len(set(codes)) == 16 ** 3
+    assert all(len(code) == 3 and code == code.upper() for code in codes)
+    assert allocator.snapshot()["utilization"] == 1.0
+    with pytest.raises(CodeSpaceExhausted):
+        allocator.allocate()
+
+@pytest.mark.parametrize('shard_id', [0, 1, 2])
+def test_codes_belong_to_shard(shard_id):
+    allocator = CodeAllocator(length=3, shard_id=shard_id, shard_count=3)
+
+    codes = [allocator.allocate() for _ in range(allocator.capacity)]
+
+    assert len(set(codes)) == allocator.capacity
+    assert all(int(code, 16) % 3 == shard_id and int(code, 16) < 16 ** 3 for code in codes)
+
+def test_released_codes_wait_out_quarantine():
+    clock = FakeClock()
+    allocator = CodeAllocator(length=1, quarantine=60, clock=clock)
+    codes = [allocator.allocate() for _ in range(16)]
+
+    allocator.release(codes[3])
+    with pytest.raises(CodeSpaceExhausted):
+        allocator.allocate()
+    assert allocator.snapshot()["quarantined"] == 1
+
+    clock.now = 60
+    assert allocator.allocate() == codes[3]
+
+def test_recycled_codes_come_before_fresh_ones():
+    clock = FakeClock()
+    allocator = CodeAllocator(length=2, quarantine=10, clock=clock)
+    code = allocator.allocate()
+    allocator.release(code)
+
+    clock.now = 10
+
+    assert allocator.allocate() == code
+    assert allocator.snapshot()["never_used"] == 16 ** 2 - 1
+
+def test_reserved_codes_are_skipped():
+    allocator = CodeAllocator(length=1)
+    reserved = ["0", "7", "F"]
+    for code in reserved:
+        assert allocator.reserve(code) is True
+
+    codes = [allocator.allocate() for _ in range(13)]
+
+    assert set(codes).isdisjoint(reserved)
+    with pytest.raises(CodeSpaceExhausted):
+        allocator.allocate()
+
+def test_foreign_codes_are_ignored():
+    allocator = CodeAllocator(length=2, shard_id=1, shard_count=2)
+
+    assert allocator.reserve("A0") is False
+    assert allocator.reserve("CODE") is False
+    assert allocator.reserve("ZZ") is False
+    allocator.release("CODE")
+    allocator.release("A1")
+
+    assert allocator.snapshot()["quarantined"] == 0
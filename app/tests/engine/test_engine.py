@@ -1,10 +1,12 @@
+import json
 
 
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import pytest
 
-from app.engine.engine import GameEngine
+from app.engine.bot import BOT_USER_ID, BotDifficultyEnum
+from app.engine.engine import GAME_IDLE_TIMEOUT, LOBBY_IDLE_TIMEOUT, GameEngine
 from app.engine.game import Game, GameStatusEnum
 from app.engine.lobby import Lobby
 from app.models import LobbyUser
@@ -69,13 +71,24 @@ def test_close_lobby_fail():
 
 def test_get_unique_lobby_code():
     engine = GameEngine()
-    with patch('app.engine.engine.create_lobby_code', return_value="CODE") as mock_create_lobby_code:
+    with patch.object(engine.lobby_codes, 'allocate', return_value="CODE") as mock_allocate:
         code = engine.get_unique_lobby_code()
-        mock_create_lobby_code.assert_called_once()
+        mock_allocate.assert_called_once()
 
         assert isinstance(code, str)
         assert code == "CODE"
 
+def test_close_lobby_releases_its_code():
+    engine = GameEngine()
+    code = engine.create_lobby("owner")
+    assert engine.lobby_codes.snapshot()["in_use"] == 1
+
+    engine.close_lobby(code)
+
+    snapshot = engine.lobby_codes.snapshot()
+    assert snapshot["in_use"] == 0
+    assert snapshot["quarantined"] == 1
+
 def test_get_unique_game_code():
     engine = GameEngine()
     with patch('app.engine.engine.create_game_code', return_value="GAME_CODE") as mock_create_game_code:
@@ -143,11 +156,19 @@ async def test_get_lobbies(lobby_user, mock_websocket):
 
         await lobby.join(lobby_user, mock_websocket)
 
-        lobbies = engine.get_lobbies()
+        lobbies = json.loads(engine.listing.page().body)['lobbies']
+
+        assert lobbies[0]['code'] == lobby.code
+        assert lobbies[0]['owner'] == lobby.owner
+        assert lobbies[0]['players'][0] == lobby_user.model_dump()
+
+def test_close_lobby_unlists_it():
+    engine = GameEngine()
+    code = engine.create_lobby("TEST_OWNER")
+
+    engine.close_lobby(code)
 
-        assert lobbies[0].code is lobby.code
-        assert lobbies[0].owner is lobby.owner
-        assert lobbies[0].players[0] is lobby_user
+    assert json.loads(engine.listing.page().body)['lobbies'] == []
 
 @pytest.mark.anyio
 async def test_get_game_success(lobby_user, mock_websocket):
@@ -204,4 +225,143 @@ def test_close_game_failure():
 
     assert result is None
 
-    
\ No newline at end of file
+    
+
+@pytest.mark.anyio
+async def test_start_bot_lobby(lobby_user, mock_websocket):
+    engine = GameEngine()
+    with patch('app.engine.engine.GameEngine.get_unique_lobby_code', return_value="CODE"):
+        engine.create_lobby("TEST_OWNER", BotDifficultyEnum.MEDIUM)
+        lobby = engine.get_lobby("CODE")
+        await lobby.join(lobby_user, mock_websocket)
+
+        game_code = engine.start_lobby("CODE")
+        game = engine.get_game(game_code)
+
+        assert game.bot is lobby.bot
+        assert BOT_USER_ID in game.users
+        assert lobby_user.id in game.users
+
+def test_close_game_archives_started_game(lobby_user):
+    archive = Mock()
+    engine = GameEngine(archive=archive)
+    game = Game(users={'USER_ID':lobby_user, 'BOT':lobby_user})
+    game.status = GameStatusEnum.ENDED
+    engine.games["TEST"] = game
+
+    engine.close_game("TEST")
+
+    archive.append.assert_called_once_with("TEST", game)
+    assert "TEST" not in engine.games
+
+def test_close_game_skips_forming_game(lobby_user):
+    archive = Mock()
+    engine = GameEngine(archive=archive)
+    engine.games["TEST"] = Game(users={'USER_ID':lobby_user})
+
+    engine.close_game("TEST")
+
+    archive.append.assert_not_called()
+
+@pytest.mark.anyio
+async def test_start_lobby_passes_result_writer(lobby_user, mock_websocket):
+    result_writer = Mock()
+    engine = GameEngine(result_writer=result_writer)
+    with patch('app.engine.engine.GameEngine.get_unique_lobby_code', return_value="CODE"), patch('app.engine.engine.GameEngine.get_unique_game_code', return_value="GAME_CODE"):
+        engine.create_lobby("TEST_OWNER")
+        lobby = engine.get_lobby("CODE")
+        await lobby.join(lobby_user, mock_websocket)
+        await lobby.join(LobbyUser(id="user_2", username="user_two"), mock_websocket)
+
+        game = engine.get_game(engine.start_lobby("CODE"))
+
+        assert game.code == "GAME_CODE"
+        assert game.result_writer is result_writer
+
+async def tick(engine: GameEngine, seconds: float):
+    for _ in range(int(seconds / engine.wheel.tick)):
+        await engine.reap()
+
+@pytest.mark.anyio
+async def test_reap_idle_lobby():
+    engine = GameEngine()
+    code = engine.create_lobby("TEST_OWNER")
+
+    await tick(engine, LOBBY_IDLE_TIMEOUT - 1)
+    assert code in engine.lobbies
+
+    await tick(engine, 1)
+    assert code not in engine.lobbies
+    assert engine.reaped_lobbies == 1
+    assert engine.snapshot()['lobbies'] == 0
+
+@pytest.mark.anyio
+async def test_reap_keeps_connected_lobby(mock_websocket):
+    engine = GameEngine()
+    code = engine.create_lobby("TEST_OWNER")
+    engine.lobbies[code].websockets["TEST_OWNER"] = mock_websocket
+
+    await tick(engine, LOBBY_IDLE_TIMEOUT * 2)
+    assert code in engine.lobbies
+
+    del engine.lobbies[code].websockets["TEST_OWNER"]
+    await tick(engine, LOBBY_IDLE_TIMEOUT)
+    assert code not in engine.lobbies
+    assert engine.reaped_lobbies == 1
+
+@pytest.mark.anyio
+async def test_closed_lobby_is_not_reaped():
+    engine = GameEngine()
+    code = engine.create_lobby("TEST_OWNER")
+    engine.close_lobby(code)
+
+    await tick(engine, LOBBY_IDLE_TIMEOUT)
+
+    assert engine.reaped_lobbies == 0
+    assert engine.wheel.pending == 0
+
+@pytest.mark.anyio
+async def test_reap_never_started_game(mock_websocket):
+    engine = GameEngine()
+    lobby_code = engine.create_lobby("TEST_OWNER", BotDifficultyEnum.EASY)
+    engine.lobbies[lobby_code].users["TEST_OWNER"] = LobbyUser(id="TEST_OWNER", username="owner")
+    game_code = engine.start_lobby(lobby_code)
+    engine.games[game_code].websockets["TEST_OWNER"] = mock_websocket
+
+    await tick(engine, GAME_IDLE_TIMEOUT)
+
+    assert game_code not in engine.games
+    assert engine.reaped_games == 1
+    mock_websocket.close.assert_called_once()
+
+@pytest.mark.anyio
+async def test_reap_keeps_started_game(mock_websocket):
+    engine = GameEngine()
+    lobby_code = engine.create_lobby("TEST_OWNER", BotDifficultyEnum.EASY)
+    engine.lobbies[lobby_code].users["TEST_OWNER"] = LobbyUser(id="TEST_OWNER", username="owner")
+    game_code = engine.start_lobby(lobby_code)
+    game = engine.games[game_code]
+    game.status = GameStatusEnum.STARTED
+    game.websockets["TEST_OWNER"] = mock_websocket
+
+    await tick(engine, GAME_IDLE_TIMEOUT * 3)
+    assert game_code in engine.games
+
+    # Nobody connected and nobody left to resume
+    del game.websockets["TEST_OWNER"]
+    await tick(engine, GAME_IDLE_TIMEOUT)
+    assert game_code not in engine.games
+    assert engine.reaped_games == 1
+
+def test_start_match():
+    engine = GameEngine()
+    first = LobbyUser(id="1", username="first")
+    second = LobbyUser(id="2", username="second")
+
+    game_code = engine.start_match(first, second)
+
+    game = engine.get_game(game_code)
+    assert game.user_ids == ["1", "2"]
+    assert game.bot is None
+    assert game.status is GameStatusEnum.FORMING
+    assert game_code in engine.game_timers
@@ -1,11 +1,15 @@
+import json
+import anyio
 
 
 from unittest.mock import AsyncMock, Mock, patch
 import pytest
 
+from app.engine.bot import BOT_USER_ID, Bot, BotDifficultyEnum
+from app.engine.broadcaster import Broadcaster
 from app.engine.game import Game
-from app.engine.game_events import CheckWinResult, FirstTurnEvent, GameEventTypeEnum, GameResult, GameResultEvent, GameStatusEnum, InvalidEvent, UserDisconnectedEvent, UserTurnEvent
-from app.models import LobbyUser
+from app.engine.game_events import CheckWinResult, FirstTurnEvent, GameEventTypeEnum, GameResult, GameResultEvent, GameStatusEnum, InvalidEvent, SyncProtocolEnum, UserDisconnectedEvent, UserTurnEvent
+from app.models import BoardSettings, LobbyUser
 
 
 @pytest.fixture
@@ -44,9 +48,9 @@ async def test_broadcast(test_game: Game, mock_websocket: AsyncMock):
         start_turn_event = UserTurnEvent(data={"tile_index":1})
         await test_game.broadcast(start_turn_event)
 
-        mock_websocket.send_json.assert_called_once()
-        args, _ = mock_websocket.send_json.call_args
-        assert args[0] == {'type': GameEventTypeEnum.USER_TURN, 'data': {'tile_index': 1}}
+        mock_websocket.send_text.assert_called_once()
+        args, _ = mock_websocket.send_text.call_args
+        assert json.loads(args[0]) == {'type': GameEventTypeEnum.USER_TURN, 'data': {'tile_index': 1}}
 
 @pytest.mark.anyio
 async def test_broadcast_start(test_game: Game):
@@ -349,6 +353,25 @@ async def test_end_game(test_game):
         assert test_game.status == GameStatusEnum.ENDED
         mock_game_over.assert_called_once_with(game_result)
 
+@pytest.mark.anyio
+async def test_end_game_enqueues_result(test_game, lobby_user):
+    result_writer = Mock()
+    test_game.result_writer = result_writer
+    test_game.code = "GAME_CODE"
+    test_game.total_turns = 5
+    game_result = GameResult(is_over=True, status=GameStatusEnum.ENDED, winner=lobby_user, combination=[0, 1, 2])
+
+    with patch('app.engine.game.Game.send_game_over', new_callable=AsyncMock):
+        await test_game.end_game(game_result)
+
+    row = result_writer.enqueue.call_args.args[0]
+    assert row["code"] == "GAME_CODE"
+    assert row["x_user_id"] == "TEST_ID"
+    assert row["o_user_id"] == "SECOND_ID"
+    assert row["winner_id"] == lobby_user.id
+    assert row["total_turns"] == 5
+    assert row["started_at"] is None
+
 @pytest.mark.anyio
 async def test_handle_disconnect(test_game, mock_websocket):
     test_game.websockets["TEST_ID"] = mock_websocket
@@ -370,4 +393,369 @@ async def test_sync_click_with_other_user(test_game, mock_websocket):
     test_game.websockets["LISTENING_ID"] = mock_listening_ws
 
     await test_game.sync_click_with_other_user(user_turn_event, "PLAYING_ID")
-    mock_listening_ws.send_json.assert_called_once_with(user_turn_event.serialize_event())
\ No newline at end of file
+    mock_listening_ws.send_text.assert_called_once_with(user_turn_event.model_dump_json())
+
+@pytest.mark.anyio
+async def test_sync_click_evicts_slow_user(test_game, mock_websocket):
+    async def stalled_send(text):
+        await anyio.sleep(10)
+
+    slow_ws = AsyncMock()
+    slow_ws.send_text = stalled_send
+    test_game.user_ids = ["PLAYING_ID", "SLOW_ID"]
+    test_game.websockets["PLAYING_ID"] = mock_websocket
+    test_game.websockets["SLOW_ID"] = slow_ws
+    test_game.broadcaster = Broadcaster(send_timeout=0.05)
+
+    with anyio.fail_after(1):
+        await test_game.sync_click_with_other_user(UserTurnEvent(data={"tile_index":1}), "PLAYING_ID")
+
+    assert "SLOW_ID" not in test_game.websockets
+    slow_ws.close.assert_called_once()
+
+@pytest.mark.anyio
+async def test_end_game_closes_sockets_concurrently(test_game):
+    async def stalled_close():
+        await anyio.sleep(10)
+
+    stalled_ws = AsyncMock()
+    stalled_ws.close = stalled_close
+    other_ws = AsyncMock()
+    test_game.websockets = {"TEST_ID": stalled_ws, "SECOND_ID": other_ws}
+    test_game.broadcaster = Broadcaster(send_timeout=0.05)
+    game_result = GameResult(is_over=True, status=GameStatusEnum.ENDED, winner=None, combination=None)
+
+    with patch('app.engine.game.Game.send_game_over', new_callable=AsyncMock), anyio.fail_after(1):
+        await test_game.end_game(game_result)
+
+    other_ws.close.assert_called_once()
+
+def test_board_round_trip(test_game):
+    board = ["X","O","","","X","","O","","X"]
+    test_game.board = board
+
+    assert test_game.board == board
+    assert test_game.x_bits == 0b100010001
+    assert test_game.o_bits == 0b001000010
+
+@pytest.mark.anyio
+async def test_check_valid_move_sets_bits(test_game: Game):
+    test_game.turn = 1
+    user_turn_event = UserTurnEvent(data={'tile_index':4})
+
+    result = await test_game.check_valid_move(user_turn_event)
+
+    assert result is True
+    assert test_game.o_bits == 1 << 4
+    assert test_game.x_bits == 0
+    assert test_game.board[4] == "O"
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('tile_index', [-1, 9])
+async def test_check_valid_move_out_of_range_failure(test_game: Game, tile_index):
+    user_turn_event = UserTurnEvent(data={'tile_index':tile_index})
+
+    result = await test_game.check_valid_move(user_turn_event)
+
+    assert result is False
+    assert test_game.x_bits == 0
+    assert test_game.o_bits == 0
+
+def test_check_win_diagonal(test_game):
+    test_game.board = ["O","X","","X","O","X","","","O"]
+
+    result = test_game.check_win("O")
+
+    assert result.is_win is True
+    assert result.combination == [0, 4, 8]
+
+@pytest.fixture
+def bot_game(lobby_user: LobbyUser):
+    bot = Bot(BotDifficultyEnum.HARD)
+    game = Game({lobby_user.id: lobby_user, bot.user.id: bot.user}, bot=bot)
+    game.status = GameStatusEnum.STARTED
+    return game
+
+@pytest.mark.anyio
+async def test_bot_replies_to_move(bot_game: Game, mock_websocket: AsyncMock):
+    bot_game.websockets["test_user"] = mock_websocket
+    bot_game.turn = 0
+
+    result = await bot_game.game_loop("test_user", UserTurnEvent(data={"tile_index":0}))
+
+    assert result is False
+    assert bot_game.turn == 0
+    assert bot_game.total_turns == 2
+    assert bin(bot_game.o_bits).count("1") == 1
+
+@pytest.mark.anyio
+async def test_bot_opens_game(bot_game: Game, mock_websocket: AsyncMock):
+    bot_game.websockets["test_user"] = mock_websocket
+
+    with patch('app.engine.game.random.randint', return_value=1):
+        await bot_game.broadcast_start()
+
+    assert bot_game.user_ids[1] == BOT_USER_ID
+    assert bot_game.turn == 0
+    assert bin(bot_game.o_bits).count("1") == 1
+
+@pytest.mark.anyio
+async def test_bot_win_ends_game(bot_game: Game, mock_websocket: AsyncMock):
+    bot_game.websockets["test_user"] = mock_websocket
+    bot_game.turn = 0
+    # Bot holds 3 and 4, the human misses the block on 5
+    bot_game.board = ["X","","","O","O","","X","",""]
+
+    result = await bot_game.game_loop("test_user", UserTurnEvent(data={"tile_index":8}))
+
+    assert result is True
+    assert bot_game.status == GameStatusEnum.ENDED
+    assert bot_game.board[5] == "O"
+
+@pytest.mark.anyio
+async def test_play_bot_turn_not_bots_turn(bot_game: Game):
+    bot_game.turn = 0
+
+    result = await bot_game.play_bot_turn()
+
+    assert result is False
+    assert bot_game.o_bits == 0
+
+@pytest.fixture
+def gomoku_game(lobby_user: LobbyUser):
+    second_user = LobbyUser(id="SECOND_ID", username="SECOND_USER")
+    game = Game({"TEST_ID":lobby_user, "SECOND_ID": second_user}, board_settings=BoardSettings(rows=15, columns=15, win_length=5))
+    game.status = GameStatusEnum.STARTED
+    return game
+
+def test_gomoku_board(gomoku_game: Game):
+    assert gomoku_game.tile_count == 225
+    assert len(gomoku_game.board) == 225
+
+@pytest.mark.anyio
+async def test_gomoku_check_valid_move_range(gomoku_game: Game):
+    assert await gomoku_game.check_valid_move(UserTurnEvent(data={'tile_index':224})) is True
+    assert await gomoku_game.check_valid_move(UserTurnEvent(data={'tile_index':225})) is False
+    assert gomoku_game.last_move == 224
+
+@pytest.mark.anyio
+async def test_gomoku_win_through_last_move(gomoku_game: Game):
+    gomoku_game.turn = 0
+    for tile_ix in [100, 101, 102, 104]:
+        await gomoku_game.check_valid_move(UserTurnEvent(data={'tile_index':tile_ix}))
+        assert gomoku_game.check_win("X").is_win is False
+
+    await gomoku_game.check_valid_move(UserTurnEvent(data={'tile_index':103}))
+    result = gomoku_game.check_win("X")
+
+    assert result.is_win is True
+    assert result.combination == [100, 101, 102, 103, 104]
+
+def test_gomoku_check_tie(gomoku_game: Game):
+    gomoku_game.x_bits = gomoku_game.full_board
+    assert gomoku_game.check_tie() is True
+
+    gomoku_game.x_bits = gomoku_game.full_board >> 1
+    assert gomoku_game.check_tie() is False
+
+@pytest.mark.anyio
+async def test_game_sync_board_settings(gomoku_game: Game):
+    with patch('app.engine.game.Game.broadcast', new_callable=AsyncMock) as mock_broadcast:
+        await gomoku_game.game_sync()
+
+        args, _ = mock_broadcast.call_args
+        assert args[0].data.board_settings == gomoku_game.board_settings
+
+def sent_events(websocket: AsyncMock):
+    return [json.loads(call.args[0]) for call in websocket.send_text.call_args_list]
+
+@pytest.fixture
+def delta_game(test_game: Game):
+    x_ws = AsyncMock()
+    o_ws = AsyncMock()
+    test_game.connect_user("TEST_ID", x_ws, SyncProtocolEnum.DELTA)
+    test_game.connect_user("SECOND_ID", o_ws, SyncProtocolEnum.DELTA)
+    test_game.status = GameStatusEnum.STARTED
+    test_game.turn = 0
+    return test_game, x_ws, o_ws
+
+@pytest.mark.parametrize('first_verified, second_verified, rated', [(True, True, True), (True, False, False), (False, False, False)])
+def test_only_verified_players_are_rated(test_game: Game, first_verified, second_verified, rated):
+    test_game.connect_user("TEST_ID", AsyncMock(), verified=first_verified)
+    test_game.connect_user("SECOND_ID", AsyncMock(), verified=second_verified)
+    test_game.ended_at = 5_000
+
+    assert test_game.result_row()["rated"] is rated
+
+def test_unverified_reconnect_unrates_game(test_game: Game):
+    test_game.connect_user("TEST_ID", AsyncMock(), verified=True)
+    test_game.connect_user("SECOND_ID", AsyncMock(), verified=True)
+    # Someone else claiming the seat without a token
+    test_game.connect_user("SECOND_ID", AsyncMock())
+    test_game.connect_user("SECOND_ID", AsyncMock(), verified=True)
+    test_game.ended_at = 5_000
+
+    assert test_game.result_row()["rated"] is False
+
+def test_connect_user_protocol(test_game: Game, mock_websocket: AsyncMock):
+    test_game.connect_user("TEST_ID", mock_websocket, SyncProtocolEnum.DELTA)
+    test_game.connect_user("SECOND_ID", mock_websocket)
+
+    assert test_game.protocols == {"TEST_ID": SyncProtocolEnum.DELTA, "SECOND_ID": SyncProtocolEnum.FULL}
+
+@pytest.mark.anyio
+async def test_delta_protocol_one_message_per_move(delta_game):
+    game, x_ws, o_ws = delta_game
+
+    await game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+    await game.game_loop("SECOND_ID", UserTurnEvent(data={"tile_index":0}))
+
+    for ws in (x_ws, o_ws):
+        events = sent_events(ws)
+        assert [event['type'] for event in events] == ["GAME_DELTA", "GAME_DELTA"]
+        assert events[0]['data'] == {"seq":1, "tile_index":4, "mark":"X", "turn":"SECOND_ID"}
+        assert events[1]['data'] == {"seq":2, "tile_index":0, "mark":"O", "turn":"TEST_ID"}
+        ws.send_json.assert_not_called()
+
+@pytest.mark.anyio
+async def test_delta_protocol_final_move(delta_game):
+    game, x_ws, _ = delta_game
+    game.board = ["X","X","","O","O","","","",""]
+
+    result = await game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":2}))
+
+    assert result is True
+    assert [event['type'] for event in sent_events(x_ws)] == ["GAME_DELTA", "RESULT"]
+
+@pytest.mark.anyio
+async def test_mixed_protocols(test_game: Game):
+    full_ws = AsyncMock()
+    delta_ws = AsyncMock()
+    test_game.connect_user("TEST_ID", delta_ws, SyncProtocolEnum.DELTA)
+    test_game.connect_user("SECOND_ID", full_ws, SyncProtocolEnum.FULL)
+    test_game.status = GameStatusEnum.STARTED
+    test_game.turn = 0
+
+    await test_game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+
+    assert [event['type'] for event in sent_events(delta_ws)] == ["GAME_DELTA"]
+    assert [event['type'] for event in sent_events(full_ws)] == ["USER_TURN", "GAME_SYNC", "GAME_SYNC"]
+    full_ws.send_json.assert_not_called()
+
+@pytest.mark.anyio
+async def test_send_snapshot(delta_game):
+    game, x_ws, o_ws = delta_game
+    await game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+    x_ws.send_text.reset_mock()
+    o_ws.send_text.reset_mock()
+
+    await game.send_snapshot("SECOND_ID")
+
+    x_ws.send_text.assert_not_called()
+    events = sent_events(o_ws)
+    assert len(events) == 1
+    assert events[0]['type'] == "GAME_SYNC"
+    assert events[0]['data']['seq'] == 1
+    assert events[0]['data']['board'][4] == "X"
+
+@pytest.mark.anyio
+async def test_send_to_evicts_from_game(delta_game):
+    game, x_ws, _ = delta_game
+    x_ws.send_text.side_effect = RuntimeError("Connection lost")
+
+    await game.send_delta(4, "X")
+
+    assert "TEST_ID" not in game.websockets
+    assert "SECOND_ID" in game.websockets
+
+@pytest.mark.anyio
+async def test_resume_sends_missed_deltas(delta_game):
+    game, x_ws, o_ws = delta_game
+    game.resume_grace = 5
+    await game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+
+    async def drop_and_resume():
+        resumed_ws = AsyncMock()
+        # The opponent keeps playing while the first socket is gone
+        await anyio.sleep(0.01)
+        await game.game_loop("SECOND_ID", UserTurnEvent(data={"tile_index":0}))
+        game.connect_user("TEST_ID", resumed_ws, SyncProtocolEnum.DELTA)
+        await game.resume("TEST_ID", last_seq=1)
+        return resumed_ws
+
+    resumed_ws = None
+    async with anyio.create_task_group() as task_group:
+        async def reconnect():
+            nonlocal resumed_ws
+            resumed_ws = await drop_and_resume()
+        task_group.start_soon(reconnect)
+        with anyio.fail_after(1):
+            assert await game.wait_for_resume("TEST_ID") is True
+
+    events = sent_events(resumed_ws)
+    assert [event['type'] for event in events] == ["GAME_DELTA", "USER_RESUMED"]
+    assert events[0]['data'] == {"seq":2, "tile_index":0, "mark":"O", "turn":"TEST_ID"}
+    assert [event['type'] for event in sent_events(o_ws)] == ["GAME_DELTA", "USER_AWAY", "GAME_DELTA", "USER_RESUMED"]
+    assert game.away == {}
+
+@pytest.mark.anyio
+async def test_wait_for_resume_times_out(delta_game):
+    game, _, o_ws = delta_game
+    game.resume_grace = 0.05
+
+    assert await game.wait_for_resume("TEST_ID") is False
+    assert "TEST_ID" not in game.websockets
+    assert game.away == {}
+    assert sent_events(o_ws)[0]['data'] == {"user_id":"TEST_ID", "resume_within":0.05}
+
+@pytest.mark.anyio
+async def test_wait_for_resume_not_started(test_game: Game, mock_websocket: AsyncMock):
+    test_game.connect_user("TEST_ID", mock_websocket)
+
+    assert await test_game.wait_for_resume("TEST_ID") is False
+    assert "TEST_ID" in test_game.websockets
+
+@pytest.mark.anyio
+async def test_resume_full_protocol_gets_snapshot(test_game: Game):
+    test_game.status = GameStatusEnum.STARTED
+    await test_game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+    resumed_ws = AsyncMock()
+    test_game.connect_user("TEST_ID", resumed_ws)
+
+    await test_game.resume("TEST_ID", last_seq=0)
+
+    events = sent_events(resumed_ws)
+    assert [event['type'] for event in events] == ["GAME_SYNC", "USER_RESUMED"]
+    assert events[0]['data']['seq'] == 1
+
+@pytest.mark.parametrize("last_seq", [-1, 3, None])
+@pytest.mark.anyio
+async def test_resume_unknown_seq_gets_snapshot(delta_game, last_seq):
+    game, x_ws, _ = delta_game
+    await game.game_loop("TEST_ID", UserTurnEvent(data={"tile_index":4}))
+    x_ws.send_text.reset_mock()
+
+    await game.resume("TEST_ID", last_seq=last_seq)
+
+    assert [event['type'] for event in sent_events(x_ws)] == ["GAME_SYNC", "USER_RESUMED"]
+
+def test_missed_deltas_too_far_behind(delta_game):
+    game, _, _ = delta_game
+    game.moves.extend(range(20))
+    game.seq = 20
+
+    assert game.missed_deltas(0) is None
+    assert len(game.missed_deltas(10)) == 10
+
+@pytest.mark.anyio
+async def test_missed_deltas_match_live_deltas(delta_game):
+    game, x_ws, _ = delta_game
+    # X wins on the top row
+    for user_id, tile_ix in [("TEST_ID", 0), ("SECOND_ID", 3), ("TEST_ID", 1), ("SECOND_ID", 4), ("TEST_ID", 2)]:
+        await game.game_loop(user_id, UserTurnEvent(data={"tile_index":tile_ix}))
+
+    live = [event['data'] for event in sent_events(x_ws) if event['type'] == "GAME_DELTA"]
+    rebuilt = [delta.data.model_dump() for delta in game.missed_deltas(0)]
+    assert rebuilt == live
+    # The winning move leaves the turn with the winner
+    assert live[-1]['turn'] == "TEST_ID"
@@ -1,4 +1,4 @@
-from app.engine.game_events import FirstTurnEvent, GameEventTypeEnum, GameResultEvent, GameStatusEnum, GameSyncEvent, InvalidEvent, UnauthorizedEvent, UserConnectedEvent, UserDisconnectedEvent, UserTurnEvent, parse_game_event
+from app.engine.game_events import FirstTurnEvent, GameDeltaEvent, SyncProtocolEnum, SyncRequestEvent, GameEventTypeEnum, GameResultEvent, GameStatusEnum, GameSyncEvent, InvalidEvent, UnauthorizedEvent, UserConnectedEvent, UserDisconnectedEvent, UserTurnEvent, parse_game_event
 from app.models import LobbyUser
 
 
@@ -134,3 +134,26 @@ def test_parse_game_event_failure():
 
     assert parsed_event is None
 
+
+def test_user_connected_protocol():
+    assert UserConnectedEvent(data={"user_id":"TEST_ID"}).data.protocol == SyncProtocolEnum.FULL
+
+    event = parse_game_event({"type":"USER_CONNECTED", "data":{"user_id":"TEST_ID", "protocol":"DELTA"}})
+
+    assert event.data.protocol == SyncProtocolEnum.DELTA
+
+def test_game_delta():
+    event = GameDeltaEvent(data={"seq":3, "tile_index":4, "mark":"O", "turn":"TEST_ID"})
+
+    assert event.type == GameEventTypeEnum.GAME_DELTA
+
+    serialized = event.serialize_event()
+
+    assert serialized['type'] == GameEventTypeEnum.GAME_DELTA
+    assert serialized['data'] == {"seq":3, "tile_index":4, "mark":"O", "turn":"TEST_ID"}
+
+def test_parse_sync_request():
+    event = parse_game_event({"type":"SYNC_REQUEST", "data":{"last_seq":2}})
+
+    assert event.__class__ is SyncRequestEvent
+    assert event.data.last_seq == 2
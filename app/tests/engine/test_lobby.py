@@ -1,6 +1,8 @@
+import json
 from unittest.mock import AsyncMock, patch
 import pytest
 
+from app.engine.bot import BOT_USER_ID, BotDifficultyEnum
 from app.engine.lobby_events import LobbyStartingEvent, StateSyncEvent
 from app.engine.lobby import Lobby
 from app.models import LobbyUser
@@ -11,7 +13,7 @@ async def test_lobby_join_success(lobby_user, mock_websocket):
     result = await lobby.join(lobby_user, mock_websocket)
 
     assert result == True
-    mock_websocket.send_json.assert_called_once()
+    mock_websocket.send_text.assert_called_once()
 
 @pytest.mark.anyio
 async def test_lobby_join_lobby_full(lobby_user, mock_websocket):
@@ -23,7 +25,7 @@ async def test_lobby_join_lobby_full(lobby_user, mock_websocket):
     result = await lobby.join(mock_user_three, mock_websocket)
 
     assert result == False
-    mock_websocket.send_json.assert_called()
+    mock_websocket.send_text.assert_called()
     assert len(lobby.users.keys()) == 2
 
 @pytest.mark.anyio
@@ -54,7 +56,7 @@ async def test_lobby_state_sync(lobby_user, mock_websocket):
 
     await lobby.state_sync()
 
-    mock_websocket.send_json.assert_called_with(state_sync_event.serialize_event())
+    mock_websocket.send_text.assert_called_with(state_sync_event.model_dump_json())
 
 @pytest.mark.anyio
 async def test_lobby_start_success(lobby_user, mock_websocket):
@@ -67,7 +69,7 @@ async def test_lobby_start_success(lobby_user, mock_websocket):
     start_event = LobbyStartingEvent(data={'code':lobby.code, 'starting':True})
 
     assert result is True
-    mock_websocket.send_json.assert_called_with(start_event.serialize_event())
+    mock_websocket.send_text.assert_called_with(start_event.model_dump_json())
 
 @pytest.mark.anyio
 async def test_lobby_start_not_enough_users(lobby_user, mock_websocket):
@@ -78,4 +80,64 @@ async def test_lobby_start_not_enough_users(lobby_user, mock_websocket):
     state_sync_event = StateSyncEvent(data={"owner":lobby.owner,"code":lobby.code, "users":lobby.users.values()})
 
     assert result is False
-    mock_websocket.send_json.assert_called_once_with(state_sync_event.serialize_event())
\ No newline at end of file
+    mock_websocket.send_text.assert_called_once_with(state_sync_event.model_dump_json())
+
+@pytest.mark.anyio
+async def test_bot_lobby_seats_bot(lobby_user, mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234", bot_difficulty=BotDifficultyEnum.EASY)
+    assert BOT_USER_ID in lobby.users
+
+    await lobby.join(lobby_user, mock_websocket)
+    result = await lobby.join(LobbyUser(id="user_2", username="user_two"), mock_websocket)
+
+    assert result is False
+    assert await lobby.start(code="GAME") is True
+
+@pytest.mark.anyio
+async def test_bot_lobby_leave_counts_humans(lobby_user, mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234", bot_difficulty=BotDifficultyEnum.EASY)
+    await lobby.join(lobby_user, mock_websocket)
+
+    users_left = await lobby.leave(lobby_user)
+
+    assert users_left == 0
+
+@pytest.mark.anyio
+async def test_lobby_member_rejoins_full_lobby(lobby_user, mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234")
+    lobby.users = {lobby_user.id: lobby_user, "user_2": LobbyUser(id="user_2", username="user_two")}
+
+    result = await lobby.join(lobby_user, mock_websocket, verified=True)
+
+    assert result == True
+    assert lobby.websockets[lobby_user.id] is mock_websocket
+    assert len(lobby.users) == 2
+
+@pytest.mark.anyio
+async def test_lobby_rejoin_needs_verified_user(lobby_user, mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234")
+    lobby.users = {lobby_user.id: lobby_user}
+
+    assert await lobby.join(lobby_user, mock_websocket) is False
+    assert lobby.websockets == {}
+
+@pytest.mark.anyio
+async def test_lobby_rejoin_rejects_connected_seat(lobby_user, mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234")
+    await lobby.join(lobby_user, mock_websocket)
+    lobby.starting = True
+    other_websocket = AsyncMock()
+
+    result = await lobby.join(lobby_user, other_websocket, verified=True)
+
+    assert result is False
+    assert lobby.websockets[lobby_user.id] is mock_websocket
+
+@pytest.mark.anyio
+async def test_lobby_rejects_bot_id(mock_websocket):
+    lobby = Lobby(owner="test_owner", code="1234", bot_difficulty=BotDifficultyEnum.EASY)
+    bot_user = LobbyUser(id=BOT_USER_ID, username="Not a bot")
+
+    assert await lobby.join(bot_user, mock_websocket, verified=True) is False
+    assert await Lobby(owner="test_owner", code="5678").join(bot_user, mock_websocket, verified=True) is False
+    assert lobby.users[BOT_USER_ID].username != "Not a bot"
@@ -0,0 +1,121 @@
+import json
+from unittest.mock import AsyncMock
+
+import anyio
+import pytest
+
+from app.engine.lobby import Lobby
+from app.engine.lobby_feed import LobbyFeed
+from app.engine.lobby_listing import LobbyListing
+from app.models import LobbyUser
+
+
+def make_feed(window: float = 0.0, max_lag: int = 64):
+    listing = LobbyListing()
+    feed = LobbyFeed(listing, window=window, max_lag=max_lag)
+    listing.on_change = feed.changed
+    return listing, feed
+
+def make_lobby(listing: LobbyListing, code: str) -> Lobby:
+    lobby = Lobby(f"OWNER_{code}", code, on_change=listing.update)
+    listing.update(lobby)
+    return lobby
+
+def sent(websocket):
+    return [json.loads(call.args[0]) for call in websocket.send_text.call_args_list]
+
+def test_no_tracking_without_subscribers():
+    listing, feed = make_feed()
+
+    make_lobby(listing, "CODE_1")
+
+    assert feed.pending == {}
+    assert feed.flush_at is None
+
+def test_changes_coalesce_into_one_frame(mock_websocket):
+    listing, feed = make_feed()
+    existing = make_lobby(listing, "EXISTING")
+    closing = make_lobby(listing, "CLOSING")
+    subscriber = feed.add(mock_websocket)
+
+    added = make_lobby(listing, "ADDED")
+    added.users["1"] = LobbyUser(id="1", username="first")
+    listing.update(added)
+    existing.users["2"] = LobbyUser(id="2", username="second")
+    listing.update(existing)
+    listing.remove("CLOSING")
+    make_lobby(listing, "SHORT_LIVED")
+    listing.remove("SHORT_LIVED")
+    feed.flush()
+
+    frame = json.loads(feed.next_frame(subscriber))
+    assert frame['type'] == "LOBBY_FEED"
+    assert [lobby['code'] for lobby in frame['data']['added']] == ["ADDED"]
+    assert frame['data']['added'][0]['players'] == [{"id": "1", "username": "first"}]
+    assert [lobby['code'] for lobby in frame['data']['updated']] == ["EXISTING"]
+    assert frame['data']['removed'] == ["CLOSING"]
+    assert feed.next_frame(subscriber) is None
+
+def test_flush_without_net_change_sends_nothing(mock_websocket):
+    listing, feed = make_feed()
+    subscriber = feed.add(mock_websocket)
+
+    make_lobby(listing, "SHORT_LIVED")
+    listing.remove("SHORT_LIVED")
+    feed.flush()
+
+    assert feed.next_frame(subscriber) is None
+    assert feed.frames == 0
+
+def test_lagging_subscriber_gets_snapshot(mock_websocket):
+    listing, feed = make_feed(max_lag=2)
+    subscriber = feed.add(mock_websocket)
+
+    for i in range(3):
+        make_lobby(listing, f"CODE_{i}")
+        feed.flush()
+
+    frame = json.loads(feed.next_frame(subscriber))
+    assert frame['type'] == "LOBBY_SNAPSHOT"
+    assert [lobby['code'] for lobby in frame['data']['lobbies']] == ["CODE_0", "CODE_1", "CODE_2"]
+    assert feed.resyncs == 1
+    assert feed.next_frame(subscriber) is None
+
+@pytest.mark.anyio
+async def test_serve_sends_snapshot_then_frames():
+    listing, feed = make_feed(window=0.01)
+    make_lobby(listing, "BEFORE")
+    websocket = AsyncMock()
+    subscriber = feed.add(websocket)
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(feed.serve, subscriber)
+        await anyio.sleep(0.01)
+        make_lobby(listing, "FIRST")
+        make_lobby(listing, "SECOND")
+        with anyio.fail_after(1):
+            while websocket.send_text.await_count < 2:
+                await anyio.sleep(0.01)
+        task_group.cancel_scope.cancel()
+
+    snapshot, frame = sent(websocket)
+    assert snapshot['type'] == "LOBBY_SNAPSHOT"
+    assert [lobby['code'] for lobby in snapshot['data']['lobbies']] == ["BEFORE"]
+    assert [lobby['code'] for lobby in frame['data']['added']] == ["FIRST", "SECOND"]
+
+@pytest.mark.anyio
+async def test_serve_stops_when_send_fails():
+    listing, feed = make_feed()
+    websocket = AsyncMock()
+    websocket.send_text.side_effect = RuntimeError()
+    subscriber = feed.add(websocket)
+
+    with anyio.fail_after(1):
+        await feed.serve(subscriber)
+
+def test_subscriber_limit(mock_websocket):
+    listing = LobbyListing()
+    feed = LobbyFeed(listing, max_subscribers=1)
+
+    assert feed.add(mock_websocket) is not None
+    assert feed.add(mock_websocket) is None
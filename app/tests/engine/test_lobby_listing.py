@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from app.engine.lobby import Lobby
+from app.engine.lobby_listing import LobbyListing
+from app.models import LobbyUser
+
+
+def listed(listing: LobbyListing, cursor: int = 0, limit: int = 50, open_only: bool = False):
+    page = json.loads(listing.page(cursor, limit, open_only).body)
+    return [lobby['code'] for lobby in page['lobbies']], page['next_cursor']
+
+def make_lobbies(listing: LobbyListing, count: int):
+    lobbies = []
+    for i in range(count):
+        lobby = Lobby(f"OWNER_{i}", f"CODE_{i}", on_change=listing.update)
+        listing.update(lobby)
+        lobbies.append(lobby)
+    return lobbies
+
+def test_pages_follow_cursor():
+    listing = LobbyListing()
+    make_lobbies(listing, 5)
+
+    first, cursor = listed(listing, limit=2)
+    second, cursor = listed(listing, int(cursor), limit=2)
+    third, cursor = listed(listing, int(cursor), limit=2)
+
+    assert first == ["CODE_0", "CODE_1"]
+    assert second == ["CODE_2", "CODE_3"]
+    assert third == ["CODE_4"]
+    assert cursor is None
+
+def test_removed_lobby_does_not_shift_cursor():
+    listing = LobbyListing()
+    make_lobbies(listing, 4)
+    _, cursor = listed(listing, limit=2)
+
+    listing.remove("CODE_0")
+    listing.remove("CODE_2")
+
+    assert listed(listing, int(cursor), limit=2) == (["CODE_3"], None)
+
+def test_remove_unknown_code():
+    listing = LobbyListing()
+    make_lobbies(listing, 1)
+
+    listing.remove("MISSING")
+
+    assert listed(listing) == (["CODE_0"], None)
+
+@pytest.mark.anyio
+async def test_open_only_skips_full_and_starting(mock_websocket):
+    listing = LobbyListing()
+    full, starting, empty = make_lobbies(listing, 3)
+    for lobby in (full, starting):
+        await lobby.join(LobbyUser(id="1", username="first"), mock_websocket)
+        await lobby.join(LobbyUser(id="2", username="second"), mock_websocket)
+    await starting.start(code="GAME")
+    await starting.leave(LobbyUser(id="2", username="second"))
+
+    assert listed(listing, open_only=True) == (["CODE_2"], None)
+    assert listed(listing)[0] == ["CODE_0", "CODE_1", "CODE_2"]
+
+@pytest.mark.anyio
+async def test_leaving_reopens_lobby(mock_websocket):
+    listing = LobbyListing()
+    lobby, = make_lobbies(listing, 1)
+    first = LobbyUser(id="1", username="first")
+    await lobby.join(first, mock_websocket)
+    await lobby.join(LobbyUser(id="2", username="second"), mock_websocket)
+    assert listed(listing, open_only=True)[0] == []
+
+    await lobby.leave(first)
+
+    assert listed(listing, open_only=True)[0] == ["CODE_0"]
+
+@pytest.mark.anyio
+async def test_entries_carry_players(lobby_user, mock_websocket):
+    listing = LobbyListing()
+    lobby, = make_lobbies(listing, 1)
+
+    await lobby.join(lobby_user, mock_websocket)
+
+    entry = json.loads(listing.page().body)['lobbies'][0]
+    assert entry == {"code": "CODE_0", "owner": "OWNER_0", "players": [lobby_user.model_dump()], "board_settings": lobby.board_settings.model_dump()}
+
+def test_unchanged_page_served_from_cache():
+    listing = LobbyListing()
+    make_lobbies(listing, 3)
+
+    first = listing.page()
+    second = listing.page()
+
+    assert second is first
+    assert listing.page_hits == 1
+    assert listing.page_misses == 1
+
+def test_change_drops_only_pages_it_touches():
+    listing = LobbyListing()
+    lobbies = make_lobbies(listing, 4)
+    head = listing.page(0, 2)
+    tail = listing.page(2, 2)
+
+    lobbies[3].owner = "NEW_OWNER"
+    listing.update(lobbies[3])
+
+    assert listing.page(0, 2) is head
+    assert listing.page(2, 2) is not tail
+
+def test_new_lobby_changes_etag_of_last_page():
+    listing = LobbyListing()
+    make_lobbies(listing, 3)
+    head = listing.page(0, 2)
+    tail = listing.page(2, 2)
+
+    listing.update(Lobby("OWNER_3", "CODE_3"))
+
+    assert listing.page(0, 2).etag == head.etag
+    assert listing.page(2, 2).etag != tail.etag
+
+def test_page_cache_is_bounded():
+    listing = LobbyListing(page_cache_size=2)
+    make_lobbies(listing, 5)
+
+    for cursor in range(5):
+        listing.page(cursor, 1)
+
+    assert len(listing.pages) == 2
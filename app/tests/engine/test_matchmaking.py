@@ -0,0 +1,129 @@
+from unittest.mock import Mock
+
+import pytest
+
+from app.engine.matchmaking import BASE_WINDOW, BUCKET_WIDTH, MAX_WINDOW, UNBOUNDED_WINDOW, WINDOW_STEP, MatchmakingQueue
+from app.engine.timer_wheel import TimerWheel
+from app.models import LobbyUser
+
+pytestmark = pytest.mark.anyio
+
+
+def user(user_id: str) -> LobbyUser:
+    return LobbyUser(id=user_id, username=f"user_{user_id}")
+
+def make_queue():
+    on_match = Mock(side_effect=lambda first, second: f"GAME_{first.id}_{second.id}")
+    return MatchmakingQueue(on_match, wheel=TimerWheel(tick=1)), on_match
+
+async def test_close_ratings_match_on_join():
+    queue, on_match = make_queue()
+
+    first = queue.join(user("1"), 1200)
+    second = queue.join(user("2"), 1200 + BASE_WINDOW)
+
+    on_match.assert_called_once()
+    assert first.game_code == second.game_code == "GAME_1_2"
+    assert first.matched.is_set() and second.matched.is_set()
+    assert queue.tickets == {}
+    assert queue.bucket_ids == []
+
+async def test_distant_ratings_wait():
+    queue, on_match = make_queue()
+
+    queue.join(user("1"), 1200)
+    queue.join(user("2"), 1200 + BASE_WINDOW + BUCKET_WIDTH)
+
+    on_match.assert_not_called()
+    assert len(queue.tickets) == 2
+
+async def test_closest_bucket_wins():
+    queue, on_match = make_queue()
+    queue.join(user("far"), 1200 - BASE_WINDOW)
+    queue.join(user("near"), 1200 + BUCKET_WIDTH)
+
+    ticket = queue.join(user("new"), 1200)
+
+    assert ticket.game_code == "GAME_near_new"
+    assert "far" in queue.tickets
+
+async def test_longest_waiting_wins_a_tie():
+    queue, on_match = make_queue()
+    queue.join(user("first"), 1200 - BASE_WINDOW)
+    queue.join(user("second"), 1200 + BASE_WINDOW)
+
+    ticket = queue.join(user("third"), 1200)
+
+    assert ticket.game_code == "GAME_first_third"
+    assert list(queue.tickets) == ["second"]
+
+async def test_window_widens_until_match():
+    queue, on_match = make_queue()
+    gap = BASE_WINDOW + WINDOW_STEP
+    first = queue.join(user("1"), 1200)
+    queue.join(user("2"), 1200 + gap)
+
+    queue.advance()
+
+    assert first.window == BASE_WINDOW + WINDOW_STEP
+    assert first.game_code == "GAME_1_2"
+    assert queue.tickets == {}
+
+async def test_window_unbounded_after_max():
+    queue, on_match = make_queue()
+    ticket = queue.join(user("1"), 1200)
+
+    for _ in range(MAX_WINDOW // WINDOW_STEP + 2):
+        queue.advance()
+
+    # Alone in the queue it keeps searching with no limit
+    assert ticket.window == UNBOUNDED_WINDOW
+    assert ticket.timer is not None
+    on_match.assert_not_called()
+
+async def test_nearest_bucket_after_max():
+    queue, on_match = make_queue()
+    first = queue.join(user("1"), 1200)
+    for _ in range((MAX_WINDOW - BASE_WINDOW) // WINDOW_STEP):
+        queue.advance()
+    assert first.window == MAX_WINDOW
+    queue.join(user("far"), 1200 + 4 * MAX_WINDOW)
+    queue.join(user("farther"), 1200 - 5 * MAX_WINDOW)
+    on_match.assert_not_called()
+
+    queue.advance()
+
+    assert first.game_code == "GAME_1_far"
+    assert list(queue.tickets) == ["farther"]
+
+async def test_leave_removes_ticket():
+    queue, on_match = make_queue()
+    ticket = queue.join(user("1"), 1200)
+
+    queue.leave(ticket)
+    queue.join(user("2"), 1200)
+
+    on_match.assert_not_called()
+    assert list(queue.tickets) == ["2"]
+    assert ticket.timer is None
+
+async def test_leave_after_match_is_harmless():
+    queue, on_match = make_queue()
+    first = queue.join(user("1"), 1200)
+    queue.join(user("2"), 1200)
+
+    queue.leave(first)
+
+    assert queue.matches == 1
+
+async def test_duplicate_join_rejected():
+    queue, on_match = make_queue()
+    queue.join(user("1"), 1200)
+
+    assert queue.join(user("1"), 2000) is None
+
+async def test_own_bucket_skipped():
+    queue, on_match = make_queue()
+    ticket = queue.join(user("1"), 1200)
+
+    assert queue.nearest(ticket) is None
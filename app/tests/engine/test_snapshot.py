@@ -0,0 +1,136 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.engine.bot import Bot, BotDifficultyEnum
+from app.engine.engine import RESTORE_WINDOW, GameEngine
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum, UserTurnEvent
+from app.engine.lobby import Lobby
+from app.engine.snapshot import dump_engine, load_engine
+from app.models import BoardSettings, LobbyUser
+
+
+def make_users():
+    return {"X_ID": LobbyUser(id="X_ID", username="Xavier"), "O_ID": LobbyUser(id="O_ID", username="Ölga")}
+
+async def played_game(first_turn: int, tiles) -> Game:
+    game = Game(make_users(), code="GAME_CODE")
+    game.status = GameStatusEnum.STARTED
+    game.turn = first_turn
+    game.first_turn = first_turn
+    game.started_at = 1_700_000_000_000
+    for tile_ix in tiles:
+        await game.game_loop(game.user_ids[game.turn], UserTurnEvent(data={"tile_index":tile_ix}))
+    return game
+
+@pytest.mark.parametrize("first_turn", [0, 1])
+@pytest.mark.anyio
+async def test_game_round_trip(first_turn):
+    game = await played_game(first_turn, [4, 0, 8])
+
+    _, games = load_engine(dump_engine({}, {"GAME_CODE": game}))
+
+    restored = games["GAME_CODE"]
+    assert restored.board == game.board
+    assert restored.users == game.users
+    assert restored.user_ids == ["X_ID", "O_ID"]
+    assert (restored.turn, restored.first_turn, restored.total_turns, restored.seq) == (game.turn, game.first_turn, 3, 3)
+    assert restored.status is GameStatusEnum.STARTED
+    assert restored.started_at == game.started_at
+    assert restored.moves.tolist() == [4, 0, 8]
+    assert restored.last_move == 8
+    assert restored.websockets == {}
+
+@pytest.mark.anyio
+async def test_restored_game_plays_on():
+    game = await played_game(0, [0, 3, 1])
+    _, games = load_engine(dump_engine({}, {"GAME_CODE": game}))
+    restored = games["GAME_CODE"]
+
+    await restored.game_loop("O_ID", UserTurnEvent(data={"tile_index":4}))
+    is_over = await restored.game_loop("X_ID", UserTurnEvent(data={"tile_index":2}))
+
+    assert is_over is True
+    assert restored.result.winner.id == "X_ID"
+
+def test_gomoku_and_bot_games_round_trip():
+    gomoku = Game(make_users(), board_settings=BoardSettings(rows=15, columns=15, win_length=5))
+    gomoku.status = GameStatusEnum.STARTED
+    gomoku.moves.extend([224, 0])
+    gomoku.seq = 2
+    bot = Bot(BotDifficultyEnum.MEDIUM)
+    bot_game = Game({"X_ID": make_users()["X_ID"], bot.user.id: bot.user}, bot=bot)
+
+    _, games = load_engine(dump_engine({}, {"GOMOKU": gomoku, "BOT": bot_game}))
+
+    assert games["GOMOKU"].board_settings == gomoku.board_settings
+    assert games["GOMOKU"].x_bits == 1 << 224
+    assert games["GOMOKU"].o_bits == 1
+    assert games["BOT"].bot.difficulty is BotDifficultyEnum.MEDIUM
+    assert games["BOT"].status is GameStatusEnum.FORMING
+
+def test_ended_games_are_left_out():
+    game = Game(make_users())
+    game.status = GameStatusEnum.ENDED
+
+    _, games = load_engine(dump_engine({}, {"ENDED": game}))
+
+    assert games == {}
+
+def test_lobby_round_trip():
+    lobby = Lobby("X_ID", "AAAAA", board_settings=BoardSettings(rows=4, columns=4, win_length=4))
+    lobby.users = make_users()
+    lobby.starting = True
+    bot_lobby = Lobby("X_ID", "BBBBB", BotDifficultyEnum.HARD)
+
+    lobbies, _ = load_engine(dump_engine({"AAAAA": lobby, "BBBBB": bot_lobby}, {}))
+
+    assert lobbies["AAAAA"].owner == "X_ID"
+    assert lobbies["AAAAA"].users == lobby.users
+    assert lobbies["AAAAA"].starting is True
+    assert lobbies["AAAAA"].board_settings == lobby.board_settings
+    assert lobbies["BBBBB"].bot.difficulty is BotDifficultyEnum.HARD
+    assert list(lobbies["BBBBB"].users) == [lobbies["BBBBB"].bot.user.id]
+
+def test_not_a_snapshot():
+    with pytest.raises(ValueError):
+        load_engine(b"NOPE" + bytes(10))
+
+@pytest.mark.anyio
+async def test_engine_save_and_restore(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    engine = GameEngine()
+    lobby_code = engine.create_lobby("X_ID")
+    engine.games["GAME_CODE"] = await played_game(0, [4])
+
+    engine.save_state(path)
+    restored = GameEngine()
+    assert restored.restore_state(path) is True
+
+    assert list(restored.lobbies) == [lobby_code]
+    assert restored.games["GAME_CODE"].board[4] == "X"
+    assert restored.wheel.pending == 2
+    # Restored codes are taken, the allocator will not hand them out again
+    assert restored.lobby_codes.reserve(lobby_code) is False
+    # The snapshot is used once
+    assert restored.restore_state(path) is False
+
+@pytest.mark.anyio
+async def test_restored_game_reaped_without_both_players(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    engine = GameEngine()
+    engine.games["GAME_CODE"] = await played_game(0, [4])
+    engine.save_state(path)
+    restored = GameEngine()
+    restored.restore_state(path)
+    websocket = AsyncMock()
+    restored.games["GAME_CODE"].connect_user("X_ID", websocket)
+
+    for _ in range(int(RESTORE_WINDOW)):
+        await restored.reap()
+
+    assert "GAME_CODE" not in restored.games
+    websocket.send_text.assert_called_once()
+    assert "USER_DISCONNECTED" in websocket.send_text.call_args.args[0]
+    websocket.close.assert_called_once()
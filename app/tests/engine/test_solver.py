@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from app.engine.board import BOARD_SIZE, win_lookup
+from app.engine.solver import SolvedTable, get_solved_table, position_index
+
+
+@pytest.fixture(scope="module")
+def table():
+    return SolvedTable.build()
+
+def test_position_index_is_unique():
+    indexes = set()
+    for x_bits in range(1 << BOARD_SIZE):
+        for o_bits in range(1 << BOARD_SIZE):
+            if x_bits & o_bits == 0:
+                indexes.add(position_index(x_bits, o_bits, False))
+                indexes.add(position_index(x_bits, o_bits, True))
+
+    assert len(indexes) == 2 * 3 ** BOARD_SIZE
+
+def test_empty_board_is_a_draw(table):
+    assert table.value(0, 0, False) == 0
+    assert table.value(0, 0, True) == 0
+
+def test_best_move_takes_the_win(table):
+    # X on 0 and 1, O on 3 and 4, X to move wins on 2
+    x_bits = 0b000000011
+    o_bits = 0b000011000
+
+    assert table.best_move(x_bits, o_bits, False) == 2
+    assert table.value(x_bits, o_bits, False) > 0
+
+def test_best_move_blocks(table):
+    # O threatens 3-4-5, X has to block on 5
+    x_bits = 0b100000001
+    o_bits = 0b000011000
+
+    assert table.best_move(x_bits, o_bits, False) == 5
+
+def test_move_values_match_children(table):
+    x_bits = 0b000000001
+    o_bits = 0b000010000
+
+    move_values = dict(table.move_values(x_bits, o_bits, False))
+
+    assert sorted(move_values) == [1, 2, 3, 5, 6, 7, 8]
+    assert move_values[2] == -table.value(x_bits | 1 << 2, o_bits, True)
+    assert max(move_values.values()) == table.value(x_bits, o_bits, False)
+
+def test_best_play_never_loses_to_random(table):
+    rng = random.Random(7)
+    for game in range(200):
+        x_bits = o_bits = 0
+        o_to_move = game % 2 == 1
+        solver_plays_o = rng.random() < 0.5
+        while win_lookup[x_bits] is None and win_lookup[o_bits] is None and x_bits | o_bits != (1 << BOARD_SIZE) - 1:
+            if o_to_move == solver_plays_o:
+                tile = table.best_move(x_bits, o_bits, o_to_move)
+            else:
+                tile = rng.choice([t for t in range(BOARD_SIZE) if not (x_bits | o_bits) >> t & 1])
+            if o_to_move:
+                o_bits |= 1 << tile
+            else:
+                x_bits |= 1 << tile
+            o_to_move = not o_to_move
+
+        opponent_bits = x_bits if solver_plays_o else o_bits
+        assert win_lookup[opponent_bits] is None
+
+def test_save_and_load(table, tmp_path):
+    path = tmp_path / "solved.bin"
+    table.save(str(path))
+
+    loaded = SolvedTable.load(str(path))
+
+    assert loaded.values == table.values
+    assert loaded.best_moves == table.best_moves
+
+def test_get_solved_table_is_cached():
+    assert get_solved_table() is get_solved_table()
@@ -0,0 +1,175 @@
+from unittest.mock import AsyncMock
+
+import anyio
+import pytest
+
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum, SyncProtocolEnum
+from app.engine.spectators import MAX_CONFLATIONS, SpectatorHub
+from app.models import LobbyUser
+
+
+def make_viewer():
+    ws = AsyncMock()
+    ws.send_text = AsyncMock()
+    return ws
+
+def sent(ws):
+    return [call.args[0] for call in ws.send_text.call_args_list]
+
+@pytest.mark.anyio
+async def test_viewer_gets_messages_in_order():
+    hub = SpectatorHub()
+    ws = make_viewer()
+    spectator = hub.add(ws)
+
+    hub.publish("sync", True)
+    hub.publish("turn", False)
+    hub.close()
+
+    with anyio.fail_after(1):
+        await hub.serve(spectator)
+
+    assert sent(ws) == ["sync", "turn"]
+
+@pytest.mark.anyio
+async def test_viewer_starts_from_latest_sync():
+    hub = SpectatorHub()
+    hub.publish("old", False)
+    hub.publish("sync", True)
+    hub.publish("after", False)
+    ws = make_viewer()
+    spectator = hub.add(ws)
+    hub.close()
+
+    await hub.serve(spectator)
+
+    assert sent(ws) == ["sync", "after"]
+
+@pytest.mark.anyio
+async def test_viewer_waits_for_new_messages():
+    hub = SpectatorHub()
+    ws = make_viewer()
+    spectator = hub.add(ws)
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(hub.serve, spectator)
+        await anyio.sleep(0.01)
+        hub.publish("first", True)
+        await anyio.sleep(0.01)
+        hub.publish("second", False)
+        hub.close()
+
+    assert sent(ws) == ["first", "second"]
+
+@pytest.mark.anyio
+async def test_slow_viewer_is_conflated_to_latest_sync():
+    hub = SpectatorHub(max_lag=4)
+    ws = make_viewer()
+    spectator = hub.add(ws)
+
+    for i in range(10):
+        hub.publish(f"sync_{i}" if i == 6 else f"event_{i}", i == 6)
+    hub.close()
+
+    await hub.serve(spectator)
+
+    assert sent(ws) == ["sync_6", "event_7", "event_8", "event_9"]
+    assert spectator.conflations == 0
+
+@pytest.mark.anyio
+async def test_viewer_dropped_after_repeated_conflation():
+    hub = SpectatorHub(max_lag=2)
+    ws = make_viewer()
+    spectator = hub.add(ws)
+    hub.publish("sync", True)
+
+    async def slow_send(text):
+        # Every send lets the game run far ahead of the viewer again
+        for _ in range(5):
+            hub.publish("event", False)
+
+    ws.send_text.side_effect = slow_send
+
+    with anyio.fail_after(1):
+        await hub.serve(spectator)
+
+    assert spectator.conflations > MAX_CONFLATIONS
+    assert len(sent(ws)) == MAX_CONFLATIONS + 1
+
+@pytest.mark.anyio
+async def test_failed_send_ends_viewer():
+    hub = SpectatorHub()
+    ws = make_viewer()
+    ws.send_text.side_effect = RuntimeError("Connection lost")
+    spectator = hub.add(ws)
+    hub.publish("sync", True)
+
+    with anyio.fail_after(1):
+        await hub.serve(spectator)
+
+    ws.send_text.assert_called_once()
+
+@pytest.mark.anyio
+async def test_broadcast_delay():
+    hub = SpectatorHub(delay=0.2)
+    ws = make_viewer()
+    spectator = hub.add(ws)
+    hub.publish("sync", True)
+    hub.close()
+
+    started = anyio.current_time()
+    await hub.serve(spectator)
+
+    assert anyio.current_time() - started >= 0.15
+    assert sent(ws) == ["sync"]
+
+@pytest.mark.anyio
+async def test_delayed_viewer_keeps_up_with_more_messages_than_the_ring():
+    hub = SpectatorHub(delay=0.2, max_lag=4)
+    ws = make_viewer()
+    spectator = hub.add(ws)
+    published = ["sync"] + [f"event_{i}" for i in range(29)]
+
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(hub.serve, spectator)
+        for i, text in enumerate(published):
+            hub.publish(text, i == 0)
+            await anyio.sleep(0.005)
+        # Everything published is still waiting out the delay
+        assert len(hub.delayed) > hub.max_lag
+        hub.close()
+
+    # Lag only counts released messages, so an instant viewer never gets conflated
+    assert sent(ws) == published
+    assert spectator.conflations == 0
+
+def test_max_spectators():
+    hub = SpectatorHub(max_spectators=1)
+
+    assert hub.add(make_viewer()) is not None
+    assert hub.add(make_viewer()) is None
+
+def test_closed_hub_rejects_viewers():
+    hub = SpectatorHub()
+    hub.close()
+
+    assert hub.add(make_viewer()) is None
+
+@pytest.mark.anyio
+async def test_game_publishes_to_spectators(lobby_user):
+    game = Game({"TEST_ID":lobby_user, "SECOND_ID":LobbyUser(id="SECOND_ID", username="SECOND_USER")})
+    game.status = GameStatusEnum.STARTED
+    player_ws = AsyncMock()
+    game.connect_user("TEST_ID", player_ws, SyncProtocolEnum.DELTA)
+    viewer = make_viewer()
+    spectator = game.spectators.add(viewer)
+
+    await game.game_sync()
+    await game.send_delta(4, "X")
+    game.spectators.close()
+    await game.spectators.serve(spectator)
+
+    assert len(sent(viewer)) == 1
+    assert '"GAME_SYNC"' in sent(viewer)[0]
+    assert player_ws.send_text.call_count == 2
@@ -0,0 +1,58 @@
+import pytest
+
+from app.engine.timer_wheel import TimerWheel
+
+
+def run_until_fired(wheel: TimerWheel, max_ticks: int):
+    fired = {}
+    for _ in range(max_ticks):
+        for timer in wheel.advance():
+            fired[timer.key] = wheel.now
+    return fired
+
+@pytest.mark.parametrize("delay", [1, 5, 7, 8, 9, 63, 64, 65, 100, 511, 512, 700])
+def test_timer_fires_on_deadline(delay):
+    wheel = TimerWheel(slots=8, levels=3)
+
+    wheel.schedule("key", delay)
+
+    assert run_until_fired(wheel, 1000) == {"key": delay}
+    assert wheel.pending == 0
+
+def test_timers_scheduled_mid_turn():
+    wheel = TimerWheel(slots=8, levels=3)
+    run_until_fired(wheel, 13)
+    wheel.schedule("short", 3)
+    wheel.schedule("middle", 20)
+    wheel.schedule("long", 300)
+
+    fired = run_until_fired(wheel, 400)
+
+    assert fired == {"short": 16, "middle": 33, "long": 313}
+
+def test_fractional_delay_rounds_up():
+    wheel = TimerWheel(tick=0.5)
+
+    wheel.schedule("key", 1.2)
+
+    assert run_until_fired(wheel, 10) == {"key": 3}
+
+def test_cancelled_timer_does_not_fire():
+    wheel = TimerWheel(slots=8, levels=2)
+    near = wheel.schedule("near", 3)
+    far = wheel.schedule("far", 30)
+
+    near.cancel()
+    far.cancel()
+
+    assert run_until_fired(wheel, 100) == {}
+    assert wheel.pending == 0
+
+def test_many_timers():
+    wheel = TimerWheel(slots=16, levels=3)
+    for delay in range(1, 2000):
+        wheel.schedule(delay, delay)
+
+    fired = run_until_fired(wheel, 2000)
+
+    assert all(fired[delay] == delay for delay in range(1, 2000))
@@ -0,0 +1,85 @@
+from typing import Dict, List, Set
+
+import anyio
+from anyio.abc import SocketStream
+from anyio.streams.buffered import BufferedByteReceiveStream
+
+from app.backplane import read_reply
+
+class Client():
+    def __init__(self, stream: SocketStream):
+        self.stream = stream
+        self.lock = anyio.Lock()
+        self.channels: Set[bytes] = set()
+
+    async def send(self, data: bytes):
+        async with self.lock:
+            await self.stream.send(data)
+
+def encode_push(*items) -> bytes:
+    parts = [b"*%d\r\n" % len(items)]
+    for item in items:
+        if isinstance(item, int):
+            parts.append(b":%d\r\n" % item)
+        else:
+            parts.append(b"$%d\r\n%s\r\n" % (len(item), item))
+    return b"".join(parts)
+
+class RedisStandIn():
+    """
+    Just enough of a Redis server for the backplane: PING, PUBLISH, SUBSCRIBE and UNSUBSCRIBE.
+    """
+    def __init__(self):
+        self.subscribers: Dict[bytes, Set[Client]] = {}
+        self.clients: Set[Client] = set()
+        self.port = 0
+
+    async def serve(self, task_status=anyio.TASK_STATUS_IGNORED):
+        listener = await anyio.create_tcp_listener(local_host="127.0.0.1")
+        self.port = listener.extra(anyio.abc.SocketAttribute.local_port)
+        task_status.started()
+        await listener.serve(self.handle)
+
+    async def handle(self, stream: SocketStream):
+        client = Client(stream)
+        self.clients.add(client)
+        reader = BufferedByteReceiveStream(stream)
+        try:
+            while True:
+                command: List[bytes] = await read_reply(reader)
+                await self.run_command(client, command[0].upper(), command[1:])
+        except (anyio.EndOfStream, anyio.IncompleteRead, anyio.BrokenResourceError, anyio.ClosedResourceError):
+            pass
+        finally:
+            self.clients.discard(client)
+            for channel in client.channels:
+                self.subscribers[channel].discard(client)
+
+    async def drop_clients(self):
+        """
+        Closes every client connection, like a server restart would.
+        """
+        for client in list(self.clients):
+            await client.stream.aclose()
+
+    async def run_command(self, client: Client, name: bytes, args: List[bytes]):
+        if name == b"PING":
+            await client.send(b"+PONG\r\n")
+        elif name == b"PUBLISH":
+            channel, message = args
+            receivers = list(self.subscribers.get(channel, ()))
+            for receiver in receivers:
+                await receiver.send(encode_push(b"message", channel, message))
+            await client.send(b":%d\r\n" % len(receivers))
+        elif name == b"SUBSCRIBE":
+            for channel in args:
+                self.subscribers.setdefault(channel, set()).add(client)
+                client.channels.add(channel)
+                await client.send(encode_push(b"subscribe", channel, len(client.channels)))
+        elif name == b"UNSUBSCRIBE":
+            for channel in args:
+                self.subscribers.get(channel, set()).discard(client)
+                client.channels.discard(channel)
+                await client.send(encode_push(b"unsubscribe", channel, len(client.channels)))
+        else:
+            await client.send(b"-ERR unknown command\r\n")
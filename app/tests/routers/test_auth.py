@@ -3,6 +3,9 @@ from unittest.mock import patch
 import bcrypt
 from fastapi import status
 
+from app.db.repository import UserCredentials
+from app.passwords import PasswordPool, PasswordPoolFull
+
 def test_signup_success(client):
     username = "signup_success_user"
     password = "signup_success_pw"
@@ -34,7 +37,9 @@ def test_login_success(client):
     username = "signup_success_user"
     password = "signup_success_pw"
 
-    with patch('app.routers.auth.get_user_by_username', return_value={"id":"1", "password":password}), patch('app.routers.auth.compare_password', return_value=True):
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+
+    with patch('app.routers.auth.get_user_by_username', return_value=UserCredentials(1, username, hashed)):
         response = client.post("/auth/login", json={"username":username, "password":password})
 
         json_response = response.json()
@@ -65,9 +70,36 @@ def test_login_pw_error(client):
 
     wrong_pw = "wrong_pw"
 
-    with patch('app.routers.auth.get_user_by_username', return_value={"id":"1", "password":hashed}):
+    with patch('app.routers.auth.get_user_by_username', return_value=UserCredentials(1, username, hashed)):
         response = client.post("/auth/login", json={"username":username, "password":wrong_pw})
 
         assert response.status_code == status.HTTP_401_UNAUTHORIZED
         json_response = response.json()
         assert json_response == {"detail":"Incorrect username or password"}
+
+
+def test_login_pool_full(client):
+    with patch('app.routers.auth.get_user_by_username', return_value=UserCredentials(1, "pool_full_user", "hashed")), patch.object(PasswordPool, 'verify', side_effect=PasswordPoolFull):
+        response = client.post("/auth/login", json={"username":"pool_full_user", "password":"pool_full_pw"})
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.headers['retry-after'] == "1"
+
+
+def test_signup_same_name_different_case(client):
+    with patch('app.routers.auth.get_user_by_username', return_value=None), patch.object(PasswordPool, 'hash', return_value=b"hashed"):
+        first = client.post("/auth/signup", json={"username":"case_user", "password":"pw"})
+        second = client.post("/auth/signup", json={"username":"Case_User", "password":"pw"})
+
+    assert first.status_code == status.HTTP_200_OK
+    assert second.status_code == status.HTTP_400_BAD_REQUEST
+    assert second.json() == {"detail":"User already exists"}
+
+def test_login_in_any_case(client):
+    signup = client.post("/auth/signup", json={"username":"Mixed_Case", "password":"mixed_pw"})
+
+    response = client.post("/auth/login", json={"username":"mixed_case", "password":"mixed_pw"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['user_id'] == signup.json()['user_id']
+    assert response.json()['username'] == "Mixed_Case"
@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from app.engine.archive import ArchiveReader, ArchiveWriter, get_archive_reader
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum, SyncProtocolEnum, UserConnectedEvent, UserTurnEvent
+from app.main import app
+from app.models import JWTClaims, LobbyUser
+from app.utils import create_jwt
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    app.dependency_overrides[get_archive_reader] = lambda: ArchiveReader(str(tmp_path))
+    yield tmp_path
+    del app.dependency_overrides[get_archive_reader]
+
+@pytest.mark.anyio
+async def test_get_replay(async_client, archive_dir):
+    game = Game({"1": LobbyUser(id="1", username="one"), "2": LobbyUser(id="2", username="two")})
+    game.status = GameStatusEnum.STARTED
+    game.moves.extend([4, 0])
+    writer = ArchiveWriter(str(archive_dir))
+    writer.append("REPLAY_CODE", game)
+    await writer.flush()
+
+    response = await async_client.get("/game/REPLAY_CODE/replay")
+
+    assert response.status_code == 200
+    res_json = response.json()
+    assert res_json['code'] == "REPLAY_CODE"
+    assert res_json['moves'] == [4, 0]
+    assert res_json['abandoned'] is True
+
+@pytest.mark.anyio
+async def test_get_replay_not_found(async_client, archive_dir):
+    response = await async_client.get("/game/MISSING/replay")
+
+    assert response.status_code == 404
+
+def test_spectate_unknown_game(client):
+    with client.websocket_connect("/game/MISSING/spectate") as websocket:
+        assert websocket.receive_json()['type'] == "UNAUTHORIZED"
+
+def test_spectate_game(client, game_engine):
+    game = Game({"1": LobbyUser(id="1", username="one"), "2": LobbyUser(id="2", username="two")})
+    game.spectators.publish(game.broadcaster.encode(game.create_sync_event()), True)
+    game_engine.games["SPECTATE_CODE"] = game
+
+    with client.websocket_connect("/game/SPECTATE_CODE/spectate") as websocket:
+        event = websocket.receive_json()
+
+    assert event['type'] == "GAME_SYNC"
+    assert event['data']['status'] == "FORMING"
+    del game_engine.games["SPECTATE_CODE"]
+
+@pytest.fixture
+def started_game(game_engine):
+    game = Game({"1": LobbyUser(id="1", username="one"), "2": LobbyUser(id="2", username="two")})
+    game.status = GameStatusEnum.STARTED
+    game.joined.update(game.user_ids)
+    game_engine.games["RESUME_CODE"] = game
+    yield game
+    game_engine.games.pop("RESUME_CODE", None)
+
+def connect_event(user_id:str, last_seq=None) -> dict:
+    return UserConnectedEvent(data={"user_id":user_id, "protocol":SyncProtocolEnum.DELTA, "last_seq":last_seq}).serialize_event()
+
+@pytest.mark.anyio
+async def test_reconnect_gets_missed_deltas(client, started_game):
+    await started_game.game_loop("1", UserTurnEvent(data={"tile_index":4}))
+    await started_game.game_loop("2", UserTurnEvent(data={"tile_index":0}))
+
+    with client.websocket_connect("/game/RESUME_CODE") as websocket:
+        websocket.send_json(connect_event("1", last_seq=1))
+        delta = websocket.receive_json()
+        resumed = websocket.receive_json()
+
+    assert delta['type'] == "GAME_DELTA"
+    assert delta['data']['seq'] == 2
+    assert resumed['type'] == "USER_RESUMED"
+    # Resuming never restarts the game
+    assert started_game.status is GameStatusEnum.STARTED
+    assert started_game.total_turns == 2
+
+def test_drop_closes_game_after_grace(client, game_engine, started_game):
+    started_game.resume_grace = 0.3
+
+    with client.websocket_connect("/game/RESUME_CODE") as websocket:
+        websocket.send_json(connect_event("1"))
+        websocket.receive_json()
+        websocket.close()
+        # The handler waits out the grace window in the client's event loop thread
+        assert "RESUME_CODE" in game_engine.games
+        deadline = time.monotonic() + 2
+        while "RESUME_CODE" in game_engine.games and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    assert "RESUME_CODE" not in game_engine.games
+
+def test_superseded_socket_drop_keeps_game(client, game_engine, started_game):
+    started_game.resume_grace = 0
+
+    with client.websocket_connect("/game/RESUME_CODE") as old_websocket:
+        old_websocket.send_json(connect_event("1"))
+        old_websocket.receive_json()
+        with client.websocket_connect("/game/RESUME_CODE") as new_websocket:
+            new_websocket.send_json(connect_event("1", last_seq=0))
+            assert new_websocket.receive_json()['type'] == "USER_RESUMED"
+            old_websocket.close()
+            time.sleep(0.1)
+            assert "RESUME_CODE" in game_engine.games
+            assert "1" in started_game.websockets
+
+def test_restart_keeps_game(client, game_engine, started_game):
+    started_game.resume_grace = 0
+
+    with client.websocket_connect("/game/RESUME_CODE") as websocket:
+        websocket.send_json(connect_event("1"))
+        websocket.receive_json()
+        websocket.close(code=1012)
+        time.sleep(0.1)
+        assert "RESUME_CODE" in game_engine.games
+
+def test_game_starts_once_both_players_join(client, game_engine):
+    game = Game({"1": LobbyUser(id="1", username="one"), "2": LobbyUser(id="2", username="two")})
+    game_engine.games["JOIN_CODE"] = game
+
+    with client.websocket_connect("/game/JOIN_CODE") as first, client.websocket_connect("/game/JOIN_CODE") as second:
+        first.send_json(connect_event("1"))
+        assert first.receive_json()['data']['status'] == "FORMING"
+        assert game.status is GameStatusEnum.FORMING
+
+        second.send_json(connect_event("2"))
+        # The second player joins, nobody is told about a resume
+        assert [second.receive_json()['type'] for _ in range(3)] == ["GAME_SYNC", "FIRST_TURN", "GAME_SYNC"]
+        assert [first.receive_json()['type'] for _ in range(3)] == ["GAME_SYNC", "FIRST_TURN", "GAME_SYNC"]
+        assert game.status is GameStatusEnum.STARTED
+    game_engine.games.pop("JOIN_CODE", None)
+
+def test_first_connect_to_started_game_is_not_a_resume(client, game_engine, started_game):
+    started_game.joined = {"1"}
+
+    with client.websocket_connect("/game/RESUME_CODE") as websocket:
+        websocket.send_json(connect_event("2", last_seq=0))
+        event = websocket.receive_json()
+
+    assert event['type'] == "GAME_SYNC"
+    assert event['data']['status'] == "STARTED"
+
+def test_token_verifies_player(client, game_engine):
+    game = Game({"1": LobbyUser(id="1", username="one"), "2": LobbyUser(id="2", username="two")})
+    game_engine.games["VERIFY_CODE"] = game
+    token = create_jwt(JWTClaims(user_id=1, username="one"))
+
+    with client.websocket_connect(f"/game/VERIFY_CODE?token={token}") as first, client.websocket_connect("/game/VERIFY_CODE") as second:
+        first.send_json(connect_event("1"))
+        first.receive_json()
+        second.send_json(connect_event("2"))
+        second.receive_json()
+
+    assert game.verified == {"1": True, "2": False}
+    game_engine.games.pop("VERIFY_CODE", None)
@@ -0,0 +1,38 @@
+from app.dependencies import get_user_id
+from app.tests.test_ratings import create_users, result_row
+
+
+def play(session, ratings):
+    create_users(session, 3)
+    ratings.load()
+    ratings.record(result_row("1", "2", winner_id="1"))
+    ratings.record(result_row("1", "3", winner_id="1"))
+    ratings.write(session, ratings.take_dirty())
+    session.commit()
+
+def test_leaderboard_pages(client, session, ratings):
+    play(session, ratings)
+
+    first = client.get("/leaderboard?limit=2").json()
+    second = client.get(f"/leaderboard?limit=2&cursor={first['next_cursor']}").json()
+
+    players = first['players'] + second['players']
+    assert [player['user_id'] for player in players][0] == 1
+    assert sorted(player['user_id'] for player in players) == [1, 2, 3]
+    assert [player['rank'] for player in players] == sorted(player['rank'] for player in players)
+    assert players[0]['rank'] == 1
+    assert players[0]['games_played'] == 2
+    assert second['next_cursor'] is None
+
+def test_leaderboard_invalid_cursor(client):
+    response = client.get("/leaderboard?cursor=nope")
+
+    assert response.status_code == 400
+
+def test_my_rank(client, session, ratings):
+    play(session, ratings)
+    client.app.dependency_overrides[get_user_id] = lambda: "1"
+
+    response = client.get("/leaderboard/me")
+
+    assert response.json() == {"user_id": 1, "rating": ratings.get(1)[0], "games_played": 2, "rank": 1, "players": 3}
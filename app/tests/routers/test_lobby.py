@@ -1,7 +1,11 @@
 
+from unittest.mock import patch
+
 import pytest
 
+from app.engine.code_allocator import CodeSpaceExhausted
 from app.engine.lobby_events import EventTypeEnum
+from app.models import LobbyUser
 
 
 @pytest.mark.anyio
@@ -30,4 +34,104 @@ async def test_create_lobby(async_client, game_engine):
     lobby_owners = [lobby['owner'] for lobby in res_json['lobbies']]
 
     assert "LOBBY_1" in lobby_owners
-    assert "LOBBY_2" in lobby_owners
\ No newline at end of file
+    assert "LOBBY_2" in lobby_owners
+
+def close_all_lobbies(engine):
+    # The test engine is shared, listings are only predictable from a clean slate
+    for code in list(engine.lobbies):
+        engine.close_lobby(code)
+
+@pytest.mark.anyio
+async def test_get_lobbies_paginated(async_client, game_engine):
+    close_all_lobbies(game_engine)
+    codes = [game_engine.create_lobby(f"LOBBY_{i}") for i in range(3)]
+
+    first = (await async_client.get("/lobby/get-lobbies?limit=2")).json()
+    second = (await async_client.get(f"/lobby/get-lobbies?limit=2&cursor={first['next_cursor']}")).json()
+
+    assert [lobby['code'] for lobby in first['lobbies']] == codes[:2]
+    assert [lobby['code'] for lobby in second['lobbies']] == codes[2:]
+    assert second['next_cursor'] is None
+
+@pytest.mark.anyio
+async def test_get_lobbies_open_only(async_client, game_engine, mock_websocket):
+    close_all_lobbies(game_engine)
+    full = game_engine.create_lobby("FULL")
+    open_code = game_engine.create_lobby("OPEN")
+    lobby = game_engine.get_lobby(full)
+    await lobby.join(LobbyUser(id="1", username="first"), mock_websocket)
+    await lobby.join(LobbyUser(id="2", username="second"), mock_websocket)
+
+    response = await async_client.get("/lobby/get-lobbies?open_only=true")
+
+    assert [lobby['code'] for lobby in response.json()['lobbies']] == [open_code]
+
+@pytest.mark.anyio
+async def test_get_lobbies_not_modified(async_client, game_engine):
+    close_all_lobbies(game_engine)
+    game_engine.create_lobby("LOBBY_1")
+
+    first = await async_client.get("/lobby/get-lobbies")
+    unchanged = await async_client.get("/lobby/get-lobbies", headers={"If-None-Match": first.headers['etag']})
+    game_engine.create_lobby("LOBBY_2")
+    changed = await async_client.get("/lobby/get-lobbies", headers={"If-None-Match": first.headers['etag']})
+
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert changed.status_code == 200
+    assert len(changed.json()['lobbies']) == 2
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('query, status_code', [("cursor=abc", 400), ("limit=0", 422), ("limit=1000", 422)])
+async def test_get_lobbies_invalid_query(async_client, query, status_code):
+    response = await async_client.get(f"/lobby/get-lobbies?{query}")
+
+    assert response.status_code == status_code
+
+@pytest.mark.anyio
+async def test_create_bot_lobby(async_client, game_engine):
+    response = await async_client.post("/lobby/create-lobby?bot=HARD")
+
+    res_json = response.json()
+    lobby = game_engine.get_lobby(res_json['data']['code'])
+
+    assert response.status_code == 200
+    assert lobby.bot is not None
+    assert lobby.bot.difficulty == "HARD"
+
+@pytest.mark.anyio
+async def test_create_gomoku_lobby(async_client, game_engine):
+    response = await async_client.post("/lobby/create-lobby?rows=15&columns=15&win_length=5")
+
+    lobby = game_engine.get_lobby(response.json()['data']['code'])
+
+    assert response.status_code == 200
+    assert lobby.board_settings.rows == 15
+    assert lobby.board_settings.win_length == 5
+
+@pytest.mark.anyio
+async def test_create_lobby_out_of_codes(async_client, game_engine):
+    with patch.object(game_engine.lobby_codes, 'allocate', side_effect=CodeSpaceExhausted):
+        response = await async_client.post("/lobby/create-lobby")
+
+    assert response.status_code == 503
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('query', ["rows=2", "columns=20", "rows=4&columns=4&win_length=5", "bot=EASY&rows=4"])
+async def test_create_lobby_invalid_board(async_client, query):
+    response = await async_client.post(f"/lobby/create-lobby?{query}")
+
+    assert response.status_code == 400
+
+def test_lobby_feed(client, game_engine):
+    with client.websocket_connect("/lobby/feed") as websocket:
+        snapshot = websocket.receive_json()
+        code = client.post("/lobby/create-lobby").json()['data']['code']
+        frame = websocket.receive_json()
+        websocket.close()
+
+    assert snapshot['type'] == "LOBBY_SNAPSHOT"
+    assert code not in [lobby['code'] for lobby in snapshot['data']['lobbies']]
+    assert frame['type'] == "LOBBY_FEED"
+    assert [lobby['code'] for lobby in frame['data']['added']] == [code]
+    assert frame['data']['removed'] == []
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from fastapi import WebSocketDisconnect, status
+
+from app.engine.lobby_events import EventTypeEnum
+from app.models import JWTClaims
+from app.utils import create_jwt
+
+
+def join_event(user_id: str):
+    return {"type": "JOIN_QUEUE", "data": {"id": user_id, "username": f"user_{user_id}"}}
+
+def test_players_matched_into_game(client, game_engine):
+    with client.websocket_connect("/matchmaking") as first:
+        first.send_json(join_event("MATCH_1"))
+        with client.websocket_connect("/matchmaking") as second:
+            second.send_json(join_event("MATCH_2"))
+            second_event = second.receive_json()
+        first_event = first.receive_json()
+
+    assert first_event['type'] == second_event['type'] == EventTypeEnum.MATCH_FOUND
+    code = first_event['data']['code']
+    assert second_event['data']['code'] == code
+    assert game_engine.get_game(code).user_ids == ["MATCH_1", "MATCH_2"]
+    game_engine.close_game(code)
+
+def test_invalid_join(client):
+    with client.websocket_connect("/matchmaking") as websocket:
+        websocket.send_json({"type": "JOIN_LOBBY", "data": {"id": "1", "username": "one"}})
+        event = websocket.receive_json()
+
+    assert event['type'] == EventTypeEnum.INVALID_EVENT
+
+def test_disconnect_leaves_queue(client, game_engine):
+    with client.websocket_connect("/matchmaking") as websocket:
+        websocket.send_json(join_event("LEAVER"))
+        for _ in range(100):
+            if "LEAVER" in game_engine.matchmaking.tickets:
+                break
+            time.sleep(0.01)
+        assert "LEAVER" in game_engine.matchmaking.tickets
+        websocket.close()
+        for _ in range(100):
+            if "LEAVER" not in game_engine.matchmaking.tickets:
+                break
+            time.sleep(0.01)
+
+    assert "LEAVER" not in game_engine.matchmaking.tickets
+
+def test_token_must_match_player(client):
+    token = create_jwt(JWTClaims(user_id=7, username="seven"))
+
+    with client.websocket_connect(f"/matchmaking?token={token}") as websocket:
+        websocket.send_json(join_event("8"))
+        event = websocket.receive_json()
+
+    assert event['type'] == EventTypeEnum.INVALID_EVENT
+
+def test_invalid_token_refused(client):
+    with pytest.raises(WebSocketDisconnect) as disconnect:
+        with client.websocket_connect("/matchmaking?token=WRONG_JWT") as websocket:
+            websocket.receive_json()
+
+    assert disconnect.value.code == status.WS_1008_POLICY_VIOLATION
@@ -0,0 +1,272 @@
+import json
+import socket
+from typing import Optional
+
+import anyio
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from app.backplane import Backplane, BackplaneUnavailable, RedisBackplane, create_backplane
+from app.dependencies import get_user_id
+from app.engine.engine import GameEngine, get_engine
+from app.routers import game, lobby
+from app.sharding import ShardRouter, serve_tunnels, shard_of
+from app.tests.redis_stand_in import RedisStandIn
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_publish_reaches_subscribers():
+    backplane = Backplane()
+    first = await backplane.subscribe("channel")
+    second = await backplane.subscribe("channel")
+    other = await backplane.subscribe("other")
+
+    await backplane.publish("channel", b"message")
+
+    assert await first.receive() == b"message"
+    assert await second.receive() == b"message"
+    with pytest.raises(anyio.WouldBlock):
+        other.receive_stream.receive_nowait()
+    assert backplane.snapshot()['delivered'] == 2
+
+@pytest.mark.anyio
+async def test_unsubscribe():
+    backplane = Backplane()
+    subscription = await backplane.subscribe("channel")
+
+    await subscription.aclose()
+    await backplane.publish("channel", b"message")
+
+    assert "channel" not in backplane.subscriptions
+    assert backplane.snapshot()['delivered'] == 0
+
+@pytest.mark.anyio
+async def test_slow_subscriber_is_cut_off(monkeypatch):
+    monkeypatch.setattr("app.backplane.SUBSCRIPTION_BUFFER", 2)
+    backplane = Backplane()
+    slow = await backplane.subscribe("channel")
+
+    for i in range(3):
+        await backplane.publish("channel", str(i).encode())
+
+    assert [message async for message in slow] == [b"0", b"1"]
+    assert backplane.overflowed == 1
+
+def test_create_backplane():
+    assert type(create_backplane("")) is Backplane
+    redis = create_backplane("redis://cache:6380")
+    assert isinstance(redis, RedisBackplane)
+    assert (redis.host, redis.port) == ("cache", 6380)
+
+@pytest.mark.anyio
+async def test_redis_backplane():
+    stand_in = RedisStandIn()
+    async with anyio.create_task_group() as task_group:
+        await task_group.start(stand_in.serve)
+        publisher = RedisBackplane(f"redis://127.0.0.1:{stand_in.port}")
+        subscriber = RedisBackplane(f"redis://127.0.0.1:{stand_in.port}")
+        task_group.start_soon(subscriber.run)
+        subscription = await subscriber.subscribe("channel")
+
+        await publisher.publish("channel", b"first")
+        await publisher.publish("other", b"ignored")
+        await publisher.publish("channel", b"second \r\n with a line break")
+
+        with anyio.fail_after(1):
+            assert await subscription.receive() == b"first"
+            assert await subscription.receive() == b"second \r\n with a line break"
+
+        await subscription.aclose()
+        await publisher.publish("channel", b"after")
+        await anyio.sleep(0.05)
+        assert subscriber.delivered == 2
+        task_group.cancel_scope.cancel()
+
+@pytest.mark.anyio
+async def test_redis_backplane_reconnects():
+    stand_in = RedisStandIn()
+    async with anyio.create_task_group() as task_group:
+        await task_group.start(stand_in.serve)
+        publisher = RedisBackplane(f"redis://127.0.0.1:{stand_in.port}")
+        subscriber = RedisBackplane(f"redis://127.0.0.1:{stand_in.port}")
+        task_group.start_soon(subscriber.run)
+        subscription = await subscriber.subscribe("channel")
+
+        await stand_in.drop_clients()
+        with anyio.fail_after(2):
+            # The subscription carries over to the new connection once the server confirms it again
+            while subscriber.reconnects == 0 or not subscriber.confirmations["channel"].is_set():
+                await anyio.sleep(0.01)
+        await publisher.publish("channel", b"after reconnect")
+
+        with anyio.fail_after(1):
+            assert await subscription.receive() == b"after reconnect"
+        assert subscriber.snapshot()['reconnects'] == 1
+        task_group.cancel_scope.cancel()
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.mark.anyio
+async def test_redis_backplane_unreachable():
+    backplane = RedisBackplane(f"redis://127.0.0.1:{unused_port()}", subscribe_timeout=0.1)
+    async with anyio.create_task_group() as task_group:
+        # Refused connections are retried, they never end run
+        task_group.start_soon(backplane.run)
+        with anyio.fail_after(1):
+            with pytest.raises(BackplaneUnavailable):
+                await backplane.subscribe("channel")
+            with pytest.raises(BackplaneUnavailable):
+                await backplane.publish("channel", b"message")
+        assert "channel" not in backplane.subscriptions
+        task_group.cancel_scope.cancel()
+
+@pytest.mark.anyio
+async def test_concurrent_subscribers_wait_for_confirmation():
+    stand_in = RedisStandIn()
+    async with anyio.create_task_group() as task_group:
+        await task_group.start(stand_in.serve)
+        subscriber = RedisBackplane(f"redis://127.0.0.1:{stand_in.port}")
+        task_group.start_soon(subscriber.run)
+        while subscriber.subscriber_stream is None:
+            await anyio.sleep(0.01)
+        confirmed_on_return = []
+
+        async def subscribe():
+            await subscriber.subscribe("channel")
+            confirmed_on_return.append(subscriber.confirmations["channel"].is_set())
+
+        with anyio.fail_after(1):
+            async with anyio.create_task_group() as subscribers:
+                subscribers.start_soon(subscribe)
+                subscribers.start_soon(subscribe)
+
+        assert confirmed_on_return == [True, True]
+        task_group.cancel_scope.cancel()
+
+def create_node(engine: GameEngine, shard_id: int, backplane: Backplane) -> ShardRouter:
+    node = FastAPI()
+    node.include_router(lobby.router)
+    node.include_router(game.router)
+    node.dependency_overrides[get_engine] = lambda: engine
+    node.dependency_overrides[get_user_id] = lambda: "TEST_USER"
+    return ShardRouter(node, shard_id=shard_id, shard_count=2, backplane=backplane)
+
+class WebSocketClient():
+    """
+    Drives an ASGI websocket endpoint in process, the way a server would for a connected browser.
+    """
+    def __init__(self, app, path: str):
+        self.app = app
+        self.scope = {"type": "websocket", "path": path, "raw_path": path.encode(), "query_string": b"", "headers": [], "scheme": "ws", "client": ("127.0.0.1", 1), "server": ("test", 80), "subprotocols": []}
+        self.to_app, self.app_inbox = anyio.create_memory_object_stream(100)
+        self.app_outbox, self.from_app = anyio.create_memory_object_stream(100)
+
+    async def run(self):
+        await self.app(self.scope, self.app_inbox.receive, self.app_outbox.send)
+
+    async def connect(self, task_group):
+        task_group.start_soon(self.run)
+        await self.to_app.send({"type": "websocket.connect"})
+        assert (await self.from_app.receive())['type'] == "websocket.accept"
+
+    async def send_json(self, data: dict):
+        await self.to_app.send({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self) -> Optional[dict]:
+        with anyio.fail_after(2):
+            message = await self.from_app.receive()
+        assert message['type'] == "websocket.send"
+        return json.loads(message['text'])
+
+    async def disconnect(self):
+        await self.to_app.send({"type": "websocket.disconnect", "code": 1000})
+
+@pytest.fixture(params=["memory", "redis"])
+async def nodes(request):
+    """
+    Two nodes owning one shard each, sharing a backplane either in process or through a Redis protocol server.
+    """
+    stand_in = RedisStandIn()
+    async with anyio.create_task_group() as task_group:
+        if request.param == "memory":
+            backplanes = [Backplane()] * 2
+        else:
+            await task_group.start(stand_in.serve)
+            backplanes = [RedisBackplane(f"redis://127.0.0.1:{stand_in.port}") for _ in range(2)]
+            for backplane in backplanes:
+                task_group.start_soon(backplane.run)
+
+        engines = [GameEngine(shard_id=shard, shard_count=2) for shard in range(2)]
+        routers = [create_node(engines[shard], shard, backplanes[shard]) for shard in range(2)]
+        for shard in range(2):
+            task_group.start_soon(serve_tunnels, routers[shard].app, backplanes[shard], shard)
+        # Wait until both nodes listen for tunnels
+        while any(f"shard:{shard}" not in backplanes[shard].subscriptions for shard in range(2)):
+            await anyio.sleep(0.01)
+        yield engines, routers
+        task_group.cancel_scope.cancel()
+
+@pytest.mark.anyio
+async def test_players_on_different_nodes_share_a_lobby(nodes):
+    engines, routers = nodes
+    async with AsyncClient(transport=ASGITransport(app=routers[0]), base_url="http://node0") as client:
+        response = await client.post("/lobby/create-lobby")
+    code = response.json()['data']['code']
+    assert shard_of(code, 2) == 0
+
+    async with anyio.create_task_group() as task_group:
+        owner = WebSocketClient(routers[0], f"/lobby/join-lobby/{code}")
+        remote = WebSocketClient(routers[1], f"/lobby/join-lobby/{code}")
+        await owner.connect(task_group)
+        await owner.send_json({"type": "JOIN_LOBBY", "data": {"id": "TEST_USER", "username": "owner"}})
+        await owner.receive_json()
+
+        # The second player's socket lives on the other node, the lobby broadcast reaches it through the backplane
+        await remote.connect(task_group)
+        await remote.send_json({"type": "JOIN_LOBBY", "data": {"id": "REMOTE_USER", "username": "remote"}})
+        for client in (owner, remote):
+            event = await client.receive_json()
+            assert event['type'] == "STATE_SYNC"
+            assert len(event['data']['users']) == 2
+
+        await owner.send_json({"type": "START_LOBBY", "data": {"user_id": "TEST_USER"}})
+        for client in (owner, remote):
+            event = await client.receive_json()
+            assert event['data']['starting'] is True
+        game_code = event['data']['code']
+        assert game_code in engines[0].games
+
+        await remote.disconnect()
+        await owner.disconnect()
+
+@pytest.mark.anyio
+async def test_lobbies_listed_across_nodes(nodes):
+    engines, routers = nodes
+    codes = [engines[0].create_lobby("FIRST"), engines[1].create_lobby("SECOND")]
+
+    async with AsyncClient(transport=ASGITransport(app=routers[1]), base_url="http://node1") as client:
+        response = await client.get("/lobby/get-lobbies")
+
+    assert sorted(lobby['code'] for lobby in response.json()['lobbies']) == sorted(codes)
+
+@pytest.mark.anyio
+async def test_tunnel_without_backplane_is_unavailable():
+    backplane = RedisBackplane(f"redis://127.0.0.1:{unused_port()}", subscribe_timeout=0.1)
+    router = create_node(GameEngine(shard_id=0, shard_count=2), 0, backplane)
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(backplane.run)
+        async with AsyncClient(transport=ASGITransport(app=router), base_url="http://node0") as client:
+            with anyio.fail_after(2):
+                # Code 1 belongs to the other node's shard
+                response = await client.get("/game/1/replay")
+        task_group.cancel_scope.cancel()
+
+    assert response.status_code == 502
@@ -1,3 +1,4 @@
+import time
 from fastapi import HTTPException
 import pytest
 from app.dependencies import get_user_id, validate_authorization
@@ -29,7 +30,7 @@ async def test_get_user_id_authorization_doesnt_exist():
 @pytest.mark.anyio
 async def test_get_user_id_authorization_wrong_jwt():
     try:
-        await get_user_id({'authorization':"WRONG_JWT"})
+        await get_user_id("WRONG_JWT")
     except HTTPException as e:
         assert e.status_code == HTTP_401_UNAUTHORIZED
         assert 'error' in e.detail
@@ -38,7 +39,17 @@ async def test_get_user_id_authorization_wrong_jwt():
 @pytest.mark.anyio
 async def test_get_user_id_success():
     with patch('app.dependencies.decode_jwt', return_value=({'user_id': 1, 'username': 'TEST_USER', 'exp': 1715273978}, None)):
-        result = await get_user_id({'authorization':"WRONG_JWT"})
+        result = await get_user_id("WRONG_JWT")
 
         assert result == "1"
-        assert isinstance(result, str)
\ No newline at end of file
+        assert isinstance(result, str)
+
+def test_verified_token_is_cached():
+    claims = {'user_id': 1, 'username': 'TEST_USER', 'exp': int(time.time()) + 60}
+    with patch('app.dependencies.decode_jwt', return_value=(claims, None)) as mock_decode:
+        validate_authorization("cached_auth_header")
+        validated, error = validate_authorization("cached_auth_header")
+
+        mock_decode.assert_called_once()
+        assert error is None
+        assert validated['user_id'] == 1
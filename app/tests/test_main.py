@@ -1,5 +1,48 @@
+import os
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.result_writer import ResultWriter
+from app.engine.archive import ArchiveWriter
+from app.engine.engine import GameEngine
+from app.engine.lobby import Lobby
+from app.main import app
+from app.ratings import Ratings
+
 
 def test_read_main(client):
     response = client.get("/hello-world")
     assert response.status_code == 200
-    assert response.json() == {"message":"Hello World"}
\ No newline at end of file
+    assert response.json() == {"message":"Hello World"}
+
+def test_metrics(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "broadcast" in response.json()
+
+def test_lifespan_restores_and_saves_engine(tmp_path, monkeypatch):
+    # Everything the lifespan reads and writes lives under tmp_path, the working directory is left alone
+    path = str(tmp_path / "snapshot.bin")
+    url = f"sqlite:///{tmp_path / 'app.db'}"
+    db_engine = create_engine(url)
+    ratings = Ratings(sessionmaker(bind=db_engine))
+    engine = GameEngine(archive=ArchiveWriter(str(tmp_path / "archive")), result_writer=ResultWriter(sessionmaker(bind=db_engine), ratings=ratings))
+    monkeypatch.setattr("app.main.ENGINE_SNAPSHOT_PATH", path)
+    monkeypatch.setattr("app.main.db_engine", db_engine)
+    monkeypatch.setattr("app.main.async_engine", create_async_engine(url.replace("sqlite", "sqlite+aiosqlite", 1)))
+    monkeypatch.setattr("app.main.ratings", ratings)
+    monkeypatch.setattr("app.main.get_engine", lambda: engine)
+    saved = GameEngine()
+    saved.lobbies["ABCDE"] = Lobby("OWNER", "ABCDE")
+    saved.save_state(path)
+
+    with TestClient(app):
+        assert "ABCDE" in engine.lobbies
+        assert not os.path.exists(path)
+        engine.close_lobby("ABCDE")
+
+    assert os.path.exists(path)
+    assert os.path.exists(tmp_path / "app.db")
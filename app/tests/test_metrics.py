@@ -0,0 +1,33 @@
+from app.metrics import LatencyStats, collect_metrics, register_metrics
+
+
+def test_latency_stats_snapshot():
+    stats = LatencyStats(window=100)
+    for ms in range(1, 101):
+        stats.observe(ms / 1000)
+
+    snapshot = stats.snapshot()
+
+    assert snapshot["count"] == 100
+    assert round(snapshot["p50_ms"]) == 50
+    assert round(snapshot["p99_ms"]) == 99
+    assert round(snapshot["max_ms"]) == 100
+    assert round(snapshot["avg_ms"], 1) == 50.5
+
+def test_latency_stats_window():
+    stats = LatencyStats(window=2)
+    stats.observe(10)
+    stats.observe(0.001)
+    stats.observe(0.002)
+
+    assert stats.count == 3
+    assert stats.max == 10
+    assert stats.percentile(100) == 0.002
+
+def test_empty_latency_stats():
+    assert LatencyStats().snapshot()["p99_ms"] == 0.0
+
+def test_collect_metrics():
+    register_metrics("test_provider", lambda: {"value": 1})
+
+    assert collect_metrics()["test_provider"] == {"value": 1}
@@ -0,0 +1,45 @@
+import anyio.to_process
+import bcrypt
+import pytest
+
+from app.passwords import PasswordPool, PasswordPoolFull
+from app.utils import hash_password
+
+
+@pytest.mark.anyio
+async def test_hash_and_verify_in_workers():
+    pool = PasswordPool(workers=2, max_queue=4)
+
+    hashed = await pool.hash("pool_pw")
+
+    assert bcrypt.checkpw(b"pool_pw", hashed)
+    assert await pool.verify(hashed.decode('utf-8'), "pool_pw") is True
+    assert await pool.verify(hashed.decode('utf-8'), "wrong_pw") is False
+    snapshot = pool.snapshot()
+    assert snapshot["completed"] == 3
+    assert snapshot["pending"] == 0
+    assert snapshot["wait"]["count"] == 3
+
+@pytest.mark.anyio
+async def test_full_pool_rejects():
+    pool = PasswordPool(workers=1, max_queue=1)
+    pool.pending = 2
+
+    with pytest.raises(PasswordPoolFull):
+        await pool.run(hash_password, "pool_pw")
+
+    assert pool.snapshot()["rejected"] == 1
+    assert pool.queued == 1
+
+@pytest.mark.anyio
+async def test_pools_keep_their_own_limits():
+    default_tokens = anyio.to_process.current_default_process_limiter().total_tokens
+    small = PasswordPool(workers=1)
+    large = PasswordPool(workers=3)
+
+    await small.hash("pool_pw")
+    await large.hash("pool_pw")
+
+    assert small.limiter().total_tokens == 1
+    assert large.limiter().total_tokens == 3
+    assert anyio.to_process.current_default_process_limiter().total_tokens == default_tokens
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from app.db.db import DEFAULT_RATING, User
+from app.db.result_writer import ResultWriter
+from app.ratings import K_FACTOR, RankTree, Ratings, elo, expected_score
+
+
+def result_row(x_user_id="1", o_user_id="2", winner_id="1", rated=True):
+    return {"code":"GAME", "x_user_id":x_user_id, "o_user_id":o_user_id, "winner_id":winner_id, "total_turns":5, "started_at":None, "ended_at":datetime(2024, 5, 1), "rated":rated}
+
+def create_users(session, count):
+    users = [User(username=f"user_{i}", password="pw") for i in range(count)]
+    session.add_all(users)
+    session.commit()
+    return [user.id for user in users]
+
+def test_equal_ratings_split_k():
+    assert expected_score(1500, 1500) == 0.5
+    assert elo(1500, 1500, 1.0) == (1500 + K_FACTOR / 2, 1500 - K_FACTOR / 2)
+    assert elo(1500, 1500, 0.5) == (1500, 1500)
+
+def test_upset_moves_more_than_expected_win():
+    favourite_win, _ = elo(1800, 1400, 1.0)
+    _, underdog_win = elo(1800, 1400, 0.0)
+
+    assert underdog_win - 1400 > favourite_win - 1800 > 0
+
+def test_rank_tree_counts_above():
+    tree = RankTree()
+    for rating in (1000, 1200, 1200.7, 1500, 9000, -5):
+        tree.add(rating)
+
+    assert tree.count_above(1200) == 2
+    assert tree.count_above(1500) == 1
+    assert tree.count_above(0) == 5
+
+    tree.add(9000, -1)
+    assert tree.count_above(1500) == 0
+    assert tree.total == 5
+
+def test_record_updates_winner_and_loser(session, ratings):
+    create_users(session, 2)
+
+    ratings.record(result_row(winner_id="1"))
+
+    winner, loser = ratings.get(1), ratings.get(2)
+    assert winner == (DEFAULT_RATING + K_FACTOR / 2, 1)
+    assert loser == (DEFAULT_RATING - K_FACTOR / 2, 1)
+    assert ratings.rank(winner[0]) == 1
+    assert ratings.rank(loser[0]) == 2
+
+def test_tie_counts_as_game(session, ratings):
+    create_users(session, 2)
+
+    ratings.record(result_row(winner_id=None))
+
+    assert ratings.get(1) == (DEFAULT_RATING, 1)
+
+@pytest.mark.parametrize('x_user_id, o_user_id, rated', [("1", "BOT", True), ("1", "1", True), ("1", "2", False)])
+def test_unrated_games_skipped(ratings, x_user_id, o_user_id, rated):
+    ratings.record(result_row(x_user_id, o_user_id, rated=rated))
+
+    assert ratings.rated_games == 0
+    assert ratings.dirty == {}
+
+def test_new_player_ranked(session, ratings):
+    create_users(session, 2)
+    ratings.record(result_row(winner_id="2"))
+
+    ratings.add(3)
+
+    assert ratings.tree.total == 3
+    assert ratings.rank(ratings.get(3)[0]) == 2
+
+@pytest.mark.anyio
+async def test_ratings_written_with_results(session, session_factory, ratings):
+    create_users(session, 2)
+    writer = ResultWriter(session_factory, ratings=ratings)
+
+    writer.enqueue(result_row(winner_id="2"))
+    writer.enqueue(result_row(winner_id="2"))
+    await writer.flush()
+
+    rows = session.execute(select(User.id, User.rating, User.games_played).order_by(User.id)).all()
+    assert [(user_id, rating, games) for user_id, rating, games in rows] == [(1, *ratings.get(1)), (2, *ratings.get(2))]
+    assert rows[1].games_played == 2
+    assert ratings.dirty == {}
+
+    reloaded = Ratings(session_factory)
+    reloaded.load()
+    assert reloaded.players == ratings.players
+
+@pytest.mark.anyio
+async def test_failed_write_keeps_ratings(session, ratings):
+    create_users(session, 2)
+    def broken_session():
+        raise RuntimeError("Database unavailable")
+    writer = ResultWriter(broken_session, ratings=ratings)
+
+    writer.enqueue(result_row())
+    await writer.flush()
+
+    assert set(ratings.dirty) == {1, 2}
+
+@pytest.mark.anyio
+async def test_workers_add_up_rating_changes(session, session_factory):
+    create_users(session, 3)
+    # Each worker rates from its own copy, loaded before either game was written
+    first, second = Ratings(session_factory), Ratings(session_factory)
+    first.load()
+    second.load()
+    first_writer = ResultWriter(session_factory, ratings=first)
+    second_writer = ResultWriter(session_factory, ratings=second)
+
+    first_writer.enqueue(result_row("1", "2", winner_id="1"))
+    second_writer.enqueue(result_row("1", "3", winner_id="1"))
+    await first_writer.flush()
+    await second_writer.flush()
+
+    stored = session.execute(select(User.rating, User.games_played).where(User.id == 1)).one()
+    assert tuple(stored) == (DEFAULT_RATING + K_FACTOR, 2)
+    assert second.get(1) == (DEFAULT_RATING + K_FACTOR, 2)
+
+def test_refresh_keeps_unwritten_changes(session, ratings):
+    create_users(session, 2)
+    ratings.record(result_row(winner_id="1"))
+    ratings.write(session, ratings.take_dirty())
+    ratings.record(result_row(winner_id="1"))
+
+    ratings.refresh([(1, 1600.0, 7)])
+
+    gained = ratings.dirty[1][0]
+    assert ratings.get(1) == (1600.0 + gained, 8)
+    assert ratings.tree.total == 2
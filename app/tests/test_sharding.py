@@ -0,0 +1,156 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import jwt
+import pytest
+import websockets
+
+from app.models import JWTClaims
+from app.sharding import code_shard, shard_of, socket_path
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+JWT_SECRET = "SHARD_TEST_SECRET"
+
+@pytest.fixture
+def anyio_backend():
+    # The websockets client used for forwarding only runs on asyncio
+    return "asyncio"
+
+def test_shard_of():
+    assert shard_of("0000A", 4) == 2
+    assert shard_of("ffffffffff", 2) == 1
+    assert shard_of("NOT HEX", 2) is None
+
+@pytest.mark.parametrize("path, shard", [
+    ("/lobby/join-lobby/00003", 1),
+    ("/game/0000000004", 0),
+    ("/game/0000000005/spectate", 1),
+    ("/game/0000000005/replay", 1),
+    ("/lobby/get-lobbies", None),
+    ("/auth/login", None),
+])
+def test_code_shard(path, shard):
+    assert code_shard(path, 2) == shard
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def cluster(tmp_path_factory):
+    """
+    Runs two sharded workers in their own processes, the way app.cluster is deployed.
+    """
+    tmp_path = tmp_path_factory.mktemp("cluster")
+    port = free_port()
+    socket_dir = str(tmp_path / "sockets")
+    env = {**os.environ, "JWT_SECRET": JWT_SECRET, "PYTHONPATH": REPO_ROOT, "GAME_ARCHIVE_DIR": str(tmp_path / "archive")}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.cluster", "--workers", "2", "--host", "127.0.0.1", "--port", str(port), "--socket-dir", socket_dir],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                statuses = []
+                for shard in range(2):
+                    with httpx.Client(transport=httpx.HTTPTransport(uds=socket_path(shard, socket_dir))) as client:
+                        statuses.append(client.get("http://shard/hello-world").status_code)
+                if statuses == [200, 200]:
+                    break
+            except httpx.HTTPError:
+                pass
+            assert time.monotonic() < deadline, "Workers did not start"
+            time.sleep(0.1)
+        yield f"http://127.0.0.1:{port}", socket_dir
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def authorization(user_id:int) -> dict:
+    claims = JWTClaims(user_id=user_id, username=f"user_{user_id}")
+    return {"authorization": jwt.encode(claims.model_dump(), JWT_SECRET, algorithm="HS256")}
+
+def join_event(user_id:int) -> str:
+    return json.dumps({"type": "JOIN_LOBBY", "data": {"id": str(user_id), "username": f"user_{user_id}"}})
+
+@pytest.mark.anyio
+async def test_lobby_joined_through_another_worker(cluster):
+    _, socket_dir = cluster
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket_path(0, socket_dir)), base_url="http://shard") as client:
+        response = await client.post("/lobby/create-lobby", headers=authorization(1))
+    code = response.json()['data']['code']
+    assert shard_of(code, 2) == 0
+
+    # Both players land on the worker that doesn't own the lobby, and still end up in it together
+    uri = f"ws://shard/lobby/join-lobby/{code}"
+    async with websockets.unix_connect(socket_path(1, socket_dir), uri) as first:
+        await first.send(join_event(1))
+        await first.recv()
+        async with websockets.unix_connect(socket_path(1, socket_dir), uri) as second:
+            await second.send(join_event(2))
+            event = json.loads(await second.recv())
+
+    assert event['type'] == "STATE_SYNC"
+    assert event['data']['code'] == code
+    assert len(event['data']['users']) == 2
+
+@pytest.mark.anyio
+async def test_lobbies_listed_from_every_worker(cluster):
+    url, socket_dir = cluster
+    codes = []
+    for shard in range(2):
+        async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket_path(shard, socket_dir)), base_url="http://shard") as client:
+            response = await client.post("/lobby/create-lobby", headers=authorization(shard + 1))
+            codes.append(response.json()['data']['code'])
+
+    async with httpx.AsyncClient(base_url=url) as client:
+        response = await client.get("/lobby/get-lobbies", headers=authorization(1))
+        unauthorized = await client.get("/lobby/get-lobbies")
+
+    assert response.status_code == 200
+    listed = [lobby['code'] for lobby in response.json()['lobbies']]
+    assert all(code in listed for code in codes)
+    assert unauthorized.status_code == 422
+
+@pytest.mark.anyio
+async def test_lobby_pages_walk_every_worker(cluster):
+    url, socket_dir = cluster
+    codes = []
+    for shard in range(2):
+        async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket_path(shard, socket_dir)), base_url="http://shard") as client:
+            response = await client.post("/lobby/create-lobby", headers=authorization(shard + 1))
+            codes.append(response.json()['data']['code'])
+
+    listed = []
+    cursor = ""
+    async with httpx.AsyncClient(base_url=url) as client:
+        while cursor is not None:
+            response = await client.get(f"/lobby/get-lobbies?limit=1&cursor={cursor}", headers=authorization(1))
+            page = response.json()
+            assert len(page['lobbies']) <= 1
+            listed.extend(lobby['code'] for lobby in page['lobbies'])
+            cursor = page['next_cursor']
+        unchanged = await client.get("/lobby/get-lobbies", headers={**authorization(1), "If-None-Match": (await client.get("/lobby/get-lobbies", headers=authorization(1))).headers['etag']})
+        invalid = await client.get("/lobby/get-lobbies?cursor=7-0", headers=authorization(1))
+
+    assert all(code in listed for code in codes)
+    assert len(listed) == len(set(listed))
+    assert unchanged.status_code == 304
+    assert invalid.status_code == 400
+
+@pytest.mark.anyio
+async def test_request_forwarded_to_owner(cluster):
+    _, socket_dir = cluster
+    async with httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=socket_path(0, socket_dir)), base_url="http://shard") as client:
+        response = await client.get("/game/0000000001/replay", headers=authorization(1))
+
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Game not found"}
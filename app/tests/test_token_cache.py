@@ -0,0 +1,52 @@
+from app.token_cache import TokenCache
+
+
+class FakeClock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_hit_until_exp():
+    clock = FakeClock()
+    cache = TokenCache(max_size=10, ttl=300, clock=clock)
+    cache.put("TOKEN", {"user_id": 1, "exp": 1060})
+
+    assert cache.get("TOKEN") == {"user_id": 1, "exp": 1060}
+    clock.now = 1060
+    assert cache.get("TOKEN") is None
+    assert cache.snapshot()["size"] == 0
+
+def test_ttl_caps_long_lived_tokens():
+    clock = FakeClock()
+    cache = TokenCache(max_size=10, ttl=30, clock=clock)
+    cache.put("TOKEN", {"user_id": 1, "exp": 100000})
+
+    clock.now = 1029
+    assert cache.get("TOKEN") is not None
+    clock.now = 1030
+    assert cache.get("TOKEN") is None
+
+def test_expired_tokens_are_not_cached():
+    cache = TokenCache(max_size=10, ttl=30, clock=FakeClock())
+    cache.put("TOKEN", {"user_id": 1, "exp": 999})
+
+    assert cache.get("TOKEN") is None
+
+def test_least_recently_used_evicted():
+    cache = TokenCache(max_size=2, ttl=30, clock=FakeClock())
+    cache.put("FIRST", {"user_id": 1})
+    cache.put("SECOND", {"user_id": 2})
+    cache.get("FIRST")
+
+    cache.put("THIRD", {"user_id": 3})
+
+    assert cache.get("SECOND") is None
+    assert cache.get("FIRST") is not None
+    assert cache.get("THIRD") is not None
+    snapshot = cache.snapshot()
+    assert snapshot["evictions"] == 1
+    assert snapshot["hits"] == 3
+    assert snapshot["misses"] == 1
+    assert snapshot["hit_rate"] == 0.75
@@ -1,6 +1,6 @@
 import pytest
 from app.models import JWTClaims
-from app.utils import compare_password, create_game_code, create_jwt, create_lobby_code, decode_jwt, hash_password
+from app.utils import compare_password, create_game_code, create_jwt, decode_jwt, hash_password
 from unittest.mock import patch
 import jwt
 
@@ -51,14 +51,16 @@ def test_wrong_password_compare():
 
     assert result is False
 
-def test_create_lobby_code():
-    code = create_lobby_code()
-
-    assert code.isupper()
-    assert len(code) == 5
-
 def test_create_game_code():
     code = create_game_code()
 
     assert len(code) == 10
-    assert isinstance(code, str)
\ No newline at end of file
+    assert isinstance(code, str)
+
+@pytest.mark.parametrize('shard_id', [0, 1, 2])
+def test_codes_belong_to_shard(shard_id):
+    for _ in range(50):
+        game_code = create_game_code(shard_id, 3)
+
+        assert int(game_code, 16) % 3 == shard_id
+        assert len(game_code) == 10
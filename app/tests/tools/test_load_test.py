@@ -0,0 +1,58 @@
+import pytest
+
+from app.tools.load_test import LoadTestError, StageStats, check_local, run_load, serve_locally, websocket_url
+
+
+@pytest.fixture
+def anyio_backend():
+    # websockets only runs on asyncio
+    return "asyncio"
+
+@pytest.fixture(scope="module")
+def server_url():
+    with serve_locally() as url:
+        yield url
+
+def test_check_local():
+    for url in ("http://127.0.0.1:8000", "http://localhost:8000", "http://[::1]:8000"):
+        check_local(url)
+    with pytest.raises(LoadTestError):
+        check_local("http://example.com")
+    with pytest.raises(LoadTestError):
+        check_local("http://10.0.0.5:8000")
+
+def test_websocket_url():
+    assert websocket_url("http://127.0.0.1:8000", "/game/abc", "tok") == "ws://127.0.0.1:8000/game/abc?token=tok"
+
+def test_stage_summary():
+    stats = StageStats(2)
+    for ms in range(1, 101):
+        stats.moves.observe(ms / 1000)
+    stats.elapsed = 2.0
+    stats.errors["move: timeout"] += 1
+
+    summary = stats.summary()
+    assert summary["move_rtt_ms"]["p50"] == pytest.approx(50)
+    assert summary["move_rtt_ms"]["p95"] == pytest.approx(95)
+    assert summary["move_rtt_ms"]["p99"] == pytest.approx(99)
+    assert summary["moves_per_second"] == 50
+    assert summary["errors"] == {"move: timeout": 1}
+
+@pytest.mark.anyio
+async def test_run_load_rejects_remote_hosts():
+    with pytest.raises(LoadTestError):
+        await run_load("http://192.168.1.10:8000", [1], 1, report=lambda line: None)
+
+@pytest.mark.anyio
+async def test_run_load_plays_games(server_url):
+    reports = []
+
+    results = await run_load(server_url, [1, 2], 2, prefix="tested", report=reports.append)
+
+    assert [stats.concurrency for stats in results] == [1, 2]
+    assert [stats.games for stats in results] == [2, 4]
+    assert all(len(stats.errors) == 0 for stats in results)
+    # A game takes at least five moves to win
+    assert results[1].moves.count >= 4 * 5
+    assert results[1].setup.count == 4
+    assert len(reports) == 4
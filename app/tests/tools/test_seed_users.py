@@ -0,0 +1,45 @@
+import bcrypt
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import IntegrityError
+
+from app.db.db import User
+from app.db.migrations import migrate
+from app.tools.seed_users import name_batches, seed_users
+
+
+@pytest.fixture
+def seed_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seed.db'}")
+    migrate(engine)
+    return engine
+
+def test_name_batches():
+    assert list(name_batches("p", 5, 5, 2)) == [["p_5", "p_6"], ["p_7", "p_8"], ["p_9"]]
+
+def test_seed_with_precomputed_hash(seed_engine):
+    reports = []
+
+    rate = seed_users(seed_engine, 25, prefix="seeded", batch_size=10, rounds=4, precomputed_hash=True, report=reports.append)
+
+    with seed_engine.connect() as connection:
+        rows = connection.execute(select(User.username, User.password).order_by(User.id)).all()
+    assert [username for username, _ in rows] == [f"seeded_{i}" for i in range(25)]
+    assert len({password for _, password in rows}) == 1
+    assert bcrypt.checkpw(b"load_test_pw", rows[0].password.encode('utf-8'))
+    assert len(reports) == 4
+    assert rate > 0
+
+def test_seed_hashes_every_user(seed_engine):
+    seed_users(seed_engine, 3, prefix="hashed", batch_size=2, rounds=4, workers=2, password="own_pw", report=lambda line: None)
+
+    with seed_engine.connect() as connection:
+        passwords = connection.execute(select(User.password)).scalars().all()
+    assert len(set(passwords)) == 3
+    assert all(bcrypt.checkpw(b"own_pw", password.encode('utf-8')) for password in passwords)
+
+def test_seed_stops_on_taken_names(seed_engine):
+    seed_users(seed_engine, 2, prefix="taken", rounds=4, precomputed_hash=True, report=lambda line: None)
+
+    with pytest.raises(IntegrityError):
+        seed_users(seed_engine, 2, prefix="TAKEN", rounds=4, precomputed_hash=True, report=lambda line: None)
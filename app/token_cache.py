@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from app.metrics import register_metrics
+from app.settings import settings
+
+class TokenCache():
+    """
+    Bounded LRU of tokens whose signature was already verified, mapped to their claims.
+    An entry lasts until the token's exp or the TTL, whichever comes first, so an expired token is never let through.
+    """
+    def __init__(self, max_size: int = settings.token_cache_size, ttl: float = settings.token_cache_ttl, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        # exp is wall clock time, so the cache has to use it too
+        self.clock = clock
+        self.entries: OrderedDict[str, Tuple[dict, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self.entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        claims, expires_at = entry
+        if self.clock() >= expires_at:
+            del self.entries[token]
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(token)
+        self.hits += 1
+        return claims
+
+    def put(self, token: str, claims: dict):
+        now = self.clock()
+        expires_at = now + self.ttl
+        exp = claims.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= now or self.max_size <= 0:
+            return
+
+        self.entries[token] = (claims, expires_at)
+        self.entries.move_to_end(token)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+token_cache = TokenCache()
+register_metrics("token_cache", token_cache.snapshot)
@@ -0,0 +1,308 @@
+"""
+Drives simulated players through the real lobby to game flow against a server on this machine.
+
+    python -m app.tools.load_test --serve --ramp 1,10,50 --games 3
+
+Players sign up, or log in if they already exist. Then each pair runs this flow:
+- The owner creates a lobby with POST /lobby/create-lobby.
+- Both players join it with JOIN_LOBBY on /lobby/join-lobby/{code}, and the owner sends START_LOBBY.
+- Both connect to /game/{code} with USER_CONNECTED on the delta protocol.
+- They take turns sending USER_TURN with random free tiles until the game ends.
+
+Every stage of the ramp runs that many pairs at once, each pair playing --games games in a row.
+Each stage reports:
+- setup time, from creating the lobby to both players holding the started game
+- round trip time of every move, from sending USER_TURN to the mover getting its GAME_DELTA
+- errors by the step they happened in
+
+Only loopback addresses are accepted. --serve starts a throwaway server with its own database and stops it afterwards.
+"""
+import argparse
+import json
+import os
+import random
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import anyio
+import httpx
+import websockets
+
+from app.metrics import LatencyStats
+
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+DEFAULT_URL = "http://127.0.0.1:8000"
+DEFAULT_PASSWORD = "load_test_pw"
+# Signups hash with bcrypt, past the password pool's queue the server answers 503
+AUTH_CONCURRENCY = 8
+AUTH_RETRIES = 5
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class Player():
+    def __init__(self, user_id: str, username: str, token: str):
+        self.user_id = user_id
+        self.username = username
+        self.token = token
+
+class StageStats():
+    """
+    Everything one stage of the ramp measured. Latencies keep every sample so percentiles cover the whole stage.
+    """
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.setup = LatencyStats(window=None)
+        self.moves = LatencyStats(window=None)
+        self.games = 0
+        self.errors: Counter = Counter()
+        self.elapsed = 0.0
+
+    def summary(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "games": self.games,
+            "moves": self.moves.count,
+            "moves_per_second": self.moves.count / self.elapsed if self.elapsed > 0 else 0.0,
+            "setup_ms": {f"p{percent}": self.setup.percentile(percent) * 1000 for percent in (50, 95, 99)},
+            "move_rtt_ms": {f"p{percent}": self.moves.percentile(percent) * 1000 for percent in (50, 95, 99)},
+            "errors": dict(self.errors),
+        }
+
+class LoadTestError(Exception):
+    pass
+
+def check_local(url: str):
+    host = urlsplit(url).hostname
+    if host not in LOOPBACK_HOSTS:
+        raise LoadTestError(f"Refusing to load test {host}, only this machine is allowed")
+
+def websocket_url(base_url: str, path: str, token: str) -> str:
+    parts = urlsplit(base_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    return f"{scheme}://{parts.netloc}{path}?token={token}"
+
+async def post_with_retry(http: httpx.AsyncClient, path: str, **kwargs) -> httpx.Response:
+    for attempt in range(AUTH_RETRIES):
+        response = await http.post(path, **kwargs)
+        if response.status_code != 503 or attempt == AUTH_RETRIES - 1:
+            return response
+        await anyio.sleep(float(response.headers.get("retry-after", "1")))
+    return response
+
+async def authenticate(http: httpx.AsyncClient, username: str, password: str) -> Player:
+    credentials = {"username": username, "password": password}
+    response = await post_with_retry(http, "/auth/signup", json=credentials)
+    if response.status_code == 400:
+        response = await post_with_retry(http, "/auth/login", json=credentials)
+    if response.status_code != 200:
+        raise LoadTestError(f"auth {response.status_code}")
+    body = response.json()
+    return Player(str(body["user_id"]), body["username"], body["token"])
+
+async def receive_until(ws, matches: Callable[[dict], bool], timeout: float) -> dict:
+    """
+    Reads events until one matches, skipping the rest. Errors out if the server reports the event as invalid.
+    """
+    with anyio.fail_after(timeout):
+        while True:
+            event = json.loads(await ws.recv())
+            if matches(event):
+                return event
+            if event["type"] in ("INVALID_EVENT", "UNAUTHORIZED", "LOBBY_FULL", "USER_DISCONNECTED"):
+                raise LoadTestError(event["type"].lower())
+
+async def play_game(http: httpx.AsyncClient, base_url: str, owner: Player, guest: Player, stats: StageStats, timeout: float, rng: random.Random):
+    players = [owner, guest]
+    step = "create_lobby"
+    try:
+        started = time.perf_counter()
+        response = await http.post("/lobby/create-lobby", headers={"authorization": owner.token})
+        if response.status_code != 200:
+            raise LoadTestError(f"status {response.status_code}")
+        lobby_code = response.json()["data"]["code"]
+
+        step = "lobby"
+        lobby_path = f"/lobby/join-lobby/{lobby_code}"
+        async with websockets.connect(websocket_url(base_url, lobby_path, owner.token)) as owner_lobby, \
+                websockets.connect(websocket_url(base_url, lobby_path, guest.token)) as guest_lobby:
+            lobby_sockets = [owner_lobby, guest_lobby]
+            for player, ws in zip(players, lobby_sockets):
+                await ws.send(json.dumps({"type": "JOIN_LOBBY", "data": {"id": player.user_id, "username": player.username}}))
+            await receive_until(owner_lobby, lambda event: event["type"] == "STATE_SYNC" and len(event["data"]["users"]) == 2, timeout)
+            await owner_lobby.send(json.dumps({"type": "START_LOBBY", "data": {"user_id": owner.user_id}}))
+            starting = [await receive_until(ws, lambda event: event["type"] == "LOBBY_STARTING", timeout) for ws in lobby_sockets]
+        game_code = starting[0]["data"]["code"]
+
+        step = "game_connect"
+        game_path = f"/game/{game_code}"
+        async with websockets.connect(websocket_url(base_url, game_path, owner.token)) as owner_game, \
+                websockets.connect(websocket_url(base_url, game_path, guest.token)) as guest_game:
+            game_sockets = {owner.user_id: owner_game, guest.user_id: guest_game}
+            for player in players:
+                await game_sockets[player.user_id].send(json.dumps({"type": "USER_CONNECTED", "data": {"user_id": player.user_id, "protocol": "DELTA"}}))
+            # Once both are connected each gets FIRST_TURN and then the started game, which says whose turn it is
+            started_syncs = [await receive_until(ws, lambda event: event["type"] == "GAME_SYNC" and event["data"]["status"] == "STARTED", timeout) for ws in game_sockets.values()]
+            stats.setup.observe(time.perf_counter() - started)
+
+            step = "move"
+            turn = started_syncs[0]["data"]["turn"]["id"]
+            free_tiles = list(range(9))
+            while True:
+                tile = free_tiles.pop(rng.randrange(len(free_tiles)))
+                mover = game_sockets[turn]
+                sent = time.perf_counter()
+                await mover.send(json.dumps({"type": "USER_TURN", "data": {"tile_index": tile}}))
+                delta = await receive_until(mover, lambda event: event["type"] == "GAME_DELTA" and event["data"]["tile_index"] == tile, timeout)
+                stats.moves.observe(time.perf_counter() - sent)
+                # The turn only stays with the mover when that move ended the game
+                if delta["data"]["turn"] == turn:
+                    break
+                turn = delta["data"]["turn"]
+
+            step = "result"
+            for ws in game_sockets.values():
+                await receive_until(ws, lambda event: event["type"] == "RESULT", timeout)
+        stats.games += 1
+    except TimeoutError:
+        stats.errors[f"{step}: timeout"] += 1
+    except LoadTestError as e:
+        stats.errors[f"{step}: {e}"] += 1
+    except (OSError, httpx.HTTPError, websockets.WebSocketException) as e:
+        stats.errors[f"{step}: {e.__class__.__name__}"] += 1
+
+async def run_stage(http: httpx.AsyncClient, base_url: str, pairs: List[List[Player]], games: int, timeout: float, seed: int) -> StageStats:
+    stats = StageStats(len(pairs))
+
+    async def run_pair(owner: Player, guest: Player, pair_seed: int):
+        rng = random.Random(pair_seed)
+        for _ in range(games):
+            await play_game(http, base_url, owner, guest, stats, timeout, rng)
+
+    started = time.perf_counter()
+    async with anyio.create_task_group() as task_group:
+        for ix, (owner, guest) in enumerate(pairs):
+            task_group.start_soon(run_pair, owner, guest, seed + ix)
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+async def create_players(http: httpx.AsyncClient, count: int, prefix: str, password: str) -> List[Player]:
+    players: List[Optional[Player]] = [None] * count
+    limiter = anyio.CapacityLimiter(AUTH_CONCURRENCY)
+
+    async def sign_in(ix: int):
+        async with limiter:
+            players[ix] = await authenticate(http, f"{prefix}_{ix}", password)
+
+    async with anyio.create_task_group() as task_group:
+        for ix in range(count):
+            task_group.start_soon(sign_in, ix)
+    return [player for player in players if player is not None]
+
+async def run_load(base_url: str, ramp: List[int], games: int, prefix: str = "load", password: str = DEFAULT_PASSWORD,
+                   timeout: float = 10, seed: int = 0, report: Callable[[str], None] = print) -> List[StageStats]:
+    check_local(base_url)
+    results = []
+    # Enough sockets for every player of the largest stage, with their lobby and game sockets
+    limits = httpx.Limits(max_connections=max(ramp) * 2 + AUTH_CONCURRENCY)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout * 3, limits=limits) as http:
+        started = time.perf_counter()
+        players = await create_players(http, max(ramp) * 2, prefix, password)
+        report(f"{len(players)} players signed in in {time.perf_counter() - started:.1f}s")
+        if len(players) < max(ramp) * 2:
+            raise LoadTestError("Not every player could sign in")
+
+        report(f"{'pairs':>6} {'games':>6} {'errors':>7} {'setup p50':>10} {'p95':>8} {'p99':>8} {'move p50':>9} {'p95':>8} {'p99':>8} {'moves/s':>8}")
+        for concurrency in ramp:
+            pairs = [players[ix * 2:ix * 2 + 2] for ix in range(concurrency)]
+            stats = await run_stage(http, base_url, pairs, games, timeout, seed)
+            summary = stats.summary()
+            setup, moves = summary["setup_ms"], summary["move_rtt_ms"]
+            report(f"{concurrency:>6} {stats.games:>6} {sum(stats.errors.values()):>7} {setup['p50']:>8.1f}ms {setup['p95']:>6.1f}ms {setup['p99']:>6.1f}ms "
+                   f"{moves['p50']:>7.2f}ms {moves['p95']:>6.2f}ms {moves['p99']:>6.2f}ms {summary['moves_per_second']:>8.0f}")
+            for error, count in sorted(stats.errors.items()):
+                report(f"{'':>6} {count:>6} x {error}")
+            results.append(stats)
+    return results
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def serve_locally(workers: int = 1, startup_timeout: float = 30) -> Iterator[str]:
+    """
+    Runs app.cluster on a free loopback port with a database, snapshot and archive of its own, yields its URL.
+    """
+    directory = tempfile.mkdtemp(prefix="ttt_load_")
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": REPO_ROOT,
+        "JWT_SECRET": secrets.token_hex(16),
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(directory, 'load.db')}",
+        "ENGINE_SNAPSHOT_PATH": os.path.join(directory, "snapshot.bin"),
+        "GAME_ARCHIVE_DIR": os.path.join(directory, "archive"),
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.cluster", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port), "--socket-dir", os.path.join(directory, "sockets")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                if httpx.get(f"{url}/auth/hello-world").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise LoadTestError("The server did not start")
+            time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            # Games abandoned by a failed run hold the graceful shutdown open until their resume grace runs out
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the lobby to game flow over websockets, on this machine only")
+    parser.add_argument("--url", default=DEFAULT_URL, help="Server to test, must be a loopback address")
+    parser.add_argument("--serve", action="store_true", help="Start a throwaway server instead of using --url")
+    parser.add_argument("--serve-workers", type=int, default=1, help="Worker processes of the --serve server")
+    parser.add_argument("--ramp", default="1,10,50", help="Comma separated numbers of games played at once, one stage each")
+    parser.add_argument("--games", type=int, default=3, help="Games every pair plays in a row per stage")
+    parser.add_argument("--prefix", default="load", help="Players are named prefix_N")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--timeout", type=float, default=10, help="Seconds to wait for any single reply")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    ramp = [int(stage) for stage in args.ramp.split(",")]
+
+    async def run(url: str):
+        await run_load(url, ramp, args.games, args.prefix, args.password, args.timeout, args.seed)
+
+    try:
+        if args.serve:
+            with serve_locally(args.serve_workers) as url:
+                anyio.run(run, url)
+        else:
+            anyio.run(run, args.url)
+    except LoadTestError as e:
+        sys.exit(str(e))
+
+if __name__ == "__main__":
+    main()
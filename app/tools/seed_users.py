@@ -0,0 +1,93 @@
+"""
+Fills the user table with generated players for load tests.
+
+    python -m app.tools.seed_users --count 1000000 --precomputed-hash
+
+Every player gets the same password, so a load test can log in as any of them. By default each one is hashed
+with its own salt in a process pool, the way signup does it. --precomputed-hash hashes the password once and
+stores that for everyone, which skips nearly all of the cost.
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from sqlalchemy import Engine, insert
+
+from app.db.db import User, create_engines
+from app.db.migrations import migrate
+from app.settings import settings
+from app.utils import BCRYPT_ROUNDS, hash_password
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_PASSWORD = "load_test_pw"
+
+def hash_text(password: str, rounds: int) -> str:
+    return hash_password(password, rounds).decode('utf-8')
+
+def name_batches(prefix: str, start: int, count: int, batch_size: int) -> Iterator[List[str]]:
+    for offset in range(start, start + count, batch_size):
+        yield [f"{prefix}_{i}" for i in range(offset, min(offset + batch_size, start + count))]
+
+def hash_batch(pool: Optional[Executor], names: List[str], password: str, rounds: int, fixed_hash: Optional[str]) -> Iterable[str]:
+    if pool is None:
+        return itertools.repeat(fixed_hash, len(names))
+    # map submits the whole batch right away, the hashes are collected when the batch is written
+    return pool.map(hash_text, itertools.repeat(password, len(names)), itertools.repeat(rounds, len(names)), chunksize=64)
+
+def seed_users(engine: Engine, count: int, prefix: str = "player", start: int = 0, password: str = DEFAULT_PASSWORD, batch_size: int = DEFAULT_BATCH_SIZE,
+               rounds: int = BCRYPT_ROUNDS, workers: int = os.cpu_count() or 1, precomputed_hash: bool = False, report: Callable[[str], None] = print) -> float:
+    """
+    Inserts count users named prefix_start onwards, one transaction per batch. Returns the rows per second achieved.
+    """
+    fixed_hash = hash_text(password, rounds) if precomputed_hash else None
+    pool = ProcessPoolExecutor(max_workers=workers) if not precomputed_hash else None
+    user_table = User.__table__
+    seeded = 0
+    started = time.perf_counter()
+    try:
+        batches = name_batches(prefix, start, count, batch_size)
+        names = next(batches, None)
+        hashes = hash_batch(pool, names, password, rounds, fixed_hash) if names is not None else None
+        while names is not None:
+            # The next batch hashes in the pool while this one is written
+            next_names = next(batches, None)
+            next_hashes = hash_batch(pool, next_names, password, rounds, fixed_hash) if next_names is not None else None
+
+            rows = [{"username": username, "password": hashed} for username, hashed in zip(names, hashes)]
+            with engine.begin() as connection:
+                connection.execute(insert(user_table), rows)
+            seeded += len(rows)
+            report(f"{seeded}/{count} users, {seeded / (time.perf_counter() - started):.0f} rows/s")
+
+            names, hashes = next_names, next_hashes
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.perf_counter() - started
+    rate = seeded / elapsed if elapsed > 0 else 0.0
+    report(f"Seeded {seeded} users in {elapsed:.1f}s, {rate:.0f} rows/s")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description="Insert generated users for load tests")
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--prefix", default="player", help="Users are named prefix_N")
+    parser.add_argument("--start", type=int, default=0, help="First N, to add more users to an already seeded database")
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--rounds", type=int, default=BCRYPT_ROUNDS, help="bcrypt cost, signup uses %(default)s")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Hashing processes")
+    parser.add_argument("--precomputed-hash", action="store_true", help="Hash the password once and store it for every user")
+    parser.add_argument("--database-url", default=settings.database_url)
+    args = parser.parse_args()
+
+    _, engine = create_engines(settings.model_copy(update={"database_url": args.database_url}))
+    migrate(engine)
+    seed_users(engine, args.count, args.prefix, args.start, args.password, args.batch_size, args.rounds, args.workers, args.precomputed_hash)
+
+if __name__ == "__main__":
+    main()
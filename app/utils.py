@@ -2,15 +2,15 @@ import jwt
 import os
 import bcrypt
 from app.models import JWTClaims
-from Crypto.Hash import SHA256
+from app.settings import settings
 
 def create_jwt(data: JWTClaims):
-    encoded = jwt.encode(data.model_dump(), os.getenv("JWT_SECRET", ""), algorithm="HS256")
+    encoded = jwt.encode(data.model_dump(), settings.jwt_secret, algorithm=settings.jwt_algorithm)
     return encoded
 
 def decode_jwt(token: str):
     try:
-        decoded = jwt.decode(token, os.getenv("JWT_SECRET", ""), algorithms=["HS256"])
+        decoded = jwt.decode(token, settings.jwt_secret, algorithms=[settings.jwt_algorithm])
         return decoded, None
     except jwt.InvalidSignatureError:
         print("Invalid secret key")
@@ -25,9 +25,11 @@ def decode_jwt(token: str):
         print(f"An unexpected error occurred: {str(e)}")
         return None, "An unexpected error has occured"
     
-def hash_password(password:str):
+BCRYPT_ROUNDS = 12
+
+def hash_password(password:str, rounds:int = BCRYPT_ROUNDS):
     encoded = password.encode('utf-8')
-    salt = bcrypt.gensalt(12)
+    salt = bcrypt.gensalt(rounds)
     hashed = bcrypt.hashpw(encoded, salt)
 
     return hashed
@@ -39,18 +41,17 @@ def compare_password(hashed:str, normal:str) -> bool:
 
     return result
 
-def create_lobby_code():
-    random_bytes = os.urandom(32)
-    hash_object = SHA256.new(data=random_bytes)
-    random_hash = hash_object.hexdigest()
-    lobby_code = random_hash[:5].upper()
-
-    return lobby_code
-
-def create_game_code():
-    random_bytes = os.urandom(32)
-    hash_object = SHA256.new(data=random_bytes)
-    random_hash = hash_object.hexdigest()
-    game_code = random_hash[:10]
+def shard_hex_code(random_hash:str, length:int, shard_id:int, shard_count:int) -> str:
+    # Moves the random value to the nearest one congruent to the shard, so the code alone says which worker owns it
+    value = int(random_hash[:length], 16)
+    value = value - value % shard_count + shard_id
+    if value >= 16 ** length:
+        value -= shard_count
+    return format(value, f"0{length}x")
+
+def create_game_code(shard_id:int = 0, shard_count:int = 1):
+    # Random bytes are already uniform, there is nothing a hash on top would add
+    random_hex = os.urandom(5).hex()
+    game_code = shard_hex_code(random_hex, 10, shard_id, shard_count)
 
     return game_code
\ No newline at end of file
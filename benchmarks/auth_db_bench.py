@@ -0,0 +1,112 @@
+"""
+Signup and login database throughput with many concurrent clients, before and after the async database layer,
+along with how long the event loop stalls meanwhile. Password hashing runs in worker processes and is left out.
+
+before: sync sessions called straight from coroutines, default sqlite journal.
+after:  async sessions through aiosqlite, WAL and the tuned pragmas.
+
+Run with: python -m benchmarks.auth_db_bench
+"""
+import os
+import tempfile
+import time
+
+import anyio
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.db.db import AsyncSessionLocal, Base, User, create_engines
+from app.db.repository import CreateUserRequest, create_user, get_user_by_username
+from app.settings import Settings
+
+USERS = 2000
+CONCURRENCY = [1, 16, 64]
+PASSWORD = "$2b$12$" + "x" * 53
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+async def measure(name, concurrency, client):
+    """
+    Runs USERS signups and logins split over concurrency clients, while a ticker records how late each 1ms sleep wakes up.
+    """
+    lags = []
+    done = anyio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await anyio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    async def worker(offset):
+        for i in range(offset, USERS, concurrency):
+            await client(f"user_{concurrency}_{i}")
+
+    started = time.perf_counter()
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(ticker)
+        async with anyio.create_task_group() as workers:
+            for offset in range(concurrency):
+                workers.start_soon(worker, offset)
+        done.set()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {concurrency:>6} {USERS * 2 / elapsed:>10.0f} {percentile(lags, 99) * 1000:>10.2f}ms {max(lags) * 1000:>10.2f}ms")
+
+
+def before(path):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(autoflush=False, autocommit=False, bind=engine)
+
+    async def client(username):
+        # What signup and login did before, blocking the loop for every query
+        with session_factory() as db:
+            if db.execute(select(User).where(User.username == username).limit(1)).scalars().first() is None:
+                db_user = User(username=username, password=PASSWORD)
+                db.add(db_user)
+                db.commit()
+                db.refresh(db_user)
+        with session_factory() as db:
+            db.execute(select(User).where(User.username == username).limit(1)).scalars().first()
+
+    return client, engine.dispose
+
+
+def after(path):
+    async_engine, engine = create_engines(Settings(database_url=f"sqlite+aiosqlite:///{path}"))
+    Base.metadata.create_all(engine)
+    AsyncSessionLocal.configure(bind=async_engine)
+
+    async def client(username):
+        async with AsyncSessionLocal() as db:
+            if await get_user_by_username(username, db) is None:
+                await create_user(CreateUserRequest(username=username, password=PASSWORD), db)
+        async with AsyncSessionLocal() as db:
+            await get_user_by_username(username, db)
+
+    async def dispose():
+        await async_engine.dispose()
+        engine.dispose()
+
+    return client, dispose
+
+
+async def main():
+    directory = tempfile.mkdtemp()
+    print(f"{'':<8} {'tasks':>6} {'ops/s':>10} {'loop p99':>12} {'loop max':>12}")
+    for concurrency in CONCURRENCY:
+        client, dispose = before(os.path.join(directory, f"before_{concurrency}.db"))
+        await measure("before", concurrency, client)
+        dispose()
+    for concurrency in CONCURRENCY:
+        client, dispose = after(os.path.join(directory, f"after_{concurrency}.db"))
+        await measure("after", concurrency, client)
+        await dispose()
+
+
+if __name__ == "__main__":
+    anyio.run(main)
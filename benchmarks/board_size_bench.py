@@ -0,0 +1,52 @@
+"""
+Per move cost of checking for a win or tie after a mark is placed, as the board grows.
+
+Run with: python -m benchmarks.board_size_bench
+"""
+import random
+import timeit
+
+from app.engine.game import Game
+from app.models import BoardSettings, LobbyUser
+
+SIZES = [(3, 3, 3), (7, 7, 4), (11, 11, 5), (15, 15, 5), (19, 19, 5)]
+
+
+def half_filled_game(settings: BoardSettings) -> Game:
+    users = {"X_ID": LobbyUser(id="X_ID", username="x"), "O_ID": LobbyUser(id="O_ID", username="o")}
+    game = Game(users, board_settings=settings)
+    rng = random.Random(1)
+    # Scatter marks so lines through the next move are partly filled, without finishing the game
+    for tile_ix in rng.sample(range(game.tile_count), game.tile_count // 2):
+        bits = 1 << tile_ix
+        if rng.random() < 0.5:
+            game.x_bits |= bits
+        else:
+            game.o_bits |= bits
+    return game
+
+
+def move_cost(settings: BoardSettings, number: int) -> float:
+    game = half_filled_game(settings)
+    free_tiles = [i for i in range(game.tile_count) if not (game.x_bits | game.o_bits) >> i & 1]
+    x_bits = game.x_bits
+
+    def move():
+        for tile_ix in free_tiles:
+            game.x_bits = x_bits | 1 << tile_ix
+            game.last_move = tile_ix
+            game.check_win("X")
+            game.check_tie()
+
+    return timeit.timeit(move, number=number) / (number * len(free_tiles))
+
+
+def main():
+    for rows, columns, win_length in SIZES:
+        settings = BoardSettings(rows=rows, columns=columns, win_length=win_length)
+        cost = move_cost(settings, 200)
+        print(f"{rows:>2}x{columns:<2} k={win_length}: {cost * 1e6:6.2f} us/move")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compares the bitboard Game against the original list based board.
+
+Run with: python -m benchmarks.game_bench
+"""
+import asyncio
+import sys
+import timeit
+
+from app.engine.board import winning_combinations
+from app.engine.game import Game
+from app.engine.game_events import CheckWinResult, GameStatusEnum, UserTurnEvent
+from app.models import LobbyUser
+
+# X and O alternate, nobody wins and the ninth move fills the board
+TIE_GAME = [0, 1, 2, 4, 3, 5, 7, 6, 8]
+
+
+class ListBoardGame(Game):
+    """
+    The board representation Game used before bitboards, kept here as the baseline.
+    """
+    def __init__(self, users):
+        super().__init__(users)
+        self.list_board = ["" for _ in range(9)]
+
+    # Syncs read the list itself, the bitboards are never touched
+    @property
+    def board(self):
+        return self.list_board
+
+    @board.setter
+    def board(self, board):
+        self.list_board = board
+
+    async def check_valid_move(self, event):
+        tile_ix = event.data.tile_index
+        if self.list_board[tile_ix] != "":
+            return False
+        self.list_board[tile_ix] = self.get_mark()
+        return True
+
+    def check_win(self, mark):
+        for combination in winning_combinations:
+            if all(self.list_board[i] == mark for i in combination):
+                return CheckWinResult(is_win=True, combination=combination)
+        return CheckWinResult(is_win=False, combination=None)
+
+    def check_tie(self):
+        if "" in self.list_board:
+            return False
+        return True
+
+
+class SinkWebSocket():
+    async def send_json(self, data):
+        pass
+
+    async def send_text(self, text):
+        pass
+
+    async def close(self):
+        pass
+
+
+def new_game(game_class):
+    users = {"X_ID": LobbyUser(id="X_ID", username="x"), "O_ID": LobbyUser(id="O_ID", username="o")}
+    game = game_class(users)
+    game.websockets = {"X_ID": SinkWebSocket(), "O_ID": SinkWebSocket()}
+    game.status = GameStatusEnum.STARTED
+    return game
+
+
+async def play(game_class, games):
+    moves = [UserTurnEvent(data={"tile_index": tile}) for tile in TIE_GAME]
+    for _ in range(games):
+        game = new_game(game_class)
+        for event in moves:
+            await game.game_loop(game.user_ids[game.turn], event)
+
+
+def bench_checks(game_class, number):
+    game = new_game(game_class)
+    # A full board without a winner is the worst case for both checks
+    game.board = ["X", "O", "X", "X", "O", "O", "O", "X", "X"]
+    game.last_move = 8
+    win = timeit.timeit(lambda: game.check_win("X"), number=number)
+    tie = timeit.timeit(game.check_tie, number=number)
+    return win, tie
+
+
+def board_size(game):
+    if isinstance(game, ListBoardGame):
+        return sys.getsizeof(game.list_board)
+    return sys.getsizeof(game.x_bits) + sys.getsizeof(game.o_bits)
+
+
+def main():
+    number = 200_000
+    games = 5_000
+    for name, game_class in (("list", ListBoardGame), ("bitboard", Game)):
+        win, tie = bench_checks(game_class, number)
+        loop_time = timeit.timeit(lambda: asyncio.run(play(game_class, games)), number=1)
+        print(f"{name:>8}: check_win {win / number * 1e9:8.0f} ns  "
+              f"check_tie {tie / number * 1e9:6.0f} ns  "
+              f"game_loop {loop_time / (games * len(TIE_GAME)) * 1e6:6.2f} us/move  "
+              f"board {board_size(new_game(game_class))} bytes")
+
+
+if __name__ == "__main__":
+    main()
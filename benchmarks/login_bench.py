@@ -0,0 +1,75 @@
+"""
+Login lookup latency with 1M users, with the username index and without it as before.
+
+Run with: python -m benchmarks.login_bench
+"""
+import os
+import random
+import tempfile
+import time
+
+import anyio
+from sqlalchemy import insert, text
+
+from app.db.db import AsyncSessionLocal, User, create_engines
+from app.db.migrations import migrate
+from app.db.repository import get_user_by_username
+from app.settings import Settings
+
+USERS = 1_000_000
+BATCH = 50_000
+INDEXED_SAMPLES = 5000
+SCAN_SAMPLES = 50
+PASSWORD = "$2b$12$" + "x" * 53
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+def report(name, samples):
+    print(f"{name:<24} {len(samples):>8} {percentile(samples, 50) * 1e3:>9.3f}ms {percentile(samples, 99) * 1e3:>9.3f}ms {max(samples) * 1e3:>9.3f}ms")
+
+
+def seed(engine):
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        for offset in range(0, USERS, BATCH):
+            connection.execute(insert(User), [{"username": f"Player_{i}", "password": PASSWORD} for i in range(offset, min(offset + BATCH, USERS))])
+    print(f"seeded {USERS} users in {time.perf_counter() - started:.1f}s")
+
+
+async def lookups(samples):
+    latencies = []
+    for _ in range(samples):
+        # Logins type names in any case
+        username = f"player_{random.randrange(USERS)}"
+        started = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            user = await get_user_by_username(username, db)
+        latencies.append(time.perf_counter() - started)
+        assert user is not None
+    return latencies
+
+
+async def main():
+    path = os.path.join(tempfile.mkdtemp(), "login.db")
+    async_engine, engine = create_engines(Settings(database_url=f"sqlite+aiosqlite:///{path}"))
+    AsyncSessionLocal.configure(bind=async_engine)
+    migrate(engine)
+    seed(engine)
+
+    print(f"{'':<24} {'lookups':>8} {'p50':>11} {'p99':>11} {'max':>11}")
+    report("indexed", await lookups(INDEXED_SAMPLES))
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_user_username"))
+    report("full scan (before)", await lookups(SCAN_SAMPLES))
+
+    await async_engine.dispose()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    anyio.run(main)
@@ -0,0 +1,102 @@
+"""
+Latency of matchmaking queue operations with 100k players going through it, and with 100k left waiting in it.
+
+Run with: python -m benchmarks.matchmaking_bench
+"""
+import random
+import time
+
+import anyio
+
+from app.engine.matchmaking import BUCKET_WIDTH, MAX_WINDOW, MatchmakingQueue
+from app.engine.timer_wheel import TimerWheel
+from app.models import LobbyUser
+
+PLAYERS = 100_000
+SAMPLES = 10_000
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * percent / 100), len(ordered) - 1)]
+
+
+def report(name, samples):
+    print(f"{name:<28} {len(samples):>8} {percentile(samples, 50) * 1e6:>8.2f}us {percentile(samples, 99) * 1e6:>8.2f}us {max(samples) * 1e6:>8.2f}us")
+
+
+def make_queue():
+    codes = iter(range(10 ** 9))
+    return MatchmakingQueue(lambda first, second: str(next(codes)), wheel=TimerWheel(tick=1))
+
+
+def arrivals():
+    """
+    Players arrive with normally spread ratings, the wheel ticks every 1000 arrivals and one in ten gives up waiting.
+    """
+    queue = make_queue()
+    joins = []
+    ticks = []
+    waiting = []
+    largest = 0
+    for i in range(PLAYERS):
+        rating = min(max(int(random.gauss(1500, 350)), 0), 3000)
+        user = LobbyUser(id=str(i), username="player")
+        started = time.perf_counter()
+        ticket = queue.join(user, rating)
+        joins.append(time.perf_counter() - started)
+        if not ticket.matched.is_set():
+            waiting.append(ticket)
+        if i % 10 == 0 and waiting:
+            queue.leave(waiting.pop(random.randrange(len(waiting))))
+        if i % 1000 == 0:
+            started = time.perf_counter()
+            queue.advance()
+            ticks.append(time.perf_counter() - started)
+        largest = max(largest, len(queue.tickets))
+    print(f"arrivals: {PLAYERS} players, {queue.matches} matches, at most {largest} waiting at once")
+    report("join and match", joins)
+    report("wheel tick", ticks)
+
+
+def resident():
+    """
+    100k players too far apart to ever match stay queued, operations then run against the full queue.
+    """
+    queue = make_queue()
+    spacing = (MAX_WINDOW // BUCKET_WIDTH + 2) * BUCKET_WIDTH * 2
+    for i in range(PLAYERS):
+        queue.join(LobbyUser(id=f"resident_{i}", username="player"), i * spacing)
+    print(f"resident: {len(queue.tickets)} players waiting in {len(queue.bucket_ids)} buckets")
+
+    matches = []
+    unmatched = []
+    leaves = []
+    for i in range(SAMPLES):
+        target = random.randrange(PLAYERS)
+        if f"resident_{target}" not in queue.tickets:
+            continue
+        started = time.perf_counter()
+        queue.join(LobbyUser(id=f"matcher_{i}", username="player"), target * spacing + BUCKET_WIDTH)
+        matches.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        ticket = queue.join(LobbyUser(id=f"loner_{i}", username="player"), target * spacing + spacing // 2)
+        unmatched.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        queue.leave(ticket)
+        leaves.append(time.perf_counter() - started)
+    report("join and match", matches)
+    report("join without match", unmatched)
+    report("leave", leaves)
+
+
+async def main():
+    print(f"{'':<28} {'ops':>8} {'p50':>10} {'p99':>10} {'max':>10}")
+    arrivals()
+    resident()
+
+
+if __name__ == "__main__":
+    anyio.run(main)
@@ -0,0 +1,71 @@
+"""
+Time and size of an engine snapshot and restore as the number of in-flight games grows.
+
+Run with: python -m benchmarks.snapshot_bench
+"""
+import os
+import random
+import tempfile
+import time
+
+from app.engine.engine import GameEngine
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum
+from app.engine.lobby import Lobby
+from app.models import LobbyUser
+
+GAME_COUNTS = [1_000, 10_000, 100_000]
+
+
+def mid_game(code: str) -> Game:
+    users = {f"{code}_X": LobbyUser(id=f"{code}_X", username="player_x"), f"{code}_O": LobbyUser(id=f"{code}_O", username="player_o")}
+    game = Game(users, code=code)
+    game.status = GameStatusEnum.STARTED
+    game.first_turn = random.randint(0, 1)
+    tiles = random.sample(range(9), random.randint(0, 6))
+    game.moves.extend(tiles)
+    game.seq = game.total_turns = len(tiles)
+    game.turn = (game.first_turn + len(tiles)) % 2
+    game.started_at = int(time.time() * 1000)
+    return game
+
+
+def fill(engine: GameEngine, game_count: int):
+    for i in range(game_count):
+        code = format(i, "010x")
+        engine.games[code] = mid_game(code)
+    # A lobby for every ten games, half of them full
+    for i in range(game_count // 10):
+        code = format(i, "05X")
+        lobby = Lobby(f"{code}_OWNER", code)
+        lobby.users[f"{code}_OWNER"] = LobbyUser(id=f"{code}_OWNER", username="owner")
+        if i % 2 == 0:
+            lobby.users[f"{code}_GUEST"] = LobbyUser(id=f"{code}_GUEST", username="guest")
+        engine.lobbies[code] = lobby
+
+
+def main():
+    print(f"{'games':>8} {'size':>10} {'save':>9} {'restore':>9} {'per game':>9}")
+    for game_count in GAME_COUNTS:
+        engine = GameEngine()
+        fill(engine, game_count)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "snapshot.bin")
+
+            started = time.perf_counter()
+            engine.save_state(path)
+            save_time = time.perf_counter() - started
+            size = os.path.getsize(path)
+
+            restored = GameEngine()
+            started = time.perf_counter()
+            restored.restore_state(path)
+            restore_time = time.perf_counter() - started
+
+        assert len(restored.games) == game_count
+        per_game = (save_time + restore_time) / game_count * 1e6
+        print(f"{game_count:>8} {size / 1e6:>8.2f}MB {save_time * 1000:>7.0f}ms {restore_time * 1000:>7.0f}ms {per_game:>7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Messages and bytes sent per move with the full and delta sync protocols.
+
+Run with: python -m benchmarks.sync_protocol_bench
+"""
+import asyncio
+import json
+
+from app.engine.game import Game
+from app.engine.game_events import GameStatusEnum, SyncProtocolEnum, UserTurnEvent
+from app.models import LobbyUser
+
+# X and O alternate, nobody wins and the ninth move fills the board
+TIE_GAME = [0, 1, 2, 4, 3, 5, 7, 6, 8]
+
+
+class CountingWebSocket():
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_json(self, data):
+        await self.send_text(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+
+    async def send_text(self, text):
+        self.messages += 1
+        self.bytes += len(text.encode("utf-8"))
+
+    async def close(self):
+        pass
+
+
+async def play(protocol: SyncProtocolEnum):
+    users = {"X_ID": LobbyUser(id="X_ID", username="player_x"), "O_ID": LobbyUser(id="O_ID", username="player_o")}
+    game = Game(users)
+    sockets = [CountingWebSocket(), CountingWebSocket()]
+    game.connect_user("X_ID", sockets[0], protocol)
+    game.connect_user("O_ID", sockets[1], protocol)
+    game.status = GameStatusEnum.STARTED
+
+    # Only the last move ends the game, so the RESULT message is left out of the count
+    for tile_ix in TIE_GAME[:-1]:
+        await game.game_loop(game.user_ids[game.turn], UserTurnEvent(data={"tile_index": tile_ix}))
+
+    moves = len(TIE_GAME) - 1
+    return sum(ws.messages for ws in sockets) / moves, sum(ws.bytes for ws in sockets) / moves
+
+
+def main():
+    results = {protocol: asyncio.run(play(protocol)) for protocol in SyncProtocolEnum}
+    for protocol, (messages, size) in results.items():
+        print(f"{protocol.value:>5}: {messages:.1f} messages/move  {size:.0f} bytes/move")
+    full, delta = results[SyncProtocolEnum.FULL], results[SyncProtocolEnum.DELTA]
+    print(f"delta saves {full[0] / delta[0]:.1f}x messages and {full[1] / delta[1]:.1f}x bytes")
+
+
+if __name__ == "__main__":
+    main()